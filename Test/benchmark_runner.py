@@ -0,0 +1,331 @@
+"""
+Parallel, resumable benchmark runner for the tool-calling test suites.
+
+    python benchmark_runner.py --suite travel --target ollama:gemma3:4b --target watsonx:granite
+    python benchmark_runner.py --suite weather --target watsonx:granite --concurrency 8
+
+Cases are streamed from the input CSV and results are appended to the
+output CSV as each one finishes, so the output doubles as the checkpoint:
+rerunning the same command skips every case already in it. Cases that
+raise are not written and get retried on the next run.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+SUITES = {
+    "travel": {
+        "input": "tooltests.csv",
+        "fieldnames": [
+            "case_id", "model", "query", "expected_tools", "tools_called",
+            "status", "time_taken_sec", "response_relevance", "final_response",
+        ],
+    },
+    "weather": {
+        "input": "weather_wiki_test_cases.csv",
+        "fieldnames": [
+            "case_id", "model", "query", "expected_tool", "actual_tool",
+            "status", "time_taken_sec", "final_response",
+        ],
+    },
+}
+# Default in-flight cases per backend: a local Ollama serves OLLAMA_NUM_PARALLEL
+# requests at once, watsonx is remote and rate limited per project.
+DEFAULT_CONCURRENCY = {"ollama": int(os.getenv("OLLAMA_NUM_PARALLEL", "2")), "watsonx": 8}
+
+WATSONX_MODELS = {
+    "granite": "ibm/granite-3-2-8b-instruct",
+    "llama": "meta-llama/llama-3-3-70b-instruct",
+    "mistral": "mistralai/mistral-large",
+}
+
+# -------------------------------
+# TARGETS
+# -------------------------------
+# A target turns a query into {"tools_called": [...], "final_response": str}
+# (travel) or {"actual_tool": str, "final_response": str} (weather). The
+# factories import the bots lazily so one target's setup never costs another.
+
+def _ollama_travel(model: str) -> Callable[[str], Dict[str, Any]]:
+    import ollama
+    import ollama_session
+    import travelbottestollama as bot
+
+    def run(query: str) -> Dict[str, Any]:
+        response = ollama.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": bot.SYSTEM_MSG},
+                {"role": "user", "content": f"[user_id:{bot.USER_ID}] {query}"},
+            ],
+            **ollama_session.request_options(),
+        )
+        content = response["message"]["content"]
+        func_call = bot.parse_function_call(content)
+        if not (func_call and "name" in func_call):
+            return {"tools_called": [], "final_response": content}
+        name = func_call["name"]
+        fn = bot.TOOLS.get(name)
+        try:
+            final = fn(**func_call.get("parameters", {})) if fn else f"Unknown tool requested: {name}"
+        except Exception as e:
+            final = f"Error invoking tool {name}: {e}"
+        return {"tools_called": [name], "final_response": str(final)}
+
+    return run
+
+def _watsonx_travel(model_id: str) -> Callable[[str], Dict[str, Any]]:
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_ibm import ChatWatsonx
+    from langgraph.graph import END, StateGraph
+    import test as bot
+
+    llm_with_tools = ChatWatsonx(
+        model_id=model_id,
+        url=bot.credentials["url"],
+        apikey=bot.credentials["apikey"],
+        project_id=bot.project_id,
+        params=bot.llm.params,
+    ).bind_tools(list(bot.TOOLS.values()))
+
+    def chat(state):
+        return {"messages": state["messages"] + [llm_with_tools.invoke(state["messages"])]}
+
+    graph = StateGraph(bot.GState)
+    graph.add_node("chat", chat)
+    graph.add_node("tools", bot.run_tools)
+    graph.add_conditional_edges("chat", bot.needs_tool, {"need_tool": "tools", "done": END})
+    graph.add_edge("tools", "chat")
+    graph.set_entry_point("chat")
+    assistant = graph.compile()
+
+    def run(query: str) -> Dict[str, Any]:
+        result = assistant.invoke({"messages": [bot.SYSTEM_MSG, HumanMessage(content=query)]})
+        ai_messages = [m for m in result["messages"] if isinstance(m, AIMessage)]
+        # Same rule as test.py, so results stay comparable with earlier runs.
+        with_tools = ai_messages[-2] if len(ai_messages) >= 2 else ai_messages[-1]
+        tools_called = [call["name"] for call in (with_tools.tool_calls or [])]
+        final = ai_messages[-1].content.strip() if ai_messages else ""
+        return {"tools_called": tools_called, "final_response": final}
+
+    return run
+
+def _watsonx_weather(model_id: str) -> Callable[[str], Dict[str, Any]]:
+    from langchain.agents import AgentExecutor
+    from langchain.agents.format_scratchpad import format_log_to_str
+    from langchain.agents.output_parsers import JSONAgentOutputParser
+    from langchain_core.runnables import RunnablePassthrough
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+    from langchain_ibm import ChatWatsonx
+    import weatherbot
+    from run_weather_wiki_tests import extract_tool_name
+    from session_store import SessionStore
+
+    # weatherbot's agent with `model_id` swapped in, so each row is the model it is labelled with.
+    llm = ChatWatsonx(
+        model_id=model_id,
+        url=weatherbot.credentials["url"],
+        apikey=weatherbot.credentials["apikey"],
+        project_id=weatherbot.project_id,
+        params=weatherbot.llm.params,
+    )
+    chain = (
+        RunnablePassthrough.assign(
+            agent_scratchpad=lambda x: format_log_to_str(x["intermediate_steps"]),
+        )
+        | weatherbot.prompt
+        | llm
+        | JSONAgentOutputParser()
+    )
+    agent = RunnableWithMessageHistory(
+        AgentExecutor(agent=chain, tools=weatherbot.tools, handle_parsing_errors=True,
+                      return_intermediate_steps=True),
+        get_session_history=SessionStore().get,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+    )
+
+    def run(query: str) -> Dict[str, Any]:
+        # A fresh session per case: cases must not see each other's history.
+        session_id = "bench-" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        result = agent.invoke(
+            {"input": query},
+            config={"configurable": {"session_id": session_id}},
+        )
+        steps = result.get("intermediate_steps") or []
+        output = result.get("output", "")
+        actual = steps[-1][0].tool if steps else extract_tool_name(output)
+        return {"actual_tool": actual, "final_response": output}
+
+    return run
+
+def make_target(suite: str, target: str) -> Tuple[Callable[[str], Dict[str, Any]], int]:
+    """'ollama:<model>' or 'watsonx:<granite|llama|mistral|model_id>' -> (runner, default concurrency)."""
+    backend, _, model = target.partition(":")
+    if backend == "ollama" and suite == "travel":
+        return _ollama_travel(model), DEFAULT_CONCURRENCY["ollama"]
+    if backend == "watsonx":
+        model_id = WATSONX_MODELS.get(model, model)
+        factory = _watsonx_travel if suite == "travel" else _watsonx_weather
+        return factory(model_id), DEFAULT_CONCURRENCY["watsonx"]
+    raise ValueError(f"Unsupported target '{target}' for suite '{suite}'")
+
+# -------------------------------
+# SCORING
+# -------------------------------
+
+def compute_response_relevance(query: str, response: str) -> float:
+    query_words = set(re.findall(r"\b\w+\b", query.lower()))
+    response_words = set(re.findall(r"\b\w+\b", response.lower()))
+    return round(len(query_words & response_words) / len(query_words), 2) if query_words else 0.0
+
+def _flat(text: str) -> str:
+    return str(text).replace("\n", " ").replace("\r", " ")
+
+def score(suite: str, case: Dict[str, str], outcome: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    if suite == "travel":
+        raw = case["expected_tools"].strip().lower()
+        expected = [] if raw == "none" else [t.strip() for t in raw.split(",")]
+        called = outcome["tools_called"]
+        return {
+            "expected_tools": ", ".join(expected) if expected else "none",
+            "tools_called": ", ".join(called) if called else "none",
+            "status": "PASS" if set(called) == set(expected) else "FAIL",
+            "time_taken_sec": round(elapsed, 3),
+            "response_relevance": compute_response_relevance(case["query"], outcome["final_response"]),
+            "final_response": _flat(outcome["final_response"]),
+        }
+    return {
+        "expected_tool": case["expected_tool"],
+        "actual_tool": outcome["actual_tool"],
+        "status": "PASS" if outcome["actual_tool"] == case["expected_tool"] else "FAIL",
+        "time_taken_sec": round(elapsed, 3),
+        "final_response": _flat(outcome["final_response"]),
+    }
+
+# -------------------------------
+# RUNNER
+# -------------------------------
+
+def case_id(line_no: int, query: str) -> str:
+    # Row number plus query hash, so an edited CSV does not resume into the wrong rows.
+    return f"{line_no}-{hashlib.sha1(query.encode('utf-8')).hexdigest()[:8]}"
+
+def iter_cases(path: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    with open(path, mode="r", encoding="utf-8", newline="") as f:
+        for line_no, row in enumerate(csv.DictReader(f), 1):
+            yield case_id(line_no, row["query"]), row
+
+def completed_cases(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, mode="r", encoding="utf-8", newline="") as f:
+        return {row["case_id"] for row in csv.DictReader(f) if row.get("case_id")}
+
+def output_path_for(suite: str, target: str) -> str:
+    return f"bench_{suite}_{re.sub(r'[^0-9A-Za-z.]+', '_', target)}.csv"
+
+def run_benchmark(
+    suite: str,
+    target: str,
+    input_path: str,
+    output_path: str,
+    concurrency: int = 0,
+    fresh: bool = False,
+    limit: int = 0,
+) -> Dict[str, Any]:
+    runner, default_concurrency = make_target(suite, target)
+    concurrency = concurrency or default_concurrency
+    fieldnames = SUITES[suite]["fieldnames"]
+
+    if fresh and os.path.exists(output_path):
+        os.remove(output_path)
+    done = completed_cases(output_path)
+    if done:
+        print(f"[DEBUG] Resuming {output_path}: {len(done)} cases already done")
+
+    write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    out_file = open(output_path, mode="a", encoding="utf-8", newline="")
+    writer = csv.DictWriter(out_file, fieldnames=fieldnames)
+    if write_header:
+        writer.writeheader()
+    write_lock = threading.Lock()
+    counts = {"ran": 0, "skipped": len(done), "errors": 0, "pass": 0}
+
+    def run_case(cid: str, case: Dict[str, str]) -> None:
+        start = time.perf_counter()
+        try:
+            outcome = runner(case["query"])
+        except Exception as e:
+            print(f"[ERROR] {cid} '{case['query']}': {e}")
+            with write_lock:
+                counts["errors"] += 1
+            return
+        row = {"case_id": cid, "model": target, "query": case["query"],
+               **score(suite, case, outcome, time.perf_counter() - start)}
+        with write_lock:
+            writer.writerow(row)
+            out_file.flush()  # the row is checkpointed as soon as it is written
+            counts["ran"] += 1
+            counts["pass"] += row["status"] == "PASS"
+        print(f"{row['status']} [{cid}] {row['time_taken_sec']}s | {case['query']}")
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+            in_flight = set()
+            submitted = 0
+            for cid, case in iter_cases(input_path):
+                if cid in done:
+                    continue
+                if limit and submitted >= limit:
+                    break
+                # Keep the input streaming: never queue more than 2x the workers.
+                if len(in_flight) >= concurrency * 2:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight.add(pool.submit(run_case, cid, case))
+                submitted += 1
+            wait(in_flight)
+    finally:
+        out_file.close()
+
+    counts["wall_sec"] = round(time.perf_counter() - started, 1)
+    print(f"[DEBUG] {target} on {suite}: {counts} -> {output_path}")
+    return counts
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=sorted(SUITES), default="travel")
+    parser.add_argument("--target", action="append", required=True,
+                        help="ollama:<model> or watsonx:<granite|llama|mistral|model_id>; repeatable")
+    parser.add_argument("--input", help="defaults to the suite's CSV")
+    parser.add_argument("--output", help="defaults to bench_<suite>_<target>.csv (one target only)")
+    parser.add_argument("--concurrency", type=int, default=0, help="0 = the backend's default")
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--limit", type=int, default=0, help="run at most N new cases")
+    args = parser.parse_args()
+
+    if args.output and len(args.target) > 1:
+        parser.error("--output only works with a single --target")
+    for target in args.target:
+        run_benchmark(
+            args.suite,
+            target,
+            args.input or SUITES[args.suite]["input"],
+            args.output or output_path_for(args.suite, target),
+            concurrency=args.concurrency,
+            fresh=args.fresh,
+            limit=args.limit,
+        )
+
+if __name__ == "__main__":
+    main()
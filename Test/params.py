@@ -1,4 +1,5 @@
 import pandas as pd
+from tool_analytics import tool_metrics
 
 # Load the CSV
 df = pd.read_csv("test_results_ollama_gemma_enhanced.csv")
@@ -33,16 +34,8 @@ print("\n=== Avg Relevance per Tool ===")
 print(df.groupby("expected_tools")[["response_relevance", "semantic_relevance"]].mean())
 
 # ========== ADVANCED TOOL PRECISION/RECALL ==========
-def calculate_tool_metrics(row):
-    expected = set(row["expected_tools"].split(", ")) if row["expected_tools"] != "none" else set()
-    called = set(row["tools_called"].split(", ")) if row["tools_called"] != "none" else set()
-    correct = expected & called
-    precision = len(correct) / len(called) if called else 1.0  # If nothing was called, consider precision = 1
-    recall = len(correct) / len(expected) if expected else 1.0  # If nothing expected, recall = 1
-    return pd.Series([precision, recall])
-
-df[["tool_precision", "tool_recall"]] = df.apply(calculate_tool_metrics, axis=1)
-df["tool_f1"] = 2 * (df["tool_precision"] * df["tool_recall"]) / (df["tool_precision"] + df["tool_recall"] + 1e-9)
+# Vectorized; tool_analytics.py reports the same across every result file at once.
+df[["tool_precision", "tool_recall", "tool_f1"]] = tool_metrics(df)
 
 print("\n=== Average Tool Precision/Recall/F1 ===")
 print(f"Precision: {df['tool_precision'].mean():.2f}")
@@ -0,0 +1,158 @@
+"""
+Batched, cached semantic_relevance scoring for benchmark result CSVs.
+
+    python semantic_scoring.py                       # every CSV in "Test INtermediate Result/"
+    python semantic_scoring.py results.csv --out-dir scored/
+    python semantic_scoring.py results.csv --in-place
+
+Scored copies are written next to each input as <name>_enhanced.csv unless
+--out-dir or --in-place says otherwise.
+
+Every query and final_response across all files is embedded once, in large
+batches; embeddings are cached on disk by text hash, so rescoring a file (or
+a new model's results over the same queries) only encodes the new text.
+"""
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+MODEL_NAME = "all-MiniLM-L6-v2"
+RESULTS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Test INtermediate Result"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "128"))
+SQLITE_MAX_VARS = 900  # stay under SQLite's bound-parameter limit
+ENHANCED_SUFFIX = "_enhanced"
+
+
+def text_key(model_name: str, text: str) -> str:
+    return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Normalized float32 embeddings in SQLite, keyed by sha1(model name + text)."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, model_name: str = MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self.counters = {"cached": 0, "encoded": 0}
+
+    def _load(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for i in range(0, len(keys), SQLITE_MAX_VARS):
+            chunk = keys[i:i + SQLITE_MAX_VARS]
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update((k, np.frombuffer(v, dtype=np.float32)) for k, v in rows)
+        return found
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self._model is None:
+            # Imported here so a fully cached run never loads torch.
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(
+            texts,
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=len(texts) > ENCODE_BATCH_SIZE,
+        ).astype(np.float32)
+
+    def embed(self, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """text -> unit vector for every distinct text, encoding only the ones not cached."""
+        unique = list(dict.fromkeys(texts))
+        keys = {t: text_key(self.model_name, t) for t in unique}
+        cached = self._load(list(keys.values()))
+        missing = [t for t in unique if keys[t] not in cached]
+        self.counters["cached"] += len(unique) - len(missing)
+        self.counters["encoded"] += len(missing)
+        if missing:
+            vectors = self._encode(missing)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(keys[t], v.tobytes()) for t, v in zip(missing, vectors)],
+            )
+            self._db.commit()
+            cached.update((keys[t], v) for t, v in zip(missing, vectors))
+        return {t: cached[keys[t]] for t in unique}
+
+
+def _texts(df: pd.DataFrame, column: str) -> List[str]:
+    return df[column].fillna("").astype(str).tolist()
+
+def scorable(df: pd.DataFrame) -> bool:
+    return {"query", "final_response"} <= set(df.columns)
+
+def score_frames(frames: Dict[str, pd.DataFrame], cache: EmbeddingCache) -> None:
+    """Add/overwrite semantic_relevance on every frame, with one embedding pass for all of them."""
+    every_text = [t for df in frames.values() for col in ("query", "final_response") for t in _texts(df, col)]
+    vectors = cache.embed(every_text)
+    for df in frames.values():
+        queries = np.stack([vectors[t] for t in _texts(df, "query")]) if len(df) else np.zeros((0, 1))
+        responses = np.stack([vectors[t] for t in _texts(df, "final_response")]) if len(df) else np.zeros((0, 1))
+        # Unit vectors, so the row-wise dot product is the cosine similarity.
+        df["semantic_relevance"] = np.einsum("ij,ij->i", queries, responses)
+
+def output_path(path: str, out_dir: Optional[str] = None, in_place: bool = False) -> str:
+    if in_place:
+        return path
+    if out_dir:
+        return os.path.join(out_dir, os.path.basename(path))
+    stem, ext = os.path.splitext(path)
+    return f"{stem}{ENHANCED_SUFFIX}{ext}"
+
+def score_files(paths: List[str], out_dir: Optional[str] = None, cache: Optional[EmbeddingCache] = None,
+                in_place: bool = False) -> Dict[str, int]:
+    cache = cache or EmbeddingCache()
+    frames = {}
+    for path in paths:
+        try:
+            df = pd.read_csv(path)
+        except pd.errors.EmptyDataError:
+            print(f"[DEBUG] Skipping empty file {path}")
+            continue
+        if scorable(df):
+            frames[path] = df
+        else:
+            print(f"[DEBUG] Skipping {path}: no query/final_response columns")
+    score_frames(frames, cache)
+
+    for path, df in frames.items():
+        target = output_path(path, out_dir, in_place)
+        df.to_csv(target, index=False)
+        print(f"Scored {len(df)} rows -> {target} (mean {df['semantic_relevance'].mean():.3f})")
+    print(f"[DEBUG] embeddings: {cache.counters}")
+    return {path: len(df) for path, df in frames.items()}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="CSV files; defaults to every CSV in the results folder")
+    parser.add_argument("--out-dir", help="write scored copies here, under their original names")
+    parser.add_argument("--in-place", action="store_true", help="overwrite the input files instead")
+    args = parser.parse_args()
+    if args.in_place and args.out_dir:
+        parser.error("--in-place and --out-dir are mutually exclusive")
+
+    # Earlier scored copies in the folder are outputs, not inputs.
+    paths = args.paths or sorted(
+        p for p in glob.glob(os.path.join(RESULTS_DIR, "*.csv"))
+        if not os.path.splitext(p)[0].endswith(ENHANCED_SUFFIX)
+    )
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    score_files(paths, args.out_dir, in_place=args.in_place)
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,14 @@ from langgraph.prebuilt import tools_condition
 from langchain_ibm import ChatWatsonx
 from ibm_watson_machine_learning.metanames import GenTextParamsMetaNames as GenParams
 from dotenv import load_dotenv
+import mongo_pool
+import city_index
+import http_client
+import cassette
+import tool_runner
+import tool_projection
 load_dotenv()
+cassette.install()  # no-op unless CASSETTE_MODE is set
 
 # ===== MODEL SETUP =====
 credentials = {
@@ -54,18 +61,14 @@ class HotelsInput(BaseModel):
     rooms: Optional[int] = 1
 
 def _call_serpapi(payload: Dict[str, Any]) -> Dict[str, Any]:
-    r = requests.get(SERPER_ENDPOINT, params=payload, timeout=20)
-    r.raise_for_status()
-    return r.json()
+    return http_client.get_json(SERPER_ENDPOINT, endpoint="serpapi", params=payload)
 
 CITIES_JSON = "cities.json"
 
-@lru_cache(maxsize=1)
-def _load_cities() -> dict[str, str]:
-    """Load once and memoise."""
+def _city_index() -> city_index.CityIndex:
+    """Built once and memoised by city_index.get_index."""
     try:
-        with open(CITIES_JSON, "r", encoding="utf-8") as f:
-            return {k.title(): v for k, v in json.load(f).items()}
+        return city_index.get_index(CITIES_JSON)
     except FileNotFoundError:
         raise RuntimeError(f"{CITIES_JSON} not found")
     except json.JSONDecodeError as e:
@@ -73,10 +76,10 @@ def _load_cities() -> dict[str, str]:
 
 def get_city_acronym(city_name: str) -> str:
     """
-    Return IATA code for a given city name (case-insensitive).
-    Example: 'Bengaluru' -> 'BLR'
+    Return IATA code for a given city name, alias or near-miss spelling.
+    Example: 'Bengaluru', 'Bangalore', 'bengalure' -> 'BLR'
     """
-    return _load_cities().get(city_name.title(), "UNK")
+    return _city_index().resolve(city_name)
 
 @tool
 def city_code(city_name: str) -> str:
@@ -93,9 +96,8 @@ def get_user_flight_bookings(user_id: str) -> list[dict]:
     """
     print(user_id)
     try:
-        import pymongo
-        client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-        db = client["test"]
+        from bson import ObjectId
+        db = mongo_pool.get_db()
         user_obj_id = ObjectId(user_id)
         bookings = list(db.flightbookings.find({"user": user_obj_id}))
         print("Bookings found:", bookings)
@@ -121,13 +123,11 @@ def create_flight_booking(
     Save a new flight booking into the MongoDB database.
     """
     try:
-        import pymongo
         from bson import ObjectId
         journey_date = datetime.strptime(dateOfJourney, "%Y-%m-%d")
         if journey_date.date() < datetime.now(UTC).date():
             raise ValueError("Date of journey cannot be in the past.")
-        client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-        db = client["test"]
+        db = mongo_pool.get_db()
 
         booking_doc = {
             "user": ObjectId(user_id),
@@ -172,7 +172,7 @@ def flights_finder(departure_airport: str, arrival_airport: str, outbound_date:
         "type": "2" if return_date is None else "3",
     }
     try:
-        r = requests.get(SERPER_ENDPOINT, params=payload, timeout=20)
+        r = http_client.get(SERPER_ENDPOINT, endpoint="serpapi", params=payload)
         r.raise_for_status()
         return r.json().get("best_flights", [])[:5]
     except Exception as e:
@@ -194,7 +194,7 @@ def hotels_finder(q: str, check_in_date: str, check_out_date: str, adults: int =
         "currency": "INR",
     }
     try:
-        r = requests.get(SERPER_ENDPOINT, params=payload, timeout=20)
+        r = http_client.get(SERPER_ENDPOINT, endpoint="serpapi", params=payload)
         r.raise_for_status()
         return r.json().get("properties", [])[:5]
     except Exception as e:
@@ -224,14 +224,14 @@ def run_tools(state: GState) -> GState:
     ai_msg = msgs[-1]
     new = msgs.copy()
 
-    for call in ai_msg.tool_calls or []:
-        name = call["name"]
-        args = call["args"]
-        call_id = call["id"]
-        print(f"Running tool: {name} with args: {args}")
-        fn = TOOLS.get(name)
-        result = fn.invoke(args) if fn else {"error": f"unknown tool {name}"}
-        new.append(ToolMessage(name=name, tool_call_id=call_id, content=json.dumps(result, ensure_ascii=False)))
+    calls = ai_msg.tool_calls or []
+    for call in calls:
+        print(f"Running tool: {call['name']} with args: {call['args']}")
+    results = tool_runner.run_tool_calls(calls, TOOLS)
+    for call, result in zip(calls, results):
+        # Same token-budgeted view of the result that travelbot feeds its LLM.
+        content = tool_projection.project(call["name"], result).content
+        new.append(ToolMessage(name=call["name"], tool_call_id=call["id"], content=content, artifact=result))
 
     return {"messages": new}
 
@@ -0,0 +1,153 @@
+"""
+Vectorized tool-calling analytics across benchmark result files.
+
+    python tool_analytics.py                         # every results CSV in "Test INtermediate Result/"
+    python tool_analytics.py a.csv b.csv --out summary.csv
+
+expected_tools / tools_called are parsed once into boolean multi-hot
+matrices (only the distinct strings are split; rows just index into them),
+so precision/recall/F1, per-tool confusion and latency percentiles are plain
+array and groupby operations however many rows there are.
+"""
+import argparse
+import glob
+import os
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from semantic_scoring import RESULTS_DIR
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Spellings of "no tool" across the result files.
+NO_TOOL = {"", "none", "final answer"}
+PERCENTILES = [0.5, 0.9, 0.95, 0.99]
+
+
+def multi_hot(expected: pd.Series, called: pd.Series) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """(E, C, tools): boolean row x tool matrices over one shared tool vocabulary."""
+    exp_codes, exp_uniques = pd.factorize(expected.fillna("none").astype(str).str.lower(), sort=True)
+    call_codes, call_uniques = pd.factorize(called.fillna("none").astype(str).str.lower(), sort=True)
+
+    def parse(value: str) -> List[str]:
+        return [t.strip() for t in value.split(",") if t.strip() not in NO_TOOL]
+
+    exp_sets = [parse(v) for v in exp_uniques]
+    call_sets = [parse(v) for v in call_uniques]
+    tools = sorted({t for s in exp_sets + call_sets for t in s})
+    index = {t: i for i, t in enumerate(tools)}
+
+    def table(sets: List[List[str]]) -> np.ndarray:
+        m = np.zeros((len(sets), len(tools)), dtype=bool)
+        for row, names in enumerate(sets):
+            m[row, [index[t] for t in names]] = True
+        return m
+
+    # One small table per distinct string, then a single gather for every row.
+    return table(exp_sets)[exp_codes], table(call_sets)[call_codes], tools
+
+def tool_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """tool_precision / tool_recall / tool_f1 per row, same definitions as params.py."""
+    E, C, _ = multi_hot(df["expected_tools"], df["tools_called"])
+    correct = (E & C).sum(axis=1)
+    n_called = C.sum(axis=1)
+    n_expected = E.sum(axis=1)
+    # Nothing called -> precision 1; nothing expected -> recall 1.
+    precision = np.divide(correct, n_called, out=np.ones(len(df)), where=n_called > 0)
+    recall = np.divide(correct, n_expected, out=np.ones(len(df)), where=n_expected > 0)
+    f1 = 2 * precision * recall / (precision + recall + 1e-9)
+    return pd.DataFrame({"tool_precision": precision, "tool_recall": recall, "tool_f1": f1}, index=df.index)
+
+def per_tool_confusion(df: pd.DataFrame) -> pd.DataFrame:
+    """TP/FP/FN/TN and precision/recall for each (model, tool)."""
+    E, C, tools = multi_hot(df["expected_tools"], df["tools_called"])
+    parts = {
+        "tp": E & C,
+        "fp": ~E & C,
+        "fn": E & ~C,
+        "tn": ~E & ~C,
+    }
+    frames = []
+    for name, m in parts.items():
+        counts = pd.DataFrame(m, columns=tools, index=df.index).groupby(df["model"], observed=True).sum()
+        frames.append(counts.stack().rename(name))
+    out = pd.concat(frames, axis=1)
+    out.index.names = ["model", "tool"]
+    out["precision"] = out["tp"] / (out["tp"] + out["fp"]).replace(0, np.nan)
+    out["recall"] = out["tp"] / (out["tp"] + out["fn"]).replace(0, np.nan)
+    return out
+
+def latency_percentiles(df: pd.DataFrame, by: str = "model") -> pd.DataFrame:
+    return df.groupby(by, observed=True)["time_taken_sec"].quantile(PERCENTILES).unstack().rename(
+        columns=lambda q: f"p{int(q * 100)}"
+    )
+
+def summary(df: pd.DataFrame) -> pd.DataFrame:
+    grouped = df.groupby("model", observed=True)
+    out = grouped[["tool_precision", "tool_recall", "tool_f1", "time_taken_sec"]].mean()
+    out["rows"] = grouped.size()
+    out["pass_rate"] = grouped["status"].apply(lambda s: (s == "PASS").mean())
+    return out.join(latency_percentiles(df))
+
+# -------------------------------
+# LOADING
+# -------------------------------
+
+def load_results(paths: List[str]) -> pd.DataFrame:
+    """
+    Concatenate result files into one frame with a model column (from the
+    file, or the file name) and the travel column names; weather files'
+    expected_tool/actual_tool are renamed to match.
+    """
+    frames = []
+    for path in paths:
+        try:
+            df = pd.read_csv(path)
+        except pd.errors.EmptyDataError:
+            continue
+        df = df.rename(columns={"expected_tool": "expected_tools", "actual_tool": "tools_called"})
+        if not {"expected_tools", "tools_called"} <= set(df.columns):
+            continue
+        if "model" not in df.columns:
+            df["model"] = os.path.splitext(os.path.basename(path))[0]
+        frames.append(df[[c for c in df.columns if c in {
+            "model", "query", "expected_tools", "tools_called", "status", "time_taken_sec",
+        }]])
+    if not frames:
+        raise ValueError("No result files with expected/called tool columns")
+    df = pd.concat(frames, ignore_index=True)
+    df["model"] = df["model"].astype("category")
+    return df
+
+def analyze(paths: List[str]) -> pd.DataFrame:
+    df = load_results(paths)
+    df = df.join(tool_metrics(df))
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 20)
+    print(f"\n=== Summary ({len(df)} rows, {df['model'].nunique()} result sets) ===")
+    report = summary(df)
+    print(report.round(3))
+
+    print("\n=== Per Tool Confusion ===")
+    print(per_tool_confusion(df).round(3))
+
+    print("\n=== Latency Percentiles per Expected Tool (sec) ===")
+    print(latency_percentiles(df, by="expected_tools").round(2))
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="result CSVs; defaults to every CSV in the results folder")
+    parser.add_argument("--out", help="write the per-model summary to this CSV")
+    args = parser.parse_args()
+
+    report = analyze(args.paths or sorted(glob.glob(os.path.join(RESULTS_DIR, "*.csv"))))
+    if args.out:
+        report.to_csv(args.out)
+
+if __name__ == "__main__":
+    main()
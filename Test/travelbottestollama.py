@@ -1,12 +1,8 @@
 import csv
 import re
-import json
 import os
-import requests
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, List
-from functools import lru_cache
-import pymongo
 from bson import ObjectId
 import ollama
 from dotenv import load_dotenv
@@ -15,8 +11,15 @@ import jwt
 import websocket
 import threading
 from datetime import datetime
+import mongo_pool
+import city_index
+import http_client
+import cassette
+import ollama_session
+import tool_calls
 
 load_dotenv()
+cassette.install()  # no-op unless CASSETTE_MODE is set
 
 # -------------------------------
 # CONFIG
@@ -36,28 +39,23 @@ print(f"[DEBUG] MONGO_URI: {MONGO_URI}")
 # TOOL FUNCTIONS
 # -------------------------------
 
-@lru_cache(maxsize=1)
-def _load_cities() -> dict[str, str]:
+def _city_index() -> city_index.CityIndex:
     try:
-        print("[DEBUG] Loading cities from file...")
-        with open(CITIES_JSON, "r", encoding="utf-8") as f:
-            cities = {k.title(): v for k, v in json.load(f).items()}
-        print(f"[DEBUG] Loaded {len(cities)} cities")
-        return cities
+        return city_index.get_index(CITIES_JSON)
     except Exception as e:
         print(f"[ERROR] Failed to load cities: {e}")
         raise RuntimeError(f"City data error: {e}")
 
 def city_code(city_name: str) -> str:
-    code = _load_cities().get(city_name.title(), "UNK")
+    # Aliases ("Bangalore", "NYC") and typos resolve here instead of costing another LLM round trip.
+    code = _city_index().resolve(city_name)
     print(f"[DEBUG] city_code('{city_name}') -> '{code}'")
     return code
 
 def get_user_flight_bookings(user_id: str) -> list[dict]:
     try:
         print(f"[DEBUG] Fetching flight bookings for user_id={user_id}")
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client["test"]
+        db = mongo_pool.get_db()
         bookings = list(db.flightbookings.find({"user": ObjectId(user_id)}))
         print(f"[DEBUG] Found {len(bookings)} bookings")
         serialized = [serialize_booking(b) for b in bookings]
@@ -89,7 +87,7 @@ def flights_finder(departure_airport, arrival_airport, outbound_date, return_dat
     print(f"[DEBUG] flights_finder params: {params}")
 
     try:
-        res = requests.get(SERPER_ENDPOINT, params=params, timeout=15)
+        res = http_client.get(SERPER_ENDPOINT, endpoint="serpapi", params=params)
         print(f"[DEBUG] flights_finder HTTP status: {res.status_code}")
         res.raise_for_status()
         data = res.json()
@@ -150,7 +148,7 @@ def hotels_finder(q, check_in_date, check_out_date, adults=1, rooms=1) -> str:
     print(f"[DEBUG] hotels_finder params: {params}")
 
     try:
-        res = requests.get(SERPER_ENDPOINT, params=params, timeout=15)
+        res = http_client.get(SERPER_ENDPOINT, endpoint="serpapi", params=params)
         print(f"[DEBUG] hotels_finder HTTP status: {res.status_code}")
         res.raise_for_status()
         data = res.json()
@@ -231,8 +229,7 @@ def create_flight_booking(user_id, name, from_city, to_city, airline, flightno,
             print(f"[ERROR] {error_msg}")
             raise ValueError(error_msg)
 
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client["test"]
+        db = mongo_pool.get_db()
         doc = {
             "user": ObjectId(user_id),
             "name": name,
@@ -274,20 +271,20 @@ TOOLS = {
 # JSON PARSER
 # -------------------------------
 
+def parse_function_calls(text: str) -> List[Dict[str, Any]]:
+    """Every tool call object in the reply, in order, with arguments repaired like gemma.py does."""
+    print(f"[DEBUG] parse_function_calls input text: {text}")
+    scanner = tool_calls.ToolCallStream(TOOLS, defaults={"user_id": USER_ID})
+    scanner.feed(text)
+    reply = scanner.close()
+    if reply.error:
+        print(f"[ERROR] Tool call rejected: {reply.error}")
+    print(f"[DEBUG] Parsed function calls: {scanner.calls}")
+    return scanner.calls
+
 def parse_function_call(text: str) -> Optional[Dict[str, Any]]:
-    print(f"[DEBUG] parse_function_call input text: {text}")
-    try:
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start == -1 or end == 0:
-            print("[DEBUG] No JSON found in text")
-            return None
-        parsed = json.loads(text[start:end])
-        print(f"[DEBUG] Parsed function call JSON: {parsed}")
-        return parsed
-    except Exception as e:
-        print(f"[ERROR] JSON parse error: {e}")
-        return None
+    calls = parse_function_calls(text)
+    return calls[0] if calls else None
 
 # -------------------------------
 # SYSTEM MESSAGE
@@ -395,7 +392,9 @@ def test_travel_assistant_from_csv(filepath="tooltests.csv", output_filepath="te
         messages=[
             {"role": "system", "content": SYSTEM_MSG},
             {"role": "user", "content": f"[user_id:{USER_ID}] What is today's date?"}
-        ]
+        ],
+        # Also loads the model; every query below shares its cached SYSTEM_MSG prefix.
+        **ollama_session.request_options(),
     )
     content = response["message"]["content"]
     print(f"Model response for today's date: {content}")
@@ -404,7 +403,8 @@ def test_travel_assistant_from_csv(filepath="tooltests.csv", output_filepath="te
     with open(output_filepath, mode="w", encoding="utf-8", newline="") as out_file:
         fieldnames = [
             "query", "expected_tools", "tools_called",
-            "status", "time_taken_sec", "response_relevance", "final_response"
+            "status", "time_taken_sec", "response_relevance", "final_response",
+            "prompt_eval_count", "prompt_eval_ms", "eval_ms",
         ]
         writer = csv.DictWriter(out_file, fieldnames=fieldnames)
         writer.writeheader()
@@ -422,25 +422,25 @@ def test_travel_assistant_from_csv(filepath="tooltests.csv", output_filepath="te
                 messages=[
                     {"role": "system", "content": SYSTEM_MSG},
                     {"role": "user", "content": f"[user_id:{USER_ID}] {query}"}
-                ]
+                ],
+                **ollama_session.request_options(),
             )
             end_time = time.time()
+            timings = ollama_session.timings(response)
             content = response["message"]["content"]
             time_taken = round(end_time - start_time, 3)
 
-            func_call = parse_function_call(content)
-            tools_called = [func_call["name"]] if func_call and "name" in func_call else []
+            calls = parse_function_calls(content)
+            tools_called = [call["name"] for call in calls]
 
-            if func_call and "name" in func_call and "parameters" in func_call:
-                tool_name = func_call["name"]
-                params = func_call["parameters"]
-                if tool_name in TOOLS:
+            if calls:
+                responses = []
+                for call in calls:
                     try:
-                        final_response = TOOLS[tool_name](**params)
+                        responses.append(str(TOOLS[call["name"]](**call["parameters"])))
                     except Exception as e:
-                        final_response = f"Error invoking tool {tool_name}: {e}"
-                else:
-                    final_response = f"Unknown tool requested: {tool_name}"
+                        responses.append(f"Error invoking tool {call['name']}: {e}")
+                final_response = "\n".join(responses)
             else:
                 final_response = content
 
@@ -454,10 +454,14 @@ def test_travel_assistant_from_csv(filepath="tooltests.csv", output_filepath="te
                 "status": status,
                 "time_taken_sec": time_taken,
                 "response_relevance": relevance,
-                "final_response": str(final_response).replace("\n", " ").replace("\r", " ")
+                "final_response": str(final_response).replace("\n", " ").replace("\r", " "),
+                "prompt_eval_count": timings["prompt_eval_count"],
+                "prompt_eval_ms": timings["prompt_eval_ms"],
+                "eval_ms": timings["eval_ms"],
             })
 
             print(f"✅ Result: {status} | Tools: {tools_called} | Relevance: {relevance}")
 
 if __name__ == "__main__":
+    mongo_pool.warm_up()
     test_travel_assistant_from_csv()
@@ -1,12 +1,7 @@
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+from semantic_scoring import EmbeddingCache, score_frames
 
 df = pd.read_csv("test_results_ollama_gemma.csv")
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-def get_similarity(q, r):
-    return util.cos_sim(model.encode(q, convert_to_tensor=True),
-                        model.encode(r, convert_to_tensor=True)).item()
-
-df["semantic_relevance"] = df.apply(lambda row: get_similarity(row["query"], row["final_response"]), axis=1)
+# Batched and cached; see semantic_scoring.py to score every results CSV at once.
+score_frames({"test_results_ollama_gemma.csv": df}, EmbeddingCache())
 df.to_csv("test_results_ollama_gemma_enhanced.csv", index=False)
@@ -319,6 +319,24 @@ wss.on('connection',(connection, req) => {
             // Defensive checks
             if (!connection.userId || !text) return;
 
+            // Streaming preview of a bot reply: relay only. The final frame with the
+            // same stream_id is the one that gets saved.
+            if (messageData.type === "partial") {
+                if (!recipient) return;
+                Array.from(wss.clients)
+                    .filter(c => c.userId === recipient)
+                    .forEach(c =>
+                        c.send(JSON.stringify({
+                            text,
+                            sender: connection.userId,
+                            recipient,
+                            type: 'partial',
+                            stream_id: messageData.stream_id
+                        }))
+                    );
+                return;
+            }
+
             if (recipient) {
                 const messageDoc = await Message.create({
                     sender: new mongoose.Types.ObjectId(connection.userId),
@@ -340,6 +358,7 @@ wss.on('connection',(connection, req) => {
                             sender: connection.userId,
                             recipient,
                             _id: messageDoc._id,
+                            stream_id: messageData.stream_id,
                             type: isFlightBookingMessage(text) ? 'flight_booking' : isFlightMessage(text) ? 'flight' : isHotelMessage(text)
                                 ? 'hotel'
                                 : 'text'
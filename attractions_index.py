@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import cassette
+import city_index
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+ATTRACTIONS_INDEX_PATH = os.getenv("ATTRACTIONS_INDEX_PATH", "attractions_index.sqlite3")
+# Wikipedia pages indexed per city (its own page, "Tourism in ...", then search hits).
+ATTRACTIONS_PAGES_PER_CITY = int(os.getenv("ATTRACTIONS_PAGES_PER_CITY", "8"))
+# A build only re-fetches cities indexed longer ago than this.
+ATTRACTIONS_MAX_AGE_DAYS = float(os.getenv("ATTRACTIONS_MAX_AGE_DAYS", "30"))
+CITIES_JSON = "cities.json"
+# Words that say what kind of answer is wanted but not what it is about.
+QUERY_STOPWORDS = {
+    "a", "an", "and", "are", "at", "attraction", "attractions", "best", "famous", "for", "in", "is",
+    "near", "of", "places", "see", "sights", "sightseeing", "the", "things", "to", "top", "tourist",
+    "visit", "what", "where", "which",
+}
+LATENCY_WINDOW = 1000  # recent queries kept for the percentiles
+
+Page = Tuple[str, str]  # (title, summary)
+
+
+def fetch_pages(city: str, limit: int = ATTRACTIONS_PAGES_PER_CITY) -> List[Page]:
+    """Summaries of the Wikipedia pages about `city` and its sights; recorded/replayed by the cassette."""
+    import wikipedia
+
+    def summary(title: str) -> Optional[str]:
+        try:
+            return cassette.CASSETTE.call(
+                "wikipedia.summary", {"title": title},
+                lambda: wikipedia.summary(title, auto_suggest=False),
+            )
+        except (wikipedia.exceptions.PageError, wikipedia.exceptions.DisambiguationError):
+            return None
+
+    hits = cassette.CASSETTE.call(
+        "wikipedia.search", {"query": f"{city} tourist attractions", "results": limit},
+        lambda: wikipedia.search(f"{city} tourist attractions", results=limit),
+    )
+    pages = []
+    for title in dict.fromkeys([city, f"Tourism in {city}", *hits]):
+        text = summary(title)
+        if text:
+            pages.append((title, text))
+        if len(pages) >= limit:
+            break
+    return pages
+
+def fts_query(words: List[str], op: str = "OR") -> str:
+    # Every word quoted so FTS5 operators and punctuation in user text are inert.
+    return f" {op} ".join('"' + w.replace('"', '""') + '"' for w in words)
+
+
+def find_city(words: List[str], max_words: int = 3) -> Tuple[Optional[str], List[str]]:
+    """
+    (city from cities.json named in `words`, the other words); the longest
+    exact name/alias wins, then the rightmost ("in Paris" ends the question).
+    Airport codes do not count: "can", "man", "mad" and "sin" are words too.
+    """
+    index = city_index.get_index(CITIES_JSON)
+    for n in range(min(max_words, len(words)), 0, -1):
+        for i in range(len(words) - n, -1, -1):
+            match = index.lookup(" ".join(words[i:i + n]), limit=1)
+            if match and match[0].score == 1.0 and match[0].matched != city_index.normalize(match[0].code):
+                return match[0].city, words[:i] + words[i + n:]
+    return None, words
+
+
+class AttractionsIndex:
+    """
+    SQLite FTS5 index of Wikipedia summaries for every city in cities.json.
+    Built ahead of time (`python attractions_index.py`); queries are
+    answered locally, ranked by bm25 and scoped to the city they mention.
+    """
+
+    def __init__(self, path: str = ATTRACTIONS_INDEX_PATH):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(city, title, summary, tokenize = 'porter unicode61')")
+        self._db.execute("CREATE TABLE IF NOT EXISTS indexed_cities (city TEXT PRIMARY KEY, pages INTEGER, fetched_at REAL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._latencies_ms: deque = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"hits": 0, "misses": 0}
+
+    # -------------------------------
+    # BUILD
+    # -------------------------------
+
+    def stale_cities(self, cities: List[str], max_age_days: float = ATTRACTIONS_MAX_AGE_DAYS) -> List[str]:
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            fresh = {row[0] for row in self._db.execute(
+                "SELECT city FROM indexed_cities WHERE fetched_at >= ?", (cutoff,)
+            )}
+        return [c for c in cities if c not in fresh]
+
+    def replace_city(self, city: str, pages: List[Page]) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM pages WHERE city = ?", (city,))
+            self._db.executemany(
+                "INSERT INTO pages (city, title, summary) VALUES (?, ?, ?)",
+                [(city, title, text) for title, text in pages],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO indexed_cities (city, pages, fetched_at) VALUES (?, ?, ?)",
+                (city, len(pages), time.time()),
+            )
+
+    def build(self, cities_path: str = CITIES_JSON, max_age_days: float = ATTRACTIONS_MAX_AGE_DAYS) -> int:
+        """
+        (Re)fetch every city that is missing or older than `max_age_days`.
+        Each city is committed on its own, so an interrupted build resumes
+        where it stopped. Returns the number of cities fetched.
+        """
+        with open(cities_path, "r", encoding="utf-8") as f:
+            cities = list(json.load(f))
+        todo = self.stale_cities(cities, max_age_days)
+        print(f"[DEBUG] Attractions index: {len(cities) - len(todo)} cities fresh, {len(todo)} to fetch")
+        done = 0
+        for city in todo:
+            try:
+                pages = fetch_pages(city)
+            except Exception as e:
+                print(f"[ERROR] Fetching attractions for {city} failed: {e}")
+                continue
+            self.replace_city(city, pages)
+            done += 1
+            print(f"[DEBUG] Indexed {len(pages)} pages for {city}")
+        return done
+
+    # -------------------------------
+    # QUERY
+    # -------------------------------
+
+    def search(self, query: str, limit: int = 4) -> List[Dict[str, str]]:
+        """Best matching pages for `query`; empty when the index has nothing relevant."""
+        start = time.perf_counter()
+        words = [w for w in city_index.normalize(query).split() if w not in QUERY_STOPWORDS]
+        # The city name matches every page of that city, so it scopes the search and the rest ranks it.
+        city, words = find_city(words)
+
+        with self._lock:
+            if city and words:
+                sql = "SELECT city, title, summary FROM pages WHERE pages MATCH ? AND city = ? ORDER BY rank LIMIT ?"
+                rows = self._db.execute(sql, (fts_query(words), city, limit)).fetchall()
+                if not rows:
+                    # Nothing about those words; the city's own pages are still the best answer.
+                    words = []
+            if city and not words:
+                rows = self._db.execute(
+                    "SELECT city, title, summary FROM pages WHERE city = ? ORDER BY rowid LIMIT ?", (city, limit)
+                ).fetchall()
+            elif not city:
+                # No city to scope by: every word must appear, or "who was Albert
+                # Einstein" matches any page with "was" and stops the Wikipedia fallback.
+                rows = self._db.execute(
+                    "SELECT city, title, summary FROM pages WHERE pages MATCH ? ORDER BY rank LIMIT ?",
+                    (fts_query(words, "AND"), limit),
+                ).fetchall() if words else []
+            self._latencies_ms.append((time.perf_counter() - start) * 1000)
+            self.counters["hits" if rows else "misses"] += 1
+        return [{"city": c, "title": t, "summary": s} for c, t, s in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            cities, pages = self._db.execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM indexed_cities").fetchone()
+
+        def pct(q: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else 0.0
+
+        return {**self.counters, "cities": cities, "pages": pages, "p50_ms": pct(0.5), "p95_ms": pct(0.95)}
+
+
+def render(pages: List[Dict[str, str]], chars_max: int) -> str:
+    """Same layout and truncation as WikipediaAPIWrapper.run, so the agent sees no difference."""
+    return "\n\n".join(f"Page: {p['title']}\nSummary: {p['summary']}" for p in pages)[:chars_max]
+
+
+_index: Optional[AttractionsIndex] = None
+_index_lock = threading.Lock()
+
+def get_index() -> AttractionsIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AttractionsIndex()
+    return _index
+
+def search(query: str, limit: int = 4) -> List[Dict[str, str]]:
+    return get_index().search(query, limit)
+
+def stats() -> Dict[str, Any]:
+    return get_index().stats()
+
+if __name__ == "__main__":
+    # python attractions_index.py [--max-age-days N]: build/refresh before deploying
+    parser = argparse.ArgumentParser(description="Build or refresh the local attractions index.")
+    parser.add_argument("--cities", default=CITIES_JSON)
+    parser.add_argument("--max-age-days", type=float, default=ATTRACTIONS_MAX_AGE_DAYS,
+                        help="re-fetch cities indexed longer ago than this (0 = everything)")
+    args = parser.parse_args()
+    get_index().build(args.cities, args.max_age_days)
+    print(f"[DEBUG] {stats()}")
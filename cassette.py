@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# off:    every call goes to the real service (default)
+# record: real calls, responses saved to the cassette
+# replay: answered from the cassette only; a missing entry raises CassetteMiss
+# auto:   replay what is recorded, record the rest
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes.sqlite3")
+# Latency added to replayed calls:
+#   none | recorded | fixed:<ms> | normal:<mean_ms>:<stddev_ms> | lognormal:<median_ms>:<sigma>
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "none")
+# Seeds the injected latency, so two replays of the same suite sleep the same amounts.
+CASSETTE_SEED = os.getenv("CASSETTE_SEED", "0")
+# Never part of a key, so recordings are shareable and keys survive key rotation.
+SECRET_FIELDS = {"api_key", "apikey", "key", "token"}
+
+
+class CassetteMiss(LookupError):
+    """Replay mode was asked for a call that was never recorded."""
+
+
+def _scrub(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _scrub(v) for k, v in value.items() if k not in SECRET_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(v) for v in value]
+    return value
+
+def cassette_key(kind: str, request: Dict[str, Any]) -> str:
+    blob = json.dumps({"kind": kind, "request": _scrub(request)}, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+def parse_latency(spec: str) -> Callable[[random.Random, float], float]:
+    """CASSETTE_LATENCY spec -> f(rng, recorded_ms) returning seconds to sleep."""
+    name, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if name == "none":
+        return lambda rng, recorded: 0.0
+    if name == "recorded":
+        return lambda rng, recorded: recorded / 1000
+    if name == "fixed":
+        return lambda rng, recorded: args[0] / 1000
+    if name == "normal":
+        return lambda rng, recorded: max(0.0, rng.gauss(args[0], args[1])) / 1000
+    if name == "lognormal":
+        return lambda rng, recorded: rng.lognormvariate(0, args[1]) * args[0] / 1000
+    raise ValueError(f"Unknown CASSETTE_LATENCY '{spec}'")
+
+
+class Cassette:
+    """
+    SQLite store of recorded responses keyed by (kind, request). `call` and
+    `acall` sit in front of a real call and record, replay or pass through
+    depending on the mode.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = CASSETTE_MODE, latency: str = CASSETTE_LATENCY):
+        if mode not in {"off", "record", "replay", "auto"}:
+            raise ValueError(f"Unknown CASSETTE_MODE '{mode}'")
+        self.path = path
+        self.mode = mode
+        self._latency = parse_latency(latency)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._replays: Dict[str, int] = {}
+        self.counters = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    @property
+    def active(self) -> bool:
+        return self.mode != "off"
+
+    def _conn(self) -> sqlite3.Connection:
+        # caller holds self._lock
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cassette ("
+                "key TEXT PRIMARY KEY, kind TEXT, request TEXT, response TEXT, latency_ms REAL, recorded_at REAL)"
+            )
+        return self._db
+
+    def load(self, kind: str, request: Dict[str, Any]) -> Optional[Tuple[Any, float]]:
+        """(response, delay in seconds) for a recorded call, or None."""
+        key = cassette_key(kind, request)
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT response, latency_ms FROM cassette WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            n = self._replays[key] = self._replays.get(key, 0) + 1
+            self.counters["replayed"] += 1
+        rng = random.Random(f"{CASSETTE_SEED}:{key}:{n}")
+        return json.loads(row[0]), self._latency(rng, row[1])
+
+    def save(self, kind: str, request: Dict[str, Any], response: Any, latency_ms: float) -> None:
+        with self._lock:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO cassette (key, kind, request, response, latency_ms, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cassette_key(kind, request), kind, json.dumps(_scrub(request), default=str),
+                 json.dumps(response, default=str), latency_ms, time.time()),
+            )
+            self._conn().commit()
+            self.counters["recorded"] += 1
+
+    def _lookup(self, kind: str, request: Dict[str, Any]) -> Optional[Tuple[Any, float]]:
+        if self.mode in {"replay", "auto"}:
+            hit = self.load(kind, request)
+            if hit is not None:
+                return hit
+            if self.mode == "replay":
+                raise CassetteMiss(f"No recording for {kind} {json.dumps(_scrub(request), default=str)[:200]}")
+        return None
+
+    def call(self, kind: str, request: Dict[str, Any], fetch: Callable[[], Any],
+             encode: Callable[[Any], Any] = lambda r: r, decode: Callable[[Any], Any] = lambda r: r) -> Any:
+        """
+        Replay or record one call. `fetch` makes the real call; `encode`
+        turns its result into JSON-able data and `decode` turns that back
+        into what the caller expects.
+        """
+        if not self.active:
+            return fetch()
+        hit = self._lookup(kind, request)
+        if hit is not None:
+            response, delay = hit
+            if delay:
+                time.sleep(delay)
+            return decode(response)
+        start = time.perf_counter()
+        result = fetch()
+        self.save(kind, request, encode(result), (time.perf_counter() - start) * 1000)
+        return result
+
+    async def acall(self, kind: str, request: Dict[str, Any], fetch: Callable[[], Any],
+                    encode: Callable[[Any], Any] = lambda r: r, decode: Callable[[Any], Any] = lambda r: r) -> Any:
+        import asyncio
+
+        if not self.active:
+            return await fetch()
+        hit = self._lookup(kind, request)
+        if hit is not None:
+            response, delay = hit
+            if delay:
+                await asyncio.sleep(delay)
+            return decode(response)
+        start = time.perf_counter()
+        result = await fetch()
+        self.save(kind, request, encode(result), (time.perf_counter() - start) * 1000)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "path": self.path, **self.counters}
+
+
+CASSETTE = Cassette()
+
+# -------------------------------
+# HTTP (requests / httpx responses)
+# -------------------------------
+
+def encode_response(res: Any) -> Dict[str, Any]:
+    return {
+        "status_code": res.status_code,
+        "headers": {"content-type": res.headers.get("content-type", "")},
+        "body": res.content.decode("utf-8", errors="replace"),
+        "url": str(res.url),
+    }
+
+def requests_response(data: Dict[str, Any]):
+    import requests
+
+    res = requests.Response()
+    res.status_code = data["status_code"]
+    res._content = data["body"].encode("utf-8")
+    res.headers.update(data["headers"])
+    res.url = data["url"]
+    res.encoding = "utf-8"
+    return res
+
+def httpx_response(data: Dict[str, Any]):
+    import httpx
+
+    return httpx.Response(
+        data["status_code"],
+        content=data["body"].encode("utf-8"),
+        headers=data["headers"],
+        request=httpx.Request("GET", data["url"]),
+    )
+
+def http_request(url: str, endpoint: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # None params are dropped by both clients, so they must not split the key.
+    params = {k: v for k, v in (params or {}).items() if v is not None}
+    return {"url": url, "endpoint": endpoint, "params": params}
+
+# -------------------------------
+# LLM CLIENTS
+# -------------------------------
+
+def _plain(response: Any) -> Any:
+    # ollama returns dicts in older clients, pydantic objects in newer ones
+    return response.model_dump() if hasattr(response, "model_dump") else dict(response)
+
+def _replay_stream(chunks, delay: float) -> Iterator[Dict[str, Any]]:
+    # Spread the recorded latency over the chunks so TTFB stays realistic.
+    for chunk in chunks:
+        if delay:
+            time.sleep(delay / max(len(chunks), 1))
+        yield chunk
+
+def _wrap_ollama(name: str, real: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapped(*args, **kwargs):
+        request = {"args": list(args), **{k: v for k, v in kwargs.items() if k != "keep_alive"}}
+        kind = f"ollama.{name}"
+        if not kwargs.get("stream"):
+            return CASSETTE.call(kind, request, lambda: real(*args, **kwargs), encode=_plain)
+        hit = CASSETTE._lookup(kind, request)
+        if hit is not None:
+            return _replay_stream(*hit)
+        return _record_stream(kind, request, real(*args, **kwargs))
+
+    wrapped.__wrapped__ = real
+    return wrapped
+
+def _record_stream(kind: str, request: Dict[str, Any], stream) -> Iterator[Any]:
+    start = time.perf_counter()
+    chunks = []
+    for chunk in stream:
+        chunks.append(_plain(chunk))
+        yield chunk
+    CASSETTE.save(kind, request, chunks, (time.perf_counter() - start) * 1000)
+
+def _langchain_cache():
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+
+    class CassetteLLMCache(BaseCache):
+        """LangChain LLM cache backed by the cassette; covers ChatWatsonx and any other LangChain model."""
+
+        def lookup(self, prompt: str, llm_string: str):
+            hit = CASSETTE._lookup("langchain", {"prompt": prompt, "llm": llm_string})
+            if hit is None:
+                return None
+            generations, delay = hit
+            if delay:
+                time.sleep(delay)
+            return [loads(g) for g in generations]
+
+        def update(self, prompt: str, llm_string: str, return_val) -> None:
+            # LangChain does not report how long the call took; replay with "recorded" latency sees 0.
+            CASSETTE.save("langchain", {"prompt": prompt, "llm": llm_string}, [dumps(g) for g in return_val], 0.0)
+
+        def clear(self, **kwargs: Any) -> None:
+            pass  # recordings are only removed by deleting the cassette file
+
+    return CassetteLLMCache()
+
+def install() -> None:
+    """
+    Route Ollama and LangChain model calls through the cassette. HTTP calls
+    made via http_client check the cassette on their own. No-op when
+    CASSETTE_MODE=off.
+    """
+    if not CASSETTE.active:
+        return
+    try:
+        import ollama
+
+        for name in ("chat", "generate"):
+            fn = getattr(ollama, name)
+            if not hasattr(fn, "__wrapped__"):
+                setattr(ollama, name, _wrap_ollama(name, fn))
+    except ImportError:
+        pass
+    try:
+        from langchain_core.globals import set_llm_cache
+
+        set_llm_cache(_langchain_cache())
+    except ImportError:
+        pass
+    print(f"[DEBUG] cassette {CASSETTE.mode}: {CASSETTE.path}, latency={CASSETTE_LATENCY}")
+
+def stats() -> Dict[str, Any]:
+    return CASSETTE.stats()
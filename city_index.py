@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+CITIES_JSON = "cities.json"
+CITY_ALIASES_JSON = "city_aliases.json"
+# Minimum score for city_code to trust a fuzzy match instead of answering UNK.
+CITY_MATCH_THRESHOLD = float(os.getenv("CITY_MATCH_THRESHOLD", "0.75"))
+# A fuzzy (non-exact) match must beat the runner-up by this much: "san fran"
+# is two edits from San Juan and a prefix of San Francisco, so it is neither.
+FUZZY_MARGIN = float(os.getenv("CITY_FUZZY_MARGIN", "0.1"))
+# How many n-gram candidates get the (more expensive) edit-distance check.
+FUZZY_CANDIDATES = 32
+# Words that say nothing about which city is meant.
+NOISE_WORDS = {"airport", "intl", "international"}
+
+
+class CityMatch(NamedTuple):
+    city: str
+    code: str
+    score: float
+    matched: str  # the name, alias or code that matched
+
+
+def normalize(text: str) -> str:
+    """'  São-Paulo ' -> 'sao paulo': accents, case, punctuation and spacing folded."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^0-9a-z]+", " ", text)
+    return " ".join(text.split())
+
+def _grams(key: str, n: int = 3) -> List[str]:
+    padded = f"  {key} "
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+def bounded_distance(a: str, b: str, max_dist: int) -> Optional[int]:
+    """
+    Edit distance (with adjacent transpositions) between a and b, or None if
+    it exceeds max_dist. Rows stop early once every cell is past the bound.
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return None
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_dist:
+            return None
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= max_dist else None
+
+
+class CityIndex:
+    """
+    Prebuilt city -> IATA lookup: exact match on normalized names, aliases
+    and codes first, then trigram candidates ranked by bounded edit distance.
+    """
+
+    def __init__(self, cities: Dict[str, str], aliases: Optional[Dict[str, str]] = None):
+        self._exact: Dict[str, CityMatch] = {}
+        for city, code in cities.items():
+            self._add(normalize(city), city, code)
+            self._add(normalize(code), city, code)
+        canonical = {normalize(city): city for city in cities}
+        for alias, city in (aliases or {}).items():
+            target = canonical.get(normalize(city))
+            if target is None:
+                print(f"[DEBUG] city alias '{alias}' points at unknown city '{city}'")
+                continue
+            self._add(normalize(alias), target, cities[target])
+
+        self._keys = list(self._exact)
+        self._gram_counts: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        for key_id, key in enumerate(self._keys):
+            grams = set(_grams(key))
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(key_id)
+
+    def _add(self, key: str, city: str, code: str) -> None:
+        if key and key not in self._exact:
+            self._exact[key] = CityMatch(city, code, 1.0, key)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def lookup(self, query: str, limit: int = 5, min_score: float = 0.5) -> List[CityMatch]:
+        """Ranked candidates for `query`, best first, one per city."""
+        q = normalize(query)
+        q = " ".join(w for w in q.split() if w not in NOISE_WORDS) or q
+        if not q:
+            return []
+        hit = self._exact.get(q)
+        if hit:
+            return [hit]
+
+        q_grams = set(_grams(q))
+        overlap: Counter = Counter()
+        for gram in q_grams:
+            overlap.update(self._postings.get(gram, ()))  # C-level counting loop
+
+        max_dist = max(1, len(q) // 4)
+        # q-gram lemma: an insert/delete/substitution destroys at most 3 trigrams
+        # and a transposition ('dehli') up to 4, so a key sharing fewer than this
+        # cannot be within max_dist and skips the DP entirely.
+        min_shared = len(q_grams) - 4 * max_dist
+        best: Dict[str, CityMatch] = {}
+        for key_id, shared in overlap.most_common(FUZZY_CANDIDATES):
+            key = self._keys[key_id]
+            entry = self._exact[key]
+            # Dice coefficient on trigrams catches re-ordered / partial names...
+            score = 2 * shared / (len(q_grams) + self._gram_counts[key_id])
+            # ...edit distance catches typos.
+            if shared >= min_shared:
+                dist = bounded_distance(q, key, max_dist)
+                if dist is not None:
+                    score = max(score, 1 - dist / max(len(q), len(key)))
+            if score >= min_score and score > best.get(entry.city, entry._replace(score=0)).score:
+                best[entry.city] = CityMatch(entry.city, entry.code, round(score, 3), key)
+
+        return sorted(best.values(), key=lambda m: -m.score)[:limit]
+
+    def best(self, query: str, threshold: float = CITY_MATCH_THRESHOLD) -> Optional[CityMatch]:
+        """
+        The match to trust for `query`, or None: it must score `threshold`,
+        and unless exact it must also clear the runner-up by FUZZY_MARGIN.
+        """
+        matches = self.lookup(query, limit=2)
+        if not matches or matches[0].score < threshold:
+            return None
+        top = matches[0]
+        if top.score < 1.0 and len(matches) > 1 and top.score - matches[1].score < FUZZY_MARGIN:
+            print(f"[DEBUG] city '{query}' is ambiguous: {top.city} {top.score} vs {matches[1].city} {matches[1].score}")
+            return None
+        return top
+
+    def resolve(self, query: str, threshold: float = CITY_MATCH_THRESHOLD) -> str:
+        """Best IATA code for `query`, or 'UNK' if no match is trustworthy (see best)."""
+        match = self.best(query, threshold)
+        return match.code if match else "UNK"
+
+
+@lru_cache(maxsize=1)
+def get_index(cities_path: str = CITIES_JSON, aliases_path: str = CITY_ALIASES_JSON) -> CityIndex:
+    with open(cities_path, "r", encoding="utf-8") as f:
+        cities = json.load(f)
+    aliases = {}
+    if os.path.exists(aliases_path):
+        with open(aliases_path, "r", encoding="utf-8") as f:
+            aliases = json.load(f)
+    index = CityIndex(cities, aliases)
+    print(f"[DEBUG] Built city index: {len(cities)} cities, {len(index)} keys")
+    return index
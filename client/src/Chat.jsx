@@ -80,7 +80,16 @@ export default function Chat() {
         const messageData = JSON.parse(e.data);
         if ("online" in messageData) {
             showOnlinePeople(messageData.online);
+        } else if (messageData.type === "partial") {
+            // Streaming bot reply: one bubble per stream, updated in place
+            const streamKey = "stream-" + messageData.stream_id;
+            setMessages((prev) => [
+                ...prev.filter((m) => m._id !== streamKey),
+                { ...messageData, _id: streamKey },
+            ]);
         } else if ("text" in messageData) {
+            // A final frame replaces the streaming bubble it belongs to
+            const streamKey = messageData.stream_id && "stream-" + messageData.stream_id;
             try {
                 const parsed = JSON.parse(messageData.text);
 
@@ -119,12 +128,16 @@ export default function Chat() {
                     };
                     const rzp = new window.Razorpay(options);
                     rzp.open();
-                    return; // skip adding to messages
+                    // Skip adding to messages, but drop the partial bubble it streamed into
+                    if (streamKey) {
+                        setMessages((prev) => prev.filter((m) => m._id !== streamKey));
+                    }
+                    return;
                 }
             } catch (err) {
                 // Not a Razorpay action
             }
-            setMessages((prev) => [...prev, { ...messageData }]);
+            setMessages((prev) => [...prev.filter((m) => m._id !== streamKey), { ...messageData }]);
         }
     }
 
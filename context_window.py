@@ -0,0 +1,142 @@
+import os
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or no network to fetch the encoding
+    _ENCODING = None
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Prompt tokens (system + history + new message) sent per ollama.chat call.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Newest turns always kept (tool outputs collapsed), even past the budget.
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "2"))
+# Tool outputs above this are collapsed unless they belong to the newest turn.
+TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "200"))
+SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken's count when available (a close proxy for gemma), else ~4 chars per token."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def collapse(text: str, max_tokens: int = TOOL_OUTPUT_MAX_TOKENS) -> str:
+    """Keep the leading lines of a bulky output that fit in max_tokens, and say how much was cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    kept, used = [], 0
+    for line in lines:
+        cost = count_tokens(line)
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if not kept:
+        return text[:max_tokens * 4] + " ...[truncated]"
+    return "\n".join(kept) + f"\n...[{len(lines) - len(kept)} more lines omitted]"
+
+def _one_line(text: str, limit: int = 100) -> str:
+    line = " ".join(text.split())
+    return line if len(line) <= limit else line[:limit - 3] + "..."
+
+
+class ContextWindow:
+    """
+    Chat history for one conversation, rendered into an ollama message list
+    that fits a token budget: the system prompt, a short summary of turns
+    that no longer fit, then as many recent turns as the budget allows.
+    """
+
+    def __init__(
+        self,
+        system: str,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        recent_turns: int = CONTEXT_RECENT_TURNS,
+        tool_output_max_tokens: int = TOOL_OUTPUT_MAX_TOKENS,
+    ):
+        self.system = system
+        self.budget = budget
+        self.recent_turns = recent_turns
+        self.tool_output_max_tokens = tool_output_max_tokens
+        self.turns: List[Dict[str, Any]] = []  # {"user": str, "assistant": str, "tool": Optional[str]}
+        self.reports: List[Dict[str, Any]] = []
+
+    def add_turn(self, user: str, assistant: str, tool: Optional[str] = None) -> None:
+        self.turns.append({"user": user, "assistant": assistant, "tool": tool})
+
+    def _render_turn(self, turn: Dict[str, Any], newest: bool, room: int) -> List[Dict[str, str]]:
+        reply = turn["assistant"]
+        if turn["tool"]:
+            # The newest tool result is what the user is likely asking about, so
+            # it may use whatever budget is left; older ones get the short form.
+            limit = max(room, self.tool_output_max_tokens) if newest else self.tool_output_max_tokens
+            reply = collapse(reply, limit)
+        return [{"role": "user", "content": turn["user"]}, {"role": "assistant", "content": reply}]
+
+    def _summary(self, dropped: List[Dict[str, Any]]) -> str:
+        lines = []
+        for turn in dropped:
+            answer = f"{turn['tool']} returned: " if turn["tool"] else ""
+            lines.append(f"- User: {_one_line(turn['user'])} | {answer}{_one_line(turn['assistant'])}")
+        summary = "Earlier in this conversation:\n" + "\n".join(lines)
+        return collapse(summary, SUMMARY_MAX_TOKENS)
+
+    def messages(self, user_message: str) -> List[Dict[str, str]]:
+        """The message list for the next ollama.chat call, ending with `user_message`."""
+        system = {"role": "system", "content": self.system}
+        current = {"role": "user", "content": user_message}
+        used = count_tokens(self.system) + count_tokens(user_message)
+
+        kept: List[List[Dict[str, str]]] = []
+        for age, turn in enumerate(reversed(self.turns)):
+            room = self.budget - used - count_tokens(turn["user"])
+            rendered = self._render_turn(turn, newest=(age == 0), room=room)
+            cost = sum(count_tokens(m["content"]) for m in rendered)
+            if age >= self.recent_turns and used + cost > self.budget:
+                break
+            kept.append(rendered)
+            used += cost
+        kept.reverse()
+
+        prefix = [system]
+        dropped = self.turns[:len(self.turns) - len(kept)]
+        if dropped:
+            summary = self._summary(dropped)
+            used += count_tokens(summary)
+            prefix.append({"role": "system", "content": summary})
+
+        self.reports.append({
+            "turn": len(self.turns) + 1,
+            "prompt_tokens": used,
+            "turns_kept": len(kept),
+            "turns_summarized": len(dropped),
+        })
+        return prefix + [m for pair in kept for m in pair] + [current]
+
+    def record_usage(self, response: Any) -> Dict[str, Any]:
+        """
+        Attach Ollama's own counters (prompt_eval_count, prompt_eval_duration)
+        for the call just made to the last report, and print it.
+        """
+        report = self.reports[-1] if self.reports else {}
+        count = _field(response, "prompt_eval_count")
+        duration = _field(response, "prompt_eval_duration")
+        if count is not None:
+            report["ollama_prompt_tokens"] = count
+        if duration is not None:
+            report["prompt_eval_ms"] = round(duration / 1e6, 1)
+        print(f"[DEBUG] context: {report}")
+        return report
+
+
+def _field(response: Any, name: str) -> Any:
+    # ollama returns a dict in older clients and a ChatResponse object in newer ones
+    if isinstance(response, dict):
+        return response.get(name)
+    return getattr(response, name, None)
@@ -0,0 +1,80 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class SenderDispatcher:
+    """
+    Run a handler on a bounded worker pool, keyed by sender.
+
+    Messages from different senders are handled in parallel (up to
+    `max_workers` at once); messages from the same sender are handled one at
+    a time, in the order they were submitted.
+    """
+
+    def __init__(self, handler: Callable[..., Any], max_workers: int = 4, name: str = "dispatch"):
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+        self._handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._queues: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._busy = 0
+        self.max_workers = max_workers
+        self.processed = 0
+        self.failed = 0
+
+    def submit(self, key: str, *args: Any) -> None:
+        """Queue `handler(*args)` behind any pending work for `key`."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                # A worker already owns this sender; it will pick this up next.
+                queue.append(args)
+                return
+            self._queues[key] = deque([args])
+        self._executor.submit(self._run_next, key)
+
+    def _run_next(self, key: str) -> None:
+        with self._lock:
+            args = self._queues[key].popleft()
+            self._busy += 1
+        try:
+            self._handler(*args)
+            ok = True
+        except Exception as e:
+            print(f"[ERROR] Dispatcher handler failed for sender={key}: {e}")
+            ok = False
+        with self._lock:
+            self._busy -= 1
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+            if not self._queues[key]:
+                del self._queues[key]
+                if not self._queues:
+                    self._idle.notify_all()
+                return
+        # Re-queue instead of looping so one chatty sender cannot pin a worker.
+        self._executor.submit(self._run_next, key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "busy": self._busy,
+                "active_senders": len(self._queues),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "processed": self.processed,
+                "failed": self.failed,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool; with `wait`, drain every queued message first."""
+        if wait:
+            with self._idle:
+                self._idle.wait_for(lambda: not self._queues)
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from search_cache import resolve_date
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Days searched when only a start date is given ("next week").
+FLEX_DEFAULT_DAYS = int(os.getenv("FLEX_DEFAULT_DAYS", "7"))
+FLEX_MAX_DAYS = int(os.getenv("FLEX_MAX_DAYS", "14"))
+# Dates searched at once, across every flexible search in the process. SerpAPI
+# calls themselves are capped process-wide by http_client's SERPAPI_CONCURRENCY.
+FLEX_CONCURRENCY = int(os.getenv("FLEX_CONCURRENCY", "7"))
+# Most SerpAPI searches one flexible search may make, over all dates and
+# airport pairs; a metro-to-metro route gets fewer, wider searches per date.
+FLEX_MAX_SEARCHES = int(os.getenv("FLEX_MAX_SEARCHES", "14"))
+FLEX_TOP_PICKS = int(os.getenv("FLEX_TOP_PICKS", "3"))
+
+_executor = ThreadPoolExecutor(max_workers=FLEX_CONCURRENCY, thread_name_prefix="flex")
+_async_limit: Optional[asyncio.Semaphore] = None
+
+Flights = List[Dict[str, Any]]
+
+
+def date_window(start_date: str, end_date: Optional[str] = None, days: int = FLEX_DEFAULT_DAYS) -> List[str]:
+    """
+    Every date from start_date to end_date inclusive (or `days` days from
+    start_date), at most FLEX_MAX_DAYS. Accepts 'today'/'tomorrow'.
+    """
+    start = datetime.strptime(resolve_date(start_date), "%Y-%m-%d")
+    if end_date:
+        days = (datetime.strptime(resolve_date(end_date), "%Y-%m-%d") - start).days + 1
+    if days < 1:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    dates = [start + timedelta(days=i) for i in range(min(days, FLEX_MAX_DAYS))]
+    return [d.strftime("%Y-%m-%d") for d in dates if d >= today]
+
+def searches_per_date(dates: List[str]) -> int:
+    """Each date's share of FLEX_MAX_SEARCHES, at least one."""
+    return max(1, FLEX_MAX_SEARCHES // max(len(dates), 1))
+
+def _price(flight: Dict[str, Any]) -> Optional[float]:
+    price = flight.get("price")
+    return float(price) if isinstance(price, (int, float)) else None
+
+def merge(by_date: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Per-date results (a flight list, or an exception) -> a price-by-date
+    matrix, the cheapest date and the overall top picks.
+    """
+    matrix, picks = [], []
+    for date in sorted(by_date):
+        result = by_date[date]
+        if isinstance(result, Exception):
+            matrix.append({"date": date, "error": str(result)})
+            continue
+        prices = [p for p in map(_price, result) if p is not None]
+        durations = [f["total_duration"] for f in result if isinstance(f.get("total_duration"), (int, float))]
+        matrix.append({
+            "date": date,
+            "cheapest_price": min(prices) if prices else None,
+            "fastest_duration": min(durations) if durations else None,
+            "options": len(result),
+        })
+        picks.extend({"date": date, **flight} for flight in result if _price(flight) is not None)
+
+    priced = [row for row in matrix if row.get("cheapest_price") is not None]
+    picks.sort(key=lambda f: (_price(f), f.get("total_duration") or float("inf")))
+    return {
+        "price_by_date": matrix,
+        "cheapest_date": min(priced, key=lambda r: r["cheapest_price"])["date"] if priced else None,
+        "top_picks": picks[:FLEX_TOP_PICKS],
+    }
+
+def search_dates(search: Callable[[str], Flights], dates: List[str]) -> Dict[str, Any]:
+    """Run search(date) for every date concurrently (FLEX_CONCURRENCY at most) and merge."""
+    start = time.perf_counter()
+    futures = {date: _executor.submit(search, date) for date in dates}
+    by_date: Dict[str, Any] = {}
+    for date, future in futures.items():
+        try:
+            by_date[date] = future.result()
+        except Exception as e:
+            by_date[date] = e
+    print(f"[DEBUG] flexible search: {len(dates)} dates in {time.perf_counter() - start:.2f}s")
+    return merge(by_date)
+
+async def asearch_dates(search: Callable[[str], Awaitable[Flights]], dates: List[str]) -> Dict[str, Any]:
+    """asyncio counterpart of search_dates."""
+    global _async_limit
+    if _async_limit is None:
+        _async_limit = asyncio.Semaphore(FLEX_CONCURRENCY)
+    start = time.perf_counter()
+
+    async def one(date: str) -> Any:
+        async with _async_limit:
+            return await search(date)
+
+    results = await asyncio.gather(*(one(date) for date in dates), return_exceptions=True)
+    print(f"[DEBUG] flexible search: {len(dates)} dates in {time.perf_counter() - start:.2f}s")
+    return merge(dict(zip(dates, results)))
@@ -1,10 +1,8 @@
 import json
 import os
-import requests
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any, List
-from functools import lru_cache
-import pymongo
+from typing import Callable, Optional, Dict, Any, List, Tuple
+from concurrent.futures import Future
 from bson import ObjectId
 import ollama
 from dotenv import load_dotenv
@@ -12,8 +10,26 @@ import time
 import jwt
 import websocket
 import threading
+from dispatcher import SenderDispatcher
+import mongo_pool
+import search_cache
+import flex_search
+import metro_airports
+import city_index
+from intent_router import IntentRouter
+import http_client
+import cassette
+from streaming import ReplyStream, STREAM_REPLIES
+import tool_calls
+import tool_runner
+from tool_calls import STRUCTURED_TOOL_CALLS
+from context_window import ContextWindow
+import tool_projection
+import ollama_session
+from ollama_session import OllamaSession
 
 load_dotenv()
+cassette.install()  # no-op unless CASSETTE_MODE is set
 import razorpay
 
 razorpay_client = razorpay.Client(auth=(os.getenv("RAZORPAYKEYID"), os.getenv("RAZORPAYKEYSECRET")))
@@ -27,6 +43,11 @@ MONGO_URI = os.getenv("MONGO_URI")
 SERPER_API_KEY = os.getenv("APIKEY")
 SERPER_ENDPOINT = os.getenv("APIENDPOINT")
 USER_ID = "60b8d295f7f6d632d8b53cd4"
+# Max messages handled at once; size this to what Ollama/SerpAPI can serve in parallel.
+MAX_CONCURRENCY = int(os.getenv("GEMMA_MAX_CONCURRENCY", "4"))
+# chat(): keep the conversation's KV cache in Ollama (see ollama_session)
+# instead of re-sending a token-budgeted history every turn.
+REUSE_OLLAMA_CONTEXT = os.getenv("GEMMA_REUSE_CONTEXT", "0") == "1"
 
 print(f"[DEBUG] SERPER_API_KEY: {SERPER_API_KEY}")
 print(f"[DEBUG] SERPER_ENDPOINT: {SERPER_ENDPOINT}")
@@ -36,28 +57,24 @@ print(f"[DEBUG] MONGO_URI: {MONGO_URI}")
 # TOOL FUNCTIONS
 # -------------------------------
 
-@lru_cache(maxsize=1)
-def _load_cities() -> dict[str, str]:
+def _city_index() -> city_index.CityIndex:
     try:
-        print("[DEBUG] Loading cities from file...")
-        with open(CITIES_JSON, "r", encoding="utf-8") as f:
-            cities = {k.title(): v for k, v in json.load(f).items()}
-        print(f"[DEBUG] Loaded {len(cities)} cities")
-        return cities
+        return city_index.get_index(CITIES_JSON)
     except Exception as e:
         print(f"[ERROR] Failed to load cities: {e}")
         raise RuntimeError(f"City data error: {e}")
 
 def city_code(city_name: str) -> str:
-    code = _load_cities().get(city_name.title(), "UNK")
+    # Aliases ("Bangalore", "NYC") and typos resolve here instead of costing another LLM round trip;
+    # cities with several airports give their metro code ("London" -> "LON").
+    code = metro_airports.resolve(_city_index(), city_name)
     print(f"[DEBUG] city_code('{city_name}') -> '{code}'")
     return code
 
 def get_user_flight_bookings(user_id: str) -> list[dict]:
     try:
         print(f"[DEBUG] Fetching flight bookings for user_id={user_id}")
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client["test"]
+        db = mongo_pool.get_db()
         bookings = list(db.flightbookings.find({"user": ObjectId(user_id)}))
         print(f"[DEBUG] Found {len(bookings)} bookings")
         serialized = [serialize_booking(b) for b in bookings]
@@ -93,7 +110,21 @@ def get_user_flight_bookings(user_id: str) -> list[dict]:
         print(f"[ERROR] Error fetching flight bookings: {e}")
         return [{"error": str(e)}]
 
-def flights_finder(departure_airport, arrival_airport, outbound_date, return_date=None, adults=1) -> str:
+def _fetch_serpapi(params: dict) -> dict:
+    res = http_client.get(SERPER_ENDPOINT, endpoint="serpapi", params=params)
+    print(f"[DEBUG] SerpAPI HTTP status: {res.status_code}")
+    res.raise_for_status()
+    return res.json()
+
+def search_flights(departure_airport: str, arrival_airport: str, outbound_date: str, return_date: Optional[str] = None, adults: int = 1,
+                   max_searches: int = metro_airports.METRO_MAX_SEARCHES) -> List[Dict[str, Any]]:
+    """Raw SerpAPI best_flights (top 5), over every airport pair when either code is a metro code; raises on HTTP errors."""
+    return metro_airports.search_pairs(
+        lambda dep, arr: search_airport_pair(dep, arr, outbound_date, return_date, adults),
+        departure_airport, arrival_airport, max_searches,
+    )
+
+def search_airport_pair(departure_airport: str, arrival_airport: str, outbound_date: str, return_date: Optional[str] = None, adults: int = 1) -> List[Dict[str, Any]]:
     print(f"[DEBUG] flights_finder called with: departure_airport={departure_airport}, arrival_airport={arrival_airport}, outbound_date={outbound_date}, return_date={return_date}, adults={adults}")
 
     if outbound_date in {"today", "tomorrow"}:
@@ -114,54 +145,95 @@ def flights_finder(departure_airport, arrival_airport, outbound_date, return_dat
     }
     print(f"[DEBUG] flights_finder params: {params}")
 
+    data = search_cache.get_or_fetch(params, _fetch_serpapi)
+    print(f"[DEBUG] search cache stats: {search_cache.stats()}")
+    print(f"[DEBUG] flights_finder response data keys: {list(data.keys())}")
+    flights = data.get("best_flights", [])[:5]
+    print(f"[DEBUG] Retrieved {len(flights)} flights flights: {flights}")
+    return flights
+
+def format_flights(flights: List[Dict[str, Any]]) -> str:
+    if not flights:
+        return "Sorry, no flights found for your search."
+
+    # Build a human-readable summary string
+    summaries = []
+    for i, flight_data in enumerate(flights, 1):
+        legs = flight_data.get('flights', [])
+        total_duration = flight_data.get('total_duration', 'N/A')
+        price = flight_data.get('price', 'N/A')
+        stops = len(legs) - 1
+
+            # Format each leg in the journey
+        leg_summaries = []
+        for leg in legs:
+            dep = leg['departure_airport']
+            arr = leg['arrival_airport']
+            airline = leg.get('airline', 'Unknown Airline')
+            flight_no = leg.get('flight_number', 'N/A')
+            dep_time = dep.get('time', 'N/A')
+            arr_time = arr.get('time', 'N/A')
+            duration = leg.get('duration', 'N/A')
+            airplane = leg.get('airplane', 'N/A')
+
+            leg_summary = (f"{airline} {flight_no} from {dep['id']} ({dep_time}) "
+                               f"to {arr['id']} ({arr_time}), Duration: {duration} mins, Plane: {airplane}")
+            leg_summaries.append(leg_summary)
+
+        stops_text = "Direct" if stops == 0 else f"{stops} stop{'s' if stops > 1 else ''}"
+        summary = (f"Flight {i} - Price: ${price}, Total duration: {total_duration} mins, Stops: {stops_text}\n"
+                       + "\n".join(leg_summaries))
+        summaries.append(summary)
+    result_str = "Here are some flight options:\n" + "\n".join(summaries)
+    return result_str
+
+def flights_finder(departure_airport: str, arrival_airport: str, outbound_date: str, return_date: Optional[str] = None, adults: int = 1) -> str:
     try:
-        res = requests.get(SERPER_ENDPOINT, params=params, timeout=15)
-        print(f"[DEBUG] flights_finder HTTP status: {res.status_code}")
-        res.raise_for_status()
-        data = res.json()
-        print(f"[DEBUG] flights_finder response data keys: {list(data.keys())}")
-        flights = data.get("best_flights", [])[:5]
-        print(f"[DEBUG] Retrieved {len(flights)} flights flights: {flights}")
-
-        if not flights:
-            return "Sorry, no flights found for your search."
-
-        # Build a human-readable summary string
-        summaries = []
-        for i, flight_data in enumerate(flights, 1):
-            legs = flight_data.get('flights', [])
-            total_duration = flight_data.get('total_duration', 'N/A')
-            price = flight_data.get('price', 'N/A')
-            stops = len(legs) - 1
-
-                # Format each leg in the journey
-            leg_summaries = []
-            for leg in legs:
-                dep = leg['departure_airport']
-                arr = leg['arrival_airport']
-                airline = leg.get('airline', 'Unknown Airline')
-                flight_no = leg.get('flight_number', 'N/A')
-                dep_time = dep.get('time', 'N/A')
-                arr_time = arr.get('time', 'N/A')
-                duration = leg.get('duration', 'N/A')
-                airplane = leg.get('airplane', 'N/A')
-
-                leg_summary = (f"{airline} {flight_no} from {dep['id']} ({dep_time}) "
-                                   f"to {arr['id']} ({arr_time}), Duration: {duration} mins, Plane: {airplane}")
-                leg_summaries.append(leg_summary)
-
-            stops_text = "Direct" if stops == 0 else f"{stops} stop{'s' if stops > 1 else ''}"
-            summary = (f"Flight {i} - Price: ${price}, Total duration: {total_duration} mins, Stops: {stops_text}\n"
-                           + "\n".join(leg_summaries))
-            summaries.append(summary)
-        result_str = "Here are some flight options:\n" + "\n".join(summaries)
-        return result_str
-
+        return format_flights(search_flights(departure_airport, arrival_airport, outbound_date, return_date, adults))
     except Exception as e:
         print(f"[ERROR] flights_finder error: {e}")
         return f"Error fetching flights: {e}"
 
-def hotels_finder(q, check_in_date, check_out_date, adults=1, rooms=1) -> str:
+def search_flexible_flights(departure_airport: str, arrival_airport: str, start_date: str,
+                            end_date: Optional[str] = None, adults: int = 1) -> Dict[str, Any]:
+    """One search per date in the window, run concurrently, merged into a price-by-date matrix."""
+    dates = flex_search.date_window(start_date, end_date)
+    print(f"[DEBUG] flexible_flights_finder {departure_airport}->{arrival_airport} over {dates}")
+    per_date = flex_search.searches_per_date(dates)
+    return flex_search.search_dates(
+        lambda date: search_flights(departure_airport, arrival_airport, date, None, adults, per_date), dates
+    )
+
+def format_flexible_flights(result: Dict[str, Any]) -> str:
+    rows = result.get("price_by_date", [])
+    if not any(row.get("cheapest_price") is not None for row in rows):
+        return "Sorry, no flights found for those dates."
+    lines = ["Cheapest fare per day:"]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"{row['date']}: unavailable ({row['error']})")
+        elif row["cheapest_price"] is None:
+            lines.append(f"{row['date']}: no flights")
+        else:
+            marker = "  <- cheapest" if row["date"] == result.get("cheapest_date") else ""
+            lines.append(f"{row['date']}: ${row['cheapest_price']:g} ({row['options']} options){marker}")
+    lines.append("\nTop picks:")
+    for pick in result.get("top_picks", []):
+        # format_flights' "Flight 1 - Price: ..." block, headed by the date instead
+        details = format_flights([pick]).split("\n", 1)[1].replace("Flight 1 - ", "", 1)
+        lines.append(f"{pick['date']}: {details}")
+    return "\n".join(lines)
+
+def flexible_flights_finder(departure_airport: str, arrival_airport: str, start_date: str,
+                            end_date: Optional[str] = None, adults: int = 1) -> str:
+    try:
+        return format_flexible_flights(search_flexible_flights(departure_airport, arrival_airport, start_date, end_date, adults))
+    except Exception as e:
+        print(f"[ERROR] flexible_flights_finder error: {e}")
+        return f"Error fetching flights: {e}"
+
+def search_hotels(q: str, check_in_date: str, check_out_date: str, adults: int = 1, rooms: int = 1) -> List[Dict[str, Any]]:
+    """Raw SerpAPI properties (top 5); raises on HTTP errors."""
     print(f"[DEBUG] hotels_finder called with: q={q}, check_in_date={check_in_date}, check_out_date={check_out_date}, adults={adults}, rooms={rooms}")
     params = {
         "api_key": SERPER_API_KEY,
@@ -175,79 +247,82 @@ def hotels_finder(q, check_in_date, check_out_date, adults=1, rooms=1) -> str:
     }
     print(f"[DEBUG] hotels_finder params: {params}")
 
-    try:
-        res = requests.get(SERPER_ENDPOINT, params=params, timeout=15)
-        print(f"[DEBUG] hotels_finder HTTP status: {res.status_code}")
-        res.raise_for_status()
-        data = res.json()
-        print(f"[DEBUG] hotels_finder response data keys: {list(data.keys())}")
-        properties = data.get("properties", [])[:5]
-        print(f"[DEBUG] Retrieved {len(properties)} hotels")
-
-        if not properties:
-            return "Sorry, no hotels found for your search."
-
-        summaries = []
-        for i, hotel in enumerate(properties, 1):
-            name = hotel.get('name', 'Unknown Hotel')
-            type_ = hotel.get('type', 'N/A')
-            link = hotel.get('link', 'No link available')
-            price_lowest = hotel.get('rate_per_night', {}).get('lowest', 'N/A')
-            total_price = hotel.get('total_rate', {}).get('lowest', 'N/A')
-            check_in = hotel.get('check_in_time', 'N/A')
-            check_out = hotel.get('check_out_time', 'N/A')
-            rating = hotel.get('overall_rating', 'N/A')
-            reviews = hotel.get('reviews', 0)
-            location_rating = hotel.get('location_rating', 'N/A')
-            amenities = hotel.get('amenities', [])
-            essential_info = hotel.get('essential_info', [])
-            nearby_places = hotel.get('nearby_places', [])
-
-            # Format amenities string
-            amenities_str = ', '.join(amenities) if amenities else 'No amenities info'
-
-            # Format essential info
-            essential_str = ', '.join(essential_info) if essential_info else 'No essential info'
-
-            # Format nearby places string
-            nearby_str = []
-            for place in nearby_places:
-                name_place = place.get('name', 'Unknown place')
-                transports = place.get('transportations', [])
-                transport_strs = []
-                for t in transports:
-                    transport_type = t.get('type', 'N/A')
-                    duration = t.get('duration', 'N/A')
-                    transport_strs.append(f"{transport_type} ({duration})")
-                nearby_str.append(f"{name_place}: {', '.join(transport_strs)}")
-            nearby_places_str = "\n  - ".join(nearby_str) if nearby_str else "No nearby places info"
-
-            # Extract some images (thumbnails)
-            images = hotel.get('images', [])
-            image_thumbs = [img.get('thumbnail', '') for img in images[:3]]  # Show first 3 thumbnails
-            images_str = "\n  ".join(image_thumbs) if image_thumbs else "No images available"
-
-            summary = (
-                f"Hotel {i}: {name} ({type_})\n"
-                f"Link: {link}\n"
-                f"Price per night: {price_lowest}, Total price: {total_price}\n"
-                f"Check-in: {check_in}, Check-out: {check_out}\n"
-                f"Overall Rating: {rating} ({reviews} reviews), Location rating: {location_rating}\n"
-                f"Amenities: {amenities_str}\n"
-                f"Essential Info: {essential_str}\n"
-                f"Nearby Places:\n  - {nearby_places_str}\n"
-                f"Sample Images:\n  - {images_str}\n"
-            )
-            summaries.append(summary)
+    data = search_cache.get_or_fetch(params, _fetch_serpapi)
+    print(f"[DEBUG] search cache stats: {search_cache.stats()}")
+    print(f"[DEBUG] hotels_finder response data keys: {list(data.keys())}")
+    properties = data.get("properties", [])[:5]
+    print(f"[DEBUG] Retrieved {len(properties)} hotels")
+    return properties
+
+def format_hotels(properties: List[Dict[str, Any]]) -> str:
+    if not properties:
+        return "Sorry, no hotels found for your search."
+
+    summaries = []
+    for i, hotel in enumerate(properties, 1):
+        name = hotel.get('name', 'Unknown Hotel')
+        type_ = hotel.get('type', 'N/A')
+        link = hotel.get('link', 'No link available')
+        price_lowest = hotel.get('rate_per_night', {}).get('lowest', 'N/A')
+        total_price = hotel.get('total_rate', {}).get('lowest', 'N/A')
+        check_in = hotel.get('check_in_time', 'N/A')
+        check_out = hotel.get('check_out_time', 'N/A')
+        rating = hotel.get('overall_rating', 'N/A')
+        reviews = hotel.get('reviews', 0)
+        location_rating = hotel.get('location_rating', 'N/A')
+        amenities = hotel.get('amenities', [])
+        essential_info = hotel.get('essential_info', [])
+        nearby_places = hotel.get('nearby_places', [])
+
+        # Format amenities string
+        amenities_str = ', '.join(amenities) if amenities else 'No amenities info'
+
+        # Format essential info
+        essential_str = ', '.join(essential_info) if essential_info else 'No essential info'
+
+        # Format nearby places string
+        nearby_str = []
+        for place in nearby_places:
+            name_place = place.get('name', 'Unknown place')
+            transports = place.get('transportations', [])
+            transport_strs = []
+            for t in transports:
+                transport_type = t.get('type', 'N/A')
+                duration = t.get('duration', 'N/A')
+                transport_strs.append(f"{transport_type} ({duration})")
+            nearby_str.append(f"{name_place}: {', '.join(transport_strs)}")
+        nearby_places_str = "\n  - ".join(nearby_str) if nearby_str else "No nearby places info"
+
+        # Extract some images (thumbnails)
+        images = hotel.get('images', [])
+        image_thumbs = [img.get('thumbnail', '') for img in images[:3]]  # Show first 3 thumbnails
+        images_str = "\n  ".join(image_thumbs) if image_thumbs else "No images available"
+
+        summary = (
+            f"Hotel {i}: {name} ({type_})\n"
+            f"Link: {link}\n"
+            f"Price per night: {price_lowest}, Total price: {total_price}\n"
+            f"Check-in: {check_in}, Check-out: {check_out}\n"
+            f"Overall Rating: {rating} ({reviews} reviews), Location rating: {location_rating}\n"
+            f"Amenities: {amenities_str}\n"
+            f"Essential Info: {essential_str}\n"
+            f"Nearby Places:\n  - {nearby_places_str}\n"
+            f"Sample Images:\n  - {images_str}\n"
+        )
+        summaries.append(summary)
 
-        result_str = "Here are some hotel options:\n\n" + "\n".join(summaries)
-        return result_str
+    result_str = "Here are some hotel options:\n\n" + "\n".join(summaries)
+    return result_str
 
+def hotels_finder(q: str, check_in_date: str, check_out_date: str, adults: int = 1, rooms: int = 1) -> str:
+    try:
+        return format_hotels(search_hotels(q, check_in_date, check_out_date, adults, rooms))
     except Exception as e:
         print(f"[ERROR] hotels_finder error: {e}")
         return f"Error fetching hotels: {e}"
 
-def create_flight_booking(user_id, name, from_city, to_city, airline, flightno, dateOfJourney, totalPrice, numberOfTickets=None):
+def create_flight_booking(user_id: str, name: str, from_city: str, to_city: str, airline: str, flightno: str,
+                          dateOfJourney: str, totalPrice: float, numberOfTickets: Optional[int] = None):
     try:
         journey_date = datetime.strptime(dateOfJourney, "%Y-%m-%d")
         if journey_date.date() < datetime.now(timezone.utc).date():
@@ -304,29 +379,50 @@ def serialize_booking(booking):
 TOOLS = {
     "city_code": city_code,
     "flights_finder": flights_finder,
+    "flexible_flights_finder": flexible_flights_finder,
     "hotels_finder": hotels_finder,
     "get_user_flight_bookings": get_user_flight_bookings,
     "create_flight_booking": create_flight_booking,
 }
 
-# -------------------------------
-# JSON PARSER
-# -------------------------------
+# Tools whose raw SerpAPI results are projected for the LLM (tool_projection);
+# the user still sees the full formatted text.
+PROJECTED_TOOLS = {
+    "flights_finder": (search_flights, format_flights),
+    "flexible_flights_finder": (search_flexible_flights, format_flexible_flights),
+    "hotels_finder": (search_hotels, format_hotels),
+}
 
-def parse_function_call(text: str) -> Optional[Dict[str, Any]]:
-    print(f"[DEBUG] parse_function_call input text: {text}")
+def call_tool(tool_name: str, params: Dict[str, Any]) -> Tuple[str, str]:
+    """(text for the user, token-budgeted text for the LLM)."""
     try:
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start == -1 or end == 0:
-            print("[DEBUG] No JSON found in text")
-            return None
-        parsed = json.loads(text[start:end])
-        print(f"[DEBUG] Parsed function call JSON: {parsed}")
-        return parsed
+        if tool_name in PROJECTED_TOOLS:
+            search, format_results = PROJECTED_TOOLS[tool_name]
+            payload = search(**params)
+            return format_results(payload), tool_projection.project(tool_name, payload).content
+        if tool_name not in TOOLS:
+            result = f"Unknown tool requested: {tool_name}"
+            return result, result
+        result = TOOLS[tool_name](**params)
+        return str(result), tool_projection.project(tool_name, result).content
     except Exception as e:
-        print(f"[ERROR] JSON parse error: {e}")
-        return None
+        result = f"Error invoking tool {tool_name}: {e}"
+        return result, result
+
+# -------------------------------
+# STRUCTURED TOOL CALLS
+# -------------------------------
+
+# Every reply is either one valid call of a TOOLS entry or {"reply": ...};
+# tool_calls.parse_reply repairs/counts whatever still slips through.
+REPLY_SCHEMA = tool_calls.reply_schema(TOOLS)
+
+def chat_options() -> Dict[str, Any]:
+    """ollama.chat kwargs: the shared warm-model options, plus the reply schema."""
+    options = ollama_session.request_options()
+    if STRUCTURED_TOOL_CALLS:
+        options["format"] = REPLY_SCHEMA
+    return options
 
 # -------------------------------
 # SYSTEM MESSAGE
@@ -346,8 +442,8 @@ Available tools and their exact parameter names:
    - city_name: string
 
 2. flights_finder:
-   - departure_airport: string (airport code, e.g. 'BLR')
-   - arrival_airport: string (airport code, e.g. 'BOM')
+   - departure_airport: string (airport or metro code, e.g. 'BLR', 'LON')
+   - arrival_airport: string (airport or metro code, e.g. 'BOM', 'NYC')
    - outbound_date: string ('YYYY-MM-DD' or 'today' or 'tomorrow')
    - return_date: string or null (optional)
    - adults: integer (default 1)
@@ -372,49 +468,59 @@ Available tools and their exact parameter names:
 
 5. get_user_flight_bookings:
    - user_id: string (optional)
+
+6. flexible_flights_finder (a range of dates or "cheapest day", e.g. next week; use instead of one flights_finder per day):
+   - departure_airport: string (airport or metro code)
+   - arrival_airport: string (airport or metro code)
+   - start_date: string ('YYYY-MM-DD' or 'today' or 'tomorrow')
+   - end_date: string or null (optional, default a week after start_date)
+   - adults: integer (default 1)
 """
+if STRUCTURED_TOOL_CALLS:
+    SYSTEM_MSG += tool_calls.FORMAT_INSTRUCTIONS
 
 def chat():
     print("🧭 Travel Assistant (with multiple tools)")
     print("Ask about flights, hotels, bookings, or city codes.\nType 'exit' to quit.\n")
-    history = []
+    # Keeps the prompt within CONTEXT_TOKEN_BUDGET; older turns and bulky
+    # tool results are summarized instead of resent in full.
+    window = ContextWindow(SYSTEM_MSG)
+    session = OllamaSession(MODEL_NAME, SYSTEM_MSG, format=REPLY_SCHEMA if STRUCTURED_TOOL_CALLS else None) if REUSE_OLLAMA_CONTEXT else None
 
     while True:
         user_input = input("You: ")
         if user_input.lower() in {"exit", "quit"}:
+            if session:
+                print(f"[DEBUG] ollama session: {session.stats()}")
             break
 
-        history.append({"role": "user", "content": user_input})
-
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_MSG},
-                *history,
-                {"role": "user", "content": f"[user_id:{USER_ID}] {user_input}"},
-            ]
-        )
+        if session:
+            content = session.ask(f"[user_id:{USER_ID}] {user_input}")
+        else:
+            response = ollama.chat(
+                model=MODEL_NAME,
+                messages=window.messages(f"[user_id:{USER_ID}] {user_input}"),
+                **chat_options(),
+            )
+            window.record_usage(response)
+            content = response["message"]["content"]
 
-        content = response["message"]["content"]
-        func_call = parse_function_call(content)
+        reply = tool_calls.parse_reply(content, TOOLS, defaults={"user_id": USER_ID})
+        func_call = reply.call
 
-        if func_call and "name" in func_call and "parameters" in func_call:
+        if func_call:
             tool_name = func_call["name"]
             params = func_call["parameters"]
             print(f"[DEBUG] Calling tool: {tool_name} with params: {params}")
 
-            if tool_name in TOOLS:
-                try:
-                    result = TOOLS[tool_name](**params)
-                except Exception as e:
-                    result = f"Error invoking tool {tool_name}: {e}"
-            else:
-                result = f"Unknown tool requested: {tool_name}"
+            result, llm_view = call_tool(tool_name, params)
             print(f"Assistant:\n{result}")
-            history.append({"role": "assistant", "content": result})
+            if session:
+                session.add_result(llm_view)
+            window.add_turn(user_input, llm_view, tool=tool_name)
         else:
-            print(f"Assistant:\n{content}")
-            history.append({"role": "assistant", "content": content})
+            print(f"Assistant:\n{reply.text}")
+            window.add_turn(user_input, reply.text)
 
 JWT_SECRET = 'NOIDEAABRO'
 
@@ -440,69 +546,125 @@ def on_message(ws, message):
         print(f"[DEBUG] Parsed message data: {data}")
 
         if 'sender' in data and 'recipient' in data and 'text' in data:
-            llm_input = f"[user_id:{data['sender']}] {data['text']}"
-            print(f"[DEBUG] Sending to LLM model '{MODEL_NAME}' with input: {llm_input}")
-
-            response = ollama.chat(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MSG},
-                    {"role": "user", "content": llm_input}
-                ]
-            )
-            print(f"[DEBUG] LLM response: {response}")
-
-            content = response["message"]["content"]
-            func_call = parse_function_call(content)
-
-            if func_call and "name" in func_call and "parameters" in func_call:
-                name = func_call["name"]
-                args = func_call["parameters"]
-
-                print(f"[DEBUG] Parsed function call: name={name}, args={args}")
-
-                # Fix parameter names if needed
-                if name == "get_user_flight_bookings" and "user_id" not in args:
-                    args["user_id"] = USER_ID
-                if name == "create_flight_booking" and "user_id" not in args:
-                    args["user_id"] = USER_ID
-                if name == "city_code" and "city" in args:
-                    args["city_name"] = args.pop("city")
-
-                if name == "flights_finder":
-                    if "origin_airport" in args:
-                        args["departure_airport"] = args.pop("origin_airport")
-                    if "destination_airport" in args:
-                        args["arrival_airport"] = args.pop("destination_airport")
-                    if "origin_city" in args:
-                        args["departure_airport"] = args.pop("origin_city")
-                    if "destination_city" in args:
-                        args["arrival_airport"] = args.pop("destination_city")
-
-                print(f"[DEBUG] Final args for tool '{name}': {args}")
-
-                fn = TOOLS.get(name)
-                if fn:
-                    result = fn(**args)
-                else:
-                    result = {"error": "Unknown tool"}
-
-                reply_text = json.dumps(result, indent=2)
-                print(f"[DEBUG] Tool '{name}' result: {reply_text}")
-            else:
-                reply_text = content
-                print(f"[DEBUG] No function call found. Sending raw content.")
-
-            ws.send(json.dumps({
-                "sender": USER_ID,
-                "recipient": data["sender"],
-                "text": reply_text
-            }))
-            print("[DEBUG] Response sent to WebSocket client")
+            # Hand off so a slow LLM/tool call never blocks the socket's read loop.
+            dispatcher.submit(data["sender"], ws, data)
+            print(f"[DEBUG] Dispatched message from {data['sender']}: {dispatcher.stats()}")
 
     except Exception as e:
         print(f"[ERROR] Error handling message: {e}")
 
+# A tool call starts here; streamed text is held back from the first of these.
+TOOL_CALL_MARKERS = ("{", "```")
+
+def stream_chat(ws, stream: ReplyStream, messages: List[Dict[str, str]],
+                on_text: Optional[Callable[[str], None]] = None,
+                visible: Optional[Callable[[str], str]] = None) -> str:
+    """
+    Run ollama.chat with stream=True, forwarding text to the recipient as it
+    arrives; `on_text` also sees every chunk (e.g. to spot tool calls early),
+    and `visible` maps a chunk to the text to show (default: the chunk).
+    """
+    for chunk in ollama.chat(model=MODEL_NAME, messages=messages, stream=True, **chat_options()):
+        if on_text:
+            on_text(chunk["message"]["content"])
+        text = visible(chunk["message"]["content"]) if visible else chunk["message"]["content"]
+        frame = stream.feed(text)
+        if frame:
+            ws.send(json.dumps(frame))
+        if chunk.get("done"):
+            print(f"[DEBUG] ollama timings: {ollama_session.timings(chunk)}")
+    frame = stream.flush()
+    if frame:
+        ws.send(json.dumps(frame))
+    print(f"[DEBUG] Streamed {len(stream.text)} chars in {stream.frames_sent} frames, TTFB {stream.ttfb_ms()} ms")
+    return stream.text
+
+def start_tool(name: str, args: Dict[str, Any]) -> Tuple[str, Future]:
+    print(f"[DEBUG] Final args for tool '{name}': {args}")
+    return name, tool_runner.submit(TOOLS[name], **args)
+
+def handle_message(ws, data):
+    # Runs on the dispatcher, which logs and counts anything raised here.
+    route = router.route(data["text"], user_id=data["sender"])
+    stream = None
+    reply = None
+    started: List[Tuple[str, Future]] = []
+    if route:
+        # Formulaic request with every argument known: skip the LLM round trip.
+        print(f"[DEBUG] Router hit ({route.rule}): {route.tool} {route.args} | {router.stats()}")
+        started.append(start_tool(route.tool, route.args))
+    else:
+        llm_input = f"[user_id:{data['sender']}] {data['text']}"
+        print(f"[DEBUG] Sending to LLM model '{MODEL_NAME}' with input: {llm_input}")
+
+        messages = [
+            {"role": "system", "content": SYSTEM_MSG},
+            {"role": "user", "content": llm_input}
+        ]
+        llm_start = time.perf_counter()
+        if STREAM_REPLIES:
+            scanner = tool_calls.ToolCallStream(TOOLS, defaults={"user_id": USER_ID})
+            if STRUCTURED_TOOL_CALLS:
+                # The reply is one JSON object: stream the decoded {"reply"} text; a call shows nothing.
+                stream = ReplyStream(USER_ID, data["sender"])
+                visible = lambda delta: scanner.reply_delta()
+            else:
+                stream = ReplyStream(USER_ID, data["sender"], hold_markers=TOOL_CALL_MARKERS)
+                visible = None
+
+            def start_completed_calls(delta: str) -> None:
+                # Each call starts the moment its JSON closes, while the model keeps generating.
+                for call in scanner.feed(delta):
+                    started.append(start_tool(call["name"], call["parameters"]))
+
+            stream_chat(ws, stream, messages, on_text=start_completed_calls, visible=visible)
+            reply = scanner.close()
+            # Calls that only surfaced once a stray "{" was given up on at the end.
+            for call in scanner.calls[len(started):]:
+                started.append(start_tool(call["name"], call["parameters"]))
+        else:
+            response = ollama.chat(model=MODEL_NAME, messages=messages, **chat_options())
+            print(f"[DEBUG] LLM response: {response}")
+            print(f"[DEBUG] ollama timings: {ollama_session.timings(response)}")
+            # Misnamed/mistyped arguments are repaired against the tool signatures here.
+            reply = tool_calls.parse_reply(response["message"]["content"], TOOLS, defaults={"user_id": USER_ID})
+            if reply.call:
+                started.append(start_tool(reply.call["name"], reply.call["parameters"]))
+        router.record_llm_latency(time.perf_counter() - llm_start)
+        print(f"[DEBUG] tool call parsing: {tool_calls.stats()}")
+
+    if started:
+        # One deadline for all of them, not TOOL_CALL_TIMEOUT each in turn.
+        wait_start = time.monotonic()
+        results = [(name, tool_runner.wait_for(name, future, start=wait_start)) for name, future in started]
+        if len(results) == 1:
+            tool_text = json.dumps(results[0][1], indent=2)
+        else:
+            tool_text = json.dumps([{"tool": name, "result": result} for name, result in results], indent=2)
+        print(f"[DEBUG] Tool results ({', '.join(name for name, _ in results)}): {tool_text}")
+        # Any prose the model wrote around its calls goes first.
+        reply_text = "\n\n".join(filter(None, [reply.text if reply else "", tool_text]))
+    elif reply.error:
+        reply_text = f"Sorry, I could not run that request ({reply.error}). Could you rephrase it with the missing details?"
+        print(f"[DEBUG] Invalid tool call: {reply.error}")
+    else:
+        reply_text = reply.text
+        print(f"[DEBUG] No function call found. Sending the reply text.")
+
+    if stream:
+        # Same stream_id as the partials, so the client swaps them for this
+        ws.send(json.dumps(stream.frame(reply_text)))
+    else:
+        ws.send(json.dumps({
+            "sender": USER_ID,
+            "recipient": data["sender"],
+            "text": reply_text
+        }))
+    print("[DEBUG] Response sent to WebSocket client")
+
+router = IntentRouter(resolve_city=city_code)
+dispatcher = SenderDispatcher(handle_message, max_workers=MAX_CONCURRENCY, name="gemma")
+
 def on_open(ws):
     print("[DEBUG] WebSocket connected")
 
@@ -532,6 +694,7 @@ def connect_ws():
 
 if __name__ == "__main__":
         print("[DEBUG] Starting WebSocket client")
+        mongo_pool.warm_up()
         threading.Thread(target=connect_ws, daemon=True).start()
         # Keep main thread alive
         while True:
@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import city_index
+import http_client
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {
+    'User-Agent': 'MyWeatherApp/1.0 (Geocoding and Weather Service)'
+}
+# Nominatim's usage policy: at most one request per second, per application.
+NOMINATIM_MIN_INTERVAL = float(os.getenv("NOMINATIM_MIN_INTERVAL", "1.0"))
+# Names Nominatim did not know are asked again after this long, in case it was a blip.
+NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+CITIES_JSON = "cities.json"
+
+Coordinates = Tuple[float, float]
+
+
+class Throttle:
+    """Spaces calls at least `interval` seconds apart across every thread that shares it."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def canonical_name(name: str) -> str:
+    """
+    The cities.json name for an exact alias, spelling or airport code of a
+    known city ('Bombay', 'LA', 'DEL'); anything else is returned as is.
+    """
+    matches = city_index.get_index(CITIES_JSON).lookup(name, limit=1)
+    if matches and matches[0].score == 1.0:
+        return matches[0].city
+    return name
+
+def cache_key(name: str) -> str:
+    """
+    Aliases and spellings of a known city share one entry ('Bombay',
+    'mumbai ' -> 'mumbai'); anything else is keyed by its normalized text.
+    """
+    return city_index.normalize(canonical_name(name))
+
+def fetch_coordinates(name: str) -> Optional[Coordinates]:
+    """One Nominatim lookup: coordinates, None if the name is unknown; raises on HTTP errors."""
+    response = http_client.get(
+        NOMINATIM_URL,
+        endpoint="nominatim",
+        params={"q": name, "format": "json", "limit": 1},
+        headers=NOMINATIM_HEADERS,
+    )
+    if response.status_code != 200:
+        raise Exception(f"Nominatim API returned an error: {response.status_code}")
+    data = response.json()
+    if not data or not data[0].get("lat") or not data[0].get("lon"):
+        return None
+    return float(data[0]["lat"]), float(data[0]["lon"])
+
+
+class GeocodeCache:
+    """
+    City name -> coordinates, persisted in SQLite. Hits never touch the
+    network; misses go to Nominatim through one shared throttle, and
+    concurrent misses for the same name wait for a single request.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH, throttle: Optional[Throttle] = None):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "key TEXT PRIMARY KEY, query TEXT, lat REAL, lon REAL, found INTEGER, fetched_at REAL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+        self.throttle = throttle or Throttle(NOMINATIM_MIN_INTERVAL)
+        self.counters = {"hits": 0, "negative_hits": 0, "fetches": 0, "not_found": 0}
+
+    def _load(self, key: str) -> Optional[Tuple[Optional[Coordinates], bool]]:
+        """(coordinates or None, found) for a usable cache row, else None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT lat, lon, found, fetched_at FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lon, found, fetched_at = row
+        if found:
+            return (lat, lon), True
+        if time.time() - fetched_at < NEGATIVE_TTL:
+            return None, False
+        return None  # stale negative entry: ask again
+
+    def _store(self, key: str, name: str, coords: Optional[Coordinates]) -> None:
+        lat, lon = coords if coords else (None, None)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (key, query, lat, lon, found, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, name, lat, lon, int(coords is not None), time.time()),
+            )
+            self._db.commit()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def lookup(self, name: str) -> Optional[Coordinates]:
+        """Coordinates for `name`, or None if Nominatim does not know it."""
+        # Nominatim is asked for the city the entry is keyed by: 'LA' alone
+        # geocodes to Louisiana and would poison Los Angeles for everyone.
+        name = canonical_name(name)
+        key = city_index.normalize(name)
+        cached = self._load(key)
+        if cached is not None:
+            self._count("hits" if cached[1] else "negative_hits")
+            return cached[0]
+
+        with self._lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                cached = self._load(key)  # another thread may have just fetched it
+                if cached is not None:
+                    self._count("hits" if cached[1] else "negative_hits")
+                    return cached[0]
+                self.throttle.wait()
+                coords = fetch_coordinates(name)  # HTTP errors propagate and are not cached
+                self._count("fetches" if coords else "not_found")
+                self._store(key, name, coords)
+                return coords
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def peek(self, name: str) -> Optional[Coordinates]:
+        """Cached coordinates only; never calls Nominatim."""
+        cached = self._load(cache_key(name))
+        return cached[0] if cached else None
+
+    def seed(self, cities_path: str = CITIES_JSON) -> int:
+        """
+        Fill in every city from cities.json that is not cached yet, at the
+        throttled rate (so ~1 s per new city). Safe to interrupt and rerun.
+        """
+        import json
+
+        with open(cities_path, "r", encoding="utf-8") as f:
+            cities = json.load(f)
+        added = 0
+        for city in cities:
+            if self._load(cache_key(city)) is not None:
+                continue
+            try:
+                self.lookup(city)
+                added += 1
+            except Exception as e:
+                print(f"[ERROR] Seeding coordinates for {city} failed: {e}")
+        print(f"[DEBUG] Geocode cache seeded: {added} new cities, {self.stats()}")
+        return added
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT COUNT(*), SUM(found) FROM geocode").fetchone()
+            return {**self.counters, "entries": rows[0], "known": rows[1] or 0}
+
+
+_cache: Optional[GeocodeCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> GeocodeCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GeocodeCache()
+    return _cache
+
+def lookup(name: str) -> Optional[Coordinates]:
+    return get_cache().lookup(name)
+
+def peek(name: str) -> Optional[Coordinates]:
+    return get_cache().peek(name)
+
+def seed(cities_path: str = CITIES_JSON) -> int:
+    return get_cache().seed(cities_path)
+
+if __name__ == "__main__":
+    # python geocode_cache.py [cities.json]: pre-seed before deploying
+    seed(sys.argv[1] if len(sys.argv) > 1 else CITIES_JSON)
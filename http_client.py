@@ -0,0 +1,202 @@
+import asyncio
+import contextlib
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import cassette
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# (connect, read) timeouts in seconds, per upstream.
+ENDPOINT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "serpapi": (5, 20),
+    "nominatim": (5, 10),
+    "open_meteo": (5, 10),
+    "wikipedia": (5, 10),
+    "default": (5, 15),
+}
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+# Keep-alive sockets kept per host.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Requests in flight at once per upstream, across every thread and search in
+# the process. SerpAPI bills per search and rejects bursts, so fan-outs queue here.
+ENDPOINT_CONCURRENCY: Dict[str, int] = {
+    "serpapi": int(os.getenv("SERPAPI_CONCURRENCY", "8")),
+}
+
+# -------------------------------
+# BACKOFF
+# -------------------------------
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff; a numeric Retry-After header wins."""
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def timeout_for(endpoint: str) -> Tuple[float, float]:
+    return ENDPOINT_TIMEOUTS.get(endpoint, ENDPOINT_TIMEOUTS["default"])
+
+# -------------------------------
+# CONCURRENCY LIMITS
+# -------------------------------
+
+_limits = {name: threading.BoundedSemaphore(n) for name, n in ENDPOINT_CONCURRENCY.items()}
+_async_limits: Dict[str, asyncio.Semaphore] = {}
+
+def limit_for(endpoint: str) -> Any:
+    """The endpoint's process-wide slot, or a no-op for unlimited endpoints."""
+    return _limits.get(endpoint) or contextlib.nullcontext()
+
+def alimit_for(endpoint: str) -> Any:
+    if endpoint not in ENDPOINT_CONCURRENCY:
+        return contextlib.nullcontext()
+    if endpoint not in _async_limits:
+        # Created inside the running loop, like the AsyncClient.
+        _async_limits[endpoint] = asyncio.Semaphore(ENDPOINT_CONCURRENCY[endpoint])
+    return _async_limits[endpoint]
+
+# -------------------------------
+# SYNC (requests)
+# -------------------------------
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are ours (jittered, status-aware), so the adapter does none.
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def get(url: str, endpoint: str = "default", **kwargs: Any) -> requests.Response:
+    """
+    GET through the shared keep-alive session, retrying connection errors,
+    timeouts and 429/5xx responses. The last response is returned as-is, so
+    callers keep their own status handling. Recorded/replayed when
+    CASSETTE_MODE is set.
+    """
+    if cassette.CASSETTE.active:
+        return cassette.CASSETTE.call(
+            "http",
+            cassette.http_request(url, endpoint, kwargs.get("params")),
+            lambda: _get(url, endpoint, **kwargs),
+            encode=cassette.encode_response,
+            decode=cassette.requests_response,
+        )
+    return _get(url, endpoint, **kwargs)
+
+def _get(url: str, endpoint: str, **kwargs: Any) -> requests.Response:
+    kwargs.setdefault("timeout", timeout_for(endpoint))
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        try:
+            # Held for the request only, not the backoff sleep.
+            with limit_for(endpoint):
+                res = get_session().get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"[DEBUG] {endpoint} request failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        if res.status_code in RETRY_STATUSES and attempt < HTTP_MAX_RETRIES:
+            delay = backoff_delay(attempt, res.headers.get("Retry-After"))
+            print(f"[DEBUG] {endpoint} returned {res.status_code}; retry {attempt + 1} in {delay:.2f}s")
+            res.close()
+            time.sleep(delay)
+            continue
+        return res
+
+def get_json(url: str, endpoint: str = "default", **kwargs: Any) -> Any:
+    res = get(url, endpoint, **kwargs)
+    res.raise_for_status()
+    return res.json()
+
+# -------------------------------
+# ASYNC (httpx)
+# -------------------------------
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+def get_async_client() -> httpx.AsyncClient:
+    """One AsyncClient per process, created lazily inside the running loop."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_MAXSIZE * 4, max_keepalive_connections=HTTP_POOL_MAXSIZE),
+        )
+    return _async_client
+
+async def aget(url: str, endpoint: str = "default", params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> httpx.Response:
+    if cassette.CASSETTE.active:
+        return await cassette.CASSETTE.acall(
+            "http",
+            cassette.http_request(url, endpoint, params),
+            lambda: _aget(url, endpoint, params, **kwargs),
+            encode=cassette.encode_response,
+            decode=cassette.httpx_response,
+        )
+    return await _aget(url, endpoint, params, **kwargs)
+
+async def _aget(url: str, endpoint: str, params: Optional[Dict[str, Any]], **kwargs: Any) -> httpx.Response:
+    connect, read = timeout_for(endpoint)
+    kwargs.setdefault("timeout", httpx.Timeout(read, connect=connect))
+    if params is not None:
+        # requests drops None params, httpx would send them as empty strings.
+        params = {k: v for k, v in params.items() if v is not None}
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        try:
+            async with alimit_for(endpoint):
+                res = await get_async_client().get(url, params=params, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"[DEBUG] {endpoint} request failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        if res.status_code in RETRY_STATUSES and attempt < HTTP_MAX_RETRIES:
+            delay = backoff_delay(attempt, res.headers.get("Retry-After"))
+            print(f"[DEBUG] {endpoint} returned {res.status_code}; retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        return res
+
+async def aget_json(url: str, endpoint: str = "default", **kwargs: Any) -> Any:
+    res = await aget(url, endpoint, **kwargs)
+    res.raise_for_status()
+    return res.json()
+
+def close() -> None:
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+async def aclose() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
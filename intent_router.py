@@ -0,0 +1,172 @@
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import city_index
+
+# -------------------------------
+# PATTERNS
+# -------------------------------
+# Only phrasings we can extract *all* required arguments from are routed;
+# anything else (compound asks, bookings with airline details, chit-chat)
+# falls through to the LLM unchanged.
+
+USER_ID_PREFIX = re.compile(r"^\s*\[user_id:[^\]]*\]\s*", re.I)
+ISO_DATE = r"\d{4}-\d{2}-\d{2}"
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+WHEN = rf"(?:on\s+)?(?:for\s+)?(?P<date>{ISO_DATE}|today|tomorrow|next\s+(?:{'|'.join(WEEKDAYS)}))"
+
+FLIGHTS_RE = re.compile(
+    rf"\bflights?\b.*?\bfrom\s+(?P<src>.+?)\s+to\s+(?P<dst>.+?)\s+{WHEN}"
+    r"(?:\s+for\s+(?P<adults>\d+)\s+(?:adults?|people|persons?|passengers?))?\s*[.?!]*$",
+    re.I,
+)
+# "Book a flight ...", "flight QZ123": the user wants create_flight_booking, not a search.
+FLIGHT_BOOKING_RE = re.compile(r"\bbook\s+(?:a|the|this)\s+flight\b|\b(?:[A-Z]{2}|[A-Z]\d|\d[A-Z])\d{2,4}\b")
+IATA_RE = re.compile(r"[A-Z]{3}")
+HOTEL_WORD_RE = re.compile(r"\bhotels?\b", re.I)
+HOTEL_CITY_RE = re.compile(r"\bin\s+(?P<city>.+?)\s+(?:from|for)\b", re.I)
+HOTEL_DATES_RE = re.compile(rf"\bfrom\s+(?P<check_in>{ISO_DATE})\s+to\s+(?P<check_out>{ISO_DATE})\b", re.I)
+HOTEL_TAIL_RE = re.compile(
+    rf"^(?:(?:for\s+\d+\s+(?:adults?|people|guests?|rooms?)|from\s+{ISO_DATE}\s+to\s+{ISO_DATE})\s*)+[.?!]*$",
+    re.I,
+)
+ADULTS_RE = re.compile(r"\b(\d+)\s+(?:adults?|people|guests?)\b", re.I)
+ROOMS_RE = re.compile(r"\b(\d+)\s+rooms?\b", re.I)
+CITY_CODE_RE = re.compile(
+    r"^(?:what(?:'s| is)\s+the\s+|get\s+the\s+|give\s+me\s+the\s+)?(?:airport\s+|iata\s+)?code\s+(?:for|of)\s+(?P<city>[^?.!]+?)\s*[?.!]*$",
+    re.I,
+)
+BOOKINGS_RE = re.compile(
+    r"^(?:show|list|view|retrieve|get)\s+(?:me\s+)?(?:all\s+)?(?:of\s+)?(?:my\s+)?(?:past\s+|current\s+|upcoming\s+)?"
+    r"(?:flight\s+)?(?:bookings|reservations)(?:\s+i\s+have\s+made)?\s*[.?!]*$"
+    r"|^(?:what\s+are\s+)?my\s+(?:past\s+|current\s+|upcoming\s+)?(?:flight\s+)?(?:bookings|reservations)\s*[.?!]*$"
+    r"|^do\s+i\s+have\s+any\s+flights?\s+booked\s*[.?!]*$",
+    re.I,
+)
+
+
+class Route(NamedTuple):
+    tool: str
+    args: Dict[str, Any]
+    rule: str
+
+
+def resolve_when(text: str, today: Optional[datetime] = None) -> Optional[str]:
+    """'today' / 'tomorrow' / 'next friday' / 'YYYY-MM-DD' -> 'YYYY-MM-DD'."""
+    today = today or datetime.now()
+    text = " ".join(text.lower().split())
+    if re.fullmatch(ISO_DATE, text):
+        return text
+    if text in {"today", "tomorrow"}:
+        return (today + timedelta(days=0 if text == "today" else 1)).strftime("%Y-%m-%d")
+    if text.startswith("next "):
+        target = WEEKDAYS.index(text.split()[1])
+        ahead = (target - today.weekday() - 1) % 7 + 1  # always in the future, 1..7 days
+        return (today + timedelta(days=ahead)).strftime("%Y-%m-%d")
+    return None
+
+
+class IntentRouter:
+    """
+    Rule-based pre-router: returns a Route for formulaic requests so the
+    caller can run the tool directly, or None to fall back to the LLM.
+    """
+
+    def __init__(self, resolve_city: Optional[Callable[[str], str]] = None):
+        self._resolve_city = resolve_city or (lambda name: city_index.get_index().resolve(name))
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fell_through = 0
+        self.route_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.by_rule: Dict[str, int] = {}
+
+    def route(self, text: str, user_id: Optional[str] = None) -> Optional[Route]:
+        start = time.perf_counter()
+        route = self._match(USER_ID_PREFIX.sub("", text).strip(), user_id)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.route_seconds += elapsed
+            if route:
+                self.routed += 1
+                self.by_rule[route.rule] = self.by_rule.get(route.rule, 0) + 1
+            else:
+                self.fell_through += 1
+        return route
+
+    def _match(self, text: str, user_id: Optional[str]) -> Optional[Route]:
+        lowered = text.lower()
+        mentions_hotel = bool(HOTEL_WORD_RE.search(text))
+        mentions_flight = "flight" in lowered
+
+        m = BOOKINGS_RE.match(text)
+        if m and user_id:
+            return Route("get_user_flight_bookings", {"user_id": user_id}, "bookings")
+
+        m = CITY_CODE_RE.match(text)
+        if m:
+            return Route("city_code", {"city_name": m.group("city").strip()}, "city_code")
+
+        if mentions_flight and not mentions_hotel and not FLIGHT_BOOKING_RE.search(text):
+            m = FLIGHTS_RE.search(text)
+            if m:
+                src = self._airport(m.group("src"))
+                dst = self._airport(m.group("dst"))
+                date = resolve_when(m.group("date"))
+                if src and dst and date:
+                    args = {"departure_airport": src, "arrival_airport": dst, "outbound_date": date}
+                    if m.group("adults"):
+                        args["adults"] = int(m.group("adults"))
+                    return Route("flights_finder", args, "flights")
+
+        if mentions_hotel and not mentions_flight:
+            city_m = HOTEL_CITY_RE.search(text)
+            dates_m = HOTEL_DATES_RE.search(text)
+            # Everything after the city must be dates/guest counts we understood.
+            if city_m and dates_m and HOTEL_TAIL_RE.match(text[city_m.end("city"):].strip()):
+                args = {
+                    "q": city_m.group("city").strip(),
+                    "check_in_date": dates_m.group("check_in"),
+                    "check_out_date": dates_m.group("check_out"),
+                }
+                adults_m = ADULTS_RE.search(text)
+                rooms_m = ROOMS_RE.search(text)
+                if adults_m:
+                    args["adults"] = int(adults_m.group(1))
+                if rooms_m:
+                    args["rooms"] = int(rooms_m.group(1))
+                return Route("hotels_finder", args, "hotels")
+
+        return None
+
+    def _airport(self, name: str) -> Optional[str]:
+        name = name.strip()
+        if IATA_RE.fullmatch(name):
+            return name  # the user typed a code ("SFO"); trust it even if cities.json lacks it
+        code = self._resolve_city(name)
+        return None if code == "UNK" else code
+
+    def record_llm_latency(self, seconds: float) -> None:
+        """Feed in LLM round-trip times from the fallback path; used to estimate savings."""
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.routed + self.fell_through
+            avg_llm = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            return {
+                "routed": self.routed,
+                "fell_through": self.fell_through,
+                "hit_rate": round(self.routed / total, 3) if total else 0.0,
+                "by_rule": dict(self.by_rule),
+                "avg_route_ms": round(self.route_seconds / total * 1000, 3) if total else 0.0,
+                "avg_llm_ms": round(avg_llm * 1000, 1),
+                # None until the fallback path has reported at least one LLM latency
+                "est_saved_ms": round((self.routed * avg_llm - self.route_seconds) * 1000, 1) if self.llm_calls else None,
+            }
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import product
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import city_index
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+METRO_AIRPORTS_JSON = "metro_airports.json"
+# Most SerpAPI searches one metro search may fan out to. LON x NYC is 15 pairs;
+# above the budget airports are grouped into comma-separated searches instead.
+METRO_MAX_SEARCHES = int(os.getenv("METRO_MAX_SEARCHES", "6"))
+# Pool size for the fan-out; calls still queue on http_client's process-wide SerpAPI limit.
+METRO_CONCURRENCY = int(os.getenv("METRO_CONCURRENCY", "16"))
+METRO_TOP_RESULTS = int(os.getenv("METRO_TOP_RESULTS", "5"))
+
+# Its own pool: a flexible search runs metro searches from inside the flex pool,
+# and waiting on the same pool from its own workers could deadlock.
+_executor = ThreadPoolExecutor(max_workers=METRO_CONCURRENCY, thread_name_prefix="metro")
+_async_limit: Optional[asyncio.Semaphore] = None
+
+Flights = List[Dict[str, Any]]
+
+
+@lru_cache(maxsize=1)
+def metros(path: str = METRO_AIRPORTS_JSON) -> Dict[str, Dict[str, Any]]:
+    """Metro code -> {"city", "airports"}; empty when the file is missing."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@lru_cache(maxsize=1)
+def _by_city() -> Dict[str, str]:
+    return {city_index.normalize(m["city"]): code for code, m in metros().items()}
+
+def airports_for(code: str) -> List[str]:
+    """'LON' -> ['LHR', 'LGW', ...]; an airport code is searched as itself."""
+    metro = metros().get(code.strip().upper())
+    return list(metro["airports"]) if metro else [code]
+
+def resolve(index: city_index.CityIndex, query: str) -> str:
+    """
+    Like index.resolve, but a city with several airports ('London', 'NYC')
+    gives its metro code ('LON', 'NYC'). An airport code asked for by
+    name ('LHR') stays that airport.
+    """
+    if query.strip().upper() in metros():
+        return query.strip().upper()
+    match = index.best(query)
+    if match is None:
+        return "UNK"
+    if match.matched == city_index.normalize(match.code):
+        return match.code
+    return _by_city().get(city_index.normalize(match.city), match.code)
+
+def plan(departure: str, arrival: str, max_searches: int = METRO_MAX_SEARCHES) -> List[Tuple[str, str]]:
+    """
+    (departure_id, arrival_id) per search: every airport pair when that fits
+    in `max_searches`, otherwise Google Flights' comma-separated airport lists
+    ('LHR,LGW,STN'): one search per airport of one side if that fits, else one.
+    """
+    deps, arrs = airports_for(departure), airports_for(arrival)
+    todo = [(d, a) for d, a in product(deps, arrs) if d != a]
+    if len(todo) <= max_searches:
+        return todo
+    grouped = [
+        option for option in (
+            [(d, ",".join(arrs)) for d in deps],
+            [(",".join(deps), a) for a in arrs],
+        ) if len(option) <= max_searches
+    ]
+    return max(grouped, key=len) if grouped else [(",".join(deps), ",".join(arrs))]
+
+# -------------------------------
+# MERGE
+# -------------------------------
+
+def _signature(flight: Dict[str, Any]) -> Tuple:
+    # The same itinerary can come back from two pair searches (SerpAPI widens to nearby airports).
+    return tuple(
+        (leg.get("flight_number"), (leg.get("departure_airport") or {}).get("time"))
+        for leg in flight.get("flights", [])
+    )
+
+def _rank(flight: Dict[str, Any]) -> Tuple[float, float]:
+    price, duration = flight.get("price"), flight.get("total_duration")
+    return (
+        price if isinstance(price, (int, float)) else float("inf"),
+        duration if isinstance(duration, (int, float)) else float("inf"),
+    )
+
+def merge(by_pair: Dict[Tuple[str, str], Any], limit: int = METRO_TOP_RESULTS) -> Flights:
+    """
+    Per-pair results (a flight list, or an exception) -> one list, duplicates
+    kept at their lowest price, cheapest then shortest first. Raises the
+    first error only when every pair failed.
+    """
+    best: Dict[Tuple, Dict[str, Any]] = {}
+    errors = []
+    for pair, result in by_pair.items():
+        if isinstance(result, Exception):
+            print(f"[ERROR] flight search {pair[0]}->{pair[1]} failed: {result}")
+            errors.append(result)
+            continue
+        for flight in result:
+            key = _signature(flight) or id(flight)
+            if key not in best or _rank(flight) < _rank(best[key]):
+                best[key] = flight
+    if errors and len(errors) == len(by_pair):
+        raise errors[0]
+    return sorted(best.values(), key=_rank)[:limit]
+
+# -------------------------------
+# SEARCH
+# -------------------------------
+
+def search_pairs(search: Callable[[str, str], Flights], departure: str, arrival: str,
+                 max_searches: int = METRO_MAX_SEARCHES) -> Flights:
+    """search(dep, arr) for every search in plan(), concurrently, merged."""
+    todo = plan(departure, arrival, max_searches)
+    if len(todo) == 1:
+        return search(*todo[0])
+    start = time.perf_counter()
+    futures = {pair: _executor.submit(search, *pair) for pair in todo}
+    by_pair: Dict[Tuple[str, str], Any] = {}
+    for pair, future in futures.items():
+        try:
+            by_pair[pair] = future.result()
+        except Exception as e:
+            by_pair[pair] = e
+    print(f"[DEBUG] metro search {departure}->{arrival}: {len(todo)} searches in {time.perf_counter() - start:.2f}s")
+    return merge(by_pair)
+
+async def asearch_pairs(search: Callable[[str, str], Awaitable[Flights]], departure: str, arrival: str,
+                        max_searches: int = METRO_MAX_SEARCHES) -> Flights:
+    """asyncio counterpart of search_pairs."""
+    global _async_limit
+    todo = plan(departure, arrival, max_searches)
+    if len(todo) == 1:
+        return await search(*todo[0])
+    if _async_limit is None:
+        _async_limit = asyncio.Semaphore(METRO_CONCURRENCY)
+    start = time.perf_counter()
+
+    async def one(pair: Tuple[str, str]) -> Any:
+        async with _async_limit:
+            return await search(*pair)
+
+    results = await asyncio.gather(*(one(pair) for pair in todo), return_exceptions=True)
+    print(f"[DEBUG] metro search {departure}->{arrival}: {len(todo)} searches in {time.perf_counter() - start:.2f}s")
+    return merge(dict(zip(todo, results)))
@@ -0,0 +1,113 @@
+import atexit
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import pymongo
+from pymongo import AsyncMongoClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB = os.getenv("MONGO_DB", "test")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "1"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# -------------------------------
+# PROCESS-WIDE CLIENTS
+# -------------------------------
+# MongoClient is thread-safe and owns its own connection pool, so every tool
+# shares one instead of paying a TCP/TLS handshake and server discovery per call.
+
+_client: Optional[pymongo.MongoClient] = None
+_async_client: Optional[AsyncMongoClient] = None
+_lock = threading.Lock()
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+
+def get_client() -> pymongo.MongoClient:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                print(f"[DEBUG] Creating shared MongoClient (maxPoolSize={MONGO_MAX_POOL_SIZE})")
+                _client = pymongo.MongoClient(MONGO_URI, **_client_options())
+    return _client
+
+def get_db(name: str = MONGO_DB):
+    return get_client()[name]
+
+def get_async_client() -> AsyncMongoClient:
+    """Shared AsyncMongoClient; create and use it from the same event loop."""
+    global _async_client
+    if _async_client is None:
+        print(f"[DEBUG] Creating shared AsyncMongoClient (maxPoolSize={MONGO_MAX_POOL_SIZE})")
+        _async_client = AsyncMongoClient(MONGO_URI, **_client_options())
+    return _async_client
+
+def get_async_db(name: str = MONGO_DB):
+    return get_async_client()[name]
+
+# -------------------------------
+# LIFECYCLE
+# -------------------------------
+
+def warm_up() -> bool:
+    """Open the pool and ping the server so the first booking call is not the slow one."""
+    try:
+        get_client().admin.command("ping")
+        print("[DEBUG] MongoDB warm-up ping OK")
+        return True
+    except Exception as e:
+        print(f"[ERROR] MongoDB warm-up failed: {e}")
+        return False
+
+async def awarm_up() -> bool:
+    try:
+        await get_async_client().admin.command("ping")
+        print("[DEBUG] MongoDB async warm-up ping OK")
+        return True
+    except Exception as e:
+        print(f"[ERROR] MongoDB async warm-up failed: {e}")
+        return False
+
+def health_check() -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        return {
+            "ok": True,
+            "ping_ms": round((time.perf_counter() - start) * 1000, 2),
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+        }
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+def close() -> None:
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            print("[DEBUG] Closed shared MongoClient")
+
+async def aclose() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+        print("[DEBUG] Closed shared AsyncMongoClient")
+
+atexit.register(close)
@@ -0,0 +1,160 @@
+import os
+from typing import Any, Dict, List, Optional
+
+import ollama
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# How long Ollama keeps the model (and its KV cache) loaded after a call.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# "prefix":  ollama.chat with an append-only message list; the runner reuses
+#            the KV cache for the longest prefix it has already evaluated.
+# "context": ollama.generate with the context tokens of the previous turn, so
+#            only the new turn is sent and evaluated.
+OLLAMA_SESSION_MODE = os.getenv("OLLAMA_SESSION_MODE", "prefix")
+# Kept fixed: a request with a different num_ctx reloads the model and drops its cache.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# A load_duration above this means the model had been unloaded (cold start).
+COLD_LOAD_MS = float(os.getenv("OLLAMA_COLD_LOAD_MS", "500"))
+
+
+def _get(response: Any, name: str) -> Any:
+    # dict in older ollama clients, a response object in newer ones
+    if isinstance(response, dict):
+        return response.get(name)
+    return getattr(response, name, None)
+
+def timings(response: Any) -> Dict[str, Any]:
+    """Ollama's per-call counters, durations converted from ns to ms."""
+    def ms(name):
+        value = _get(response, name)
+        return round(value / 1e6, 1) if value is not None else None
+
+    return {
+        "load_ms": ms("load_duration"),
+        "prompt_eval_count": _get(response, "prompt_eval_count"),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "eval_count": _get(response, "eval_count"),
+        "eval_ms": ms("eval_duration"),
+        "total_ms": ms("total_duration"),
+    }
+
+def request_options() -> Dict[str, Any]:
+    """keep_alive/options for one-off ollama.chat calls that should share the warm model."""
+    return {"keep_alive": OLLAMA_KEEP_ALIVE, "options": {"num_ctx": OLLAMA_NUM_CTX}}
+
+
+class OllamaSession:
+    """
+    One conversation with a local Ollama model that avoids re-evaluating
+    the system prompt and earlier turns on every call.
+
+    If the model was unloaded in between, the next call simply pays the
+    full prefill again (reported as a cold start). If the server rejects
+    the saved context (restart, different model), the session drops it and
+    continues in "prefix" mode from the full transcript.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        system: str,
+        mode: str = OLLAMA_SESSION_MODE,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        num_ctx: int = OLLAMA_NUM_CTX,
+        format: Optional[Any] = None,
+    ):
+        if mode not in {"prefix", "context"}:
+            raise ValueError(f"Unknown Ollama session mode: {mode}")
+        self.model = model
+        self.system = system
+        self.mode = mode
+        self.keep_alive = keep_alive
+        self.options = {"num_ctx": num_ctx}
+        # e.g. a JSON schema for structured replies; sent with every call
+        self.format_kwargs = {"format": format} if format else {}
+        self.messages: List[Dict[str, str]] = [{"role": "system", "content": system}]
+        self.context: Optional[List[int]] = None
+        self._pending: List[str] = []  # context mode: text to prepend to the next prompt
+        self.turns: List[Dict[str, Any]] = []
+
+    def ask(self, text: str) -> str:
+        """Send one user turn and return the model's reply."""
+        if self.mode == "context":
+            try:
+                content = self._ask_context(text)
+            except ollama.ResponseError as e:
+                print(f"[DEBUG] Ollama rejected saved context ({e}); falling back to prefix mode")
+                self.mode = "prefix"
+                self.context = None
+                content = self._ask_prefix(text)
+        else:
+            content = self._ask_prefix(text)
+        self.messages.append({"role": "user", "content": text})
+        self.messages.append({"role": "assistant", "content": content})
+        return content
+
+    def add_result(self, text: str) -> None:
+        """Record something the model did not generate (e.g. a tool result) as part of the conversation."""
+        self.messages.append({"role": "assistant", "content": text})
+        self._pending.append(text)
+
+    def _ask_prefix(self, text: str) -> str:
+        response = ollama.chat(
+            model=self.model,
+            messages=[*self.messages, {"role": "user", "content": text}],
+            keep_alive=self.keep_alive,
+            options=self.options,
+            **self.format_kwargs,
+        )
+        self._pending.clear()  # already part of self.messages
+        self._record(response)
+        return response["message"]["content"]
+
+    def _ask_context(self, text: str) -> str:
+        prompt = "\n\n".join([*(f"Tool result:\n{p}" for p in self._pending), text])
+        kwargs: Dict[str, Any] = {"context": self.context}
+        if self.context is None:
+            if len(self.messages) > 1:
+                # History exists but its tokens are gone; only a full resend is correct.
+                self.mode = "prefix"
+                return self._ask_prefix(text)
+            kwargs = {"system": self.system}  # the system prompt is only evaluated once
+        response = ollama.generate(
+            model=self.model,
+            prompt=prompt,
+            keep_alive=self.keep_alive,
+            options=self.options,
+            **self.format_kwargs,
+            **kwargs,
+        )
+        self._pending.clear()
+        self.context = _get(response, "context")
+        self._record(response)
+        return response["response"]
+
+    def _record(self, response: Any) -> None:
+        turn = {"turn": len(self.turns) + 1, "mode": self.mode, **timings(response)}
+        turn["cold_start"] = (turn["load_ms"] or 0) > COLD_LOAD_MS
+        self.turns.append(turn)
+        print(f"[DEBUG] ollama turn: {turn}")
+
+    def reset(self) -> None:
+        self.messages = self.messages[:1]
+        self.context = None
+        self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals across turns; compare prompt_eval_ms with the mode off to see the saved prefill."""
+        def total(key):
+            return round(sum(t[key] or 0 for t in self.turns), 1)
+
+        return {
+            "turns": len(self.turns),
+            "mode": self.mode,
+            "cold_starts": sum(t["cold_start"] for t in self.turns),
+            "prompt_eval_count": total("prompt_eval_count"),
+            "prompt_eval_ms": total("prompt_eval_ms"),
+            "eval_ms": total("eval_ms"),
+        }
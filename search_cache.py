@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Seconds a SerpAPI response stays fresh, per engine. Fares move faster than
+# hotel listings, so flights get the shorter window.
+SEARCH_CACHE_TTLS = {
+    "google_flights": int(os.getenv("SEARCH_CACHE_TTL_FLIGHTS", "900")),
+    "google_hotels": int(os.getenv("SEARCH_CACHE_TTL_HOTELS", "3600")),
+}
+SEARCH_CACHE_DEFAULT_TTL = int(os.getenv("SEARCH_CACHE_TTL_DEFAULT", "600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+# Optional SQLite file so cached searches survive a restart; unset = memory only.
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH")
+
+DATE_PARAMS = ("outbound_date", "return_date", "check_in_date", "check_out_date")
+AIRPORT_PARAMS = ("departure_id", "arrival_id")
+# Never part of the key: the same search is the same search whoever pays for it.
+SECRET_PARAMS = ("api_key",)
+
+# -------------------------------
+# KEY NORMALIZATION
+# -------------------------------
+
+def resolve_date(value: Any) -> Any:
+    """Turn 'today'/'tomorrow' into 'YYYY-MM-DD'; anything else passes through."""
+    if isinstance(value, str) and value.strip().lower() in {"today", "tomorrow"}:
+        delta = 0 if value.strip().lower() == "today" else 1
+        return (datetime.now() + timedelta(days=delta)).strftime("%Y-%m-%d")
+    return value
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Request params with relative dates resolved and airport codes upper-cased."""
+    normalized = {}
+    for k, v in params.items():
+        if v is None:
+            continue
+        if k in DATE_PARAMS:
+            v = resolve_date(v)
+        elif k in AIRPORT_PARAMS and isinstance(v, str):
+            v = v.strip().upper()
+        normalized[k] = v
+    return normalized
+
+def cache_key(params: Dict[str, Any]) -> str:
+    keyed = {k: v for k, v in normalize_params(params).items() if k not in SECRET_PARAMS}
+    if isinstance(keyed.get("q"), str):
+        keyed["q"] = " ".join(keyed["q"].casefold().split())
+    # str() so 1 and "1" (LLM output is not consistent about types) share a key
+    blob = json.dumps({k: str(v) for k, v in keyed.items()}, sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+# -------------------------------
+# CACHE
+# -------------------------------
+
+class SearchCache:
+    """
+    TTL + LRU cache for SerpAPI responses, optionally backed by SQLite.
+
+    The in-memory layer holds at most `max_entries` responses and evicts the
+    least recently used; the disk layer (if `path` is set) is consulted on a
+    memory miss and written through on every store.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, int]] = None,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+        path: Optional[str] = SEARCH_CACHE_PATH,
+        default_ttl: int = SEARCH_CACHE_DEFAULT_TTL,
+    ):
+        self.ttls = dict(SEARCH_CACHE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "stores": 0}
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, engine TEXT, expires_at REAL, value TEXT)"
+            )
+            self._db.execute("DELETE FROM search_cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def ttl_for(self, engine: Optional[str]) -> int:
+        return self.ttls.get(engine, self.default_ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self.counters["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[0] > now:
+                    value = json.loads(row[1])
+                    self._remember(key, row[0], value)
+                    self.counters["disk_hits"] += 1
+                    return value
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: str, engine: Optional[str], value: Any) -> None:
+        expires_at = time.time() + self.ttl_for(engine)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self.counters["stores"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, engine, expires_at, value) VALUES (?, ?, ?, ?)",
+                    (key, engine, expires_at, json.dumps(value)),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        # caller holds self._lock
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def get_or_fetch(self, params: Dict[str, Any], fetch: Callable[[Dict[str, Any]], Any]) -> Any:
+        """
+        Return the cached response for `params`, or call `fetch` with the
+        normalized params and cache what it returns. Exceptions and SerpAPI
+        error payloads are not cached.
+        """
+        key = cache_key(params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = fetch(normalize_params(params))
+        if not (isinstance(value, dict) and "error" in value):
+            self.put(key, params.get("engine"), value)
+        return value
+
+    async def aget_or_fetch(self, params: Dict[str, Any], fetch: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Any:
+        key = cache_key(params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = await fetch(normalize_params(params))
+        if not (isinstance(value, dict) and "error" in value):
+            self.put(key, params.get("engine"), value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hit_rate = (self.counters["hits"] + self.counters["disk_hits"]) / lookups if lookups else 0.0
+            return {**self.counters, "entries": len(self._entries), "hit_rate": round(hit_rate, 3)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM search_cache")
+                self._db.commit()
+
+
+# Shared by every flights_finder/hotels_finder in the process.
+SEARCH_CACHE = SearchCache()
+
+def get_or_fetch(params: Dict[str, Any], fetch: Callable[[Dict[str, Any]], Any]) -> Any:
+    return SEARCH_CACHE.get_or_fetch(params, fetch)
+
+async def aget_or_fetch(params: Dict[str, Any], fetch: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Any:
+    return await SEARCH_CACHE.aget_or_fetch(params, fetch)
+
+def stats() -> Dict[str, Any]:
+    return SEARCH_CACHE.stats()
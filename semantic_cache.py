@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Opt-in: a wrong cached answer is worse than a slow right one.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+# Cosine similarity a stored question needs to be served as the answer.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+EMBEDDING_DIM = 1024
+# Seconds an answer stays fresh, by the tools that produced it. An answer
+# lives as long as its most perishable tool; 0 means never cache it
+# (per-user data, or calls with side effects).
+TOOL_TTLS = {
+    "OpenMeteoTool": 10 * 60,
+    "wikipedia": 7 * 24 * 3600,
+    "flights_finder": 15 * 60,
+    "flexible_flights_finder": 15 * 60,
+    "hotels_finder": 60 * 60,
+    "city_code": 30 * 24 * 3600,
+    "get_user_flight_bookings": 0,
+    "create_flight_booking": 0,
+}
+# Answers that used no tool (general knowledge, chit-chat).
+NO_TOOL_TTL = int(os.getenv("SEMANTIC_CACHE_TTL_NO_TOOL", str(24 * 3600)))
+# Tools not listed above.
+UNKNOWN_TOOL_TTL = int(os.getenv("SEMANTIC_CACHE_TTL_DEFAULT", "600"))
+
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "what", "whats", "how", "hows", "in", "at",
+    "of", "for", "to", "me", "i", "my", "please", "can", "you", "tell", "like",
+    "it", "be", "will", "do", "does", "about",
+}
+# Tokens that change the answer even when the rest of the question is the
+# same ("flights on the 3rd" vs "on the 4th"), plus the word after "from"/"to"
+# so a route keeps its direction: two questions only share an answer if these
+# match exactly, in order (check-in before check-out).
+ANCHOR_RE = re.compile(
+    r"\b(?:from|to) \w+|\d+|today|tonight|tomorrow|yesterday|weekend"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+)
+# Words whose next word is kept as a bigram feature, so "from delhi to mumbai"
+# and "from mumbai to delhi" embed differently.
+DIRECTION_WORDS = {"from", "to"}
+
+
+class CacheHit(NamedTuple):
+    answer: str
+    question: str  # the stored question that matched
+    score: float
+    age: float  # seconds since the answer was stored
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r"^\s*\[user_id:[^\]]*\]\s*", "", text)
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.casefold().replace("'", "")).split())
+
+def anchors(text: str) -> tuple:
+    return tuple(ANCHOR_RE.findall(normalize(text)))
+
+def _bucket(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIM
+
+def embed(text: str) -> np.ndarray:
+    """
+    Hashed bag of words plus character trigrams, L2-normalized. Words carry
+    most of the weight (different city = different answer); trigrams absorb
+    typos and inflections ("flights"/"flight"); from/to bigrams keep direction.
+    """
+    vec = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = normalize(text).split()
+    for prev, word in zip([""] + words, words):
+        if prev in DIRECTION_WORDS:
+            vec[_bucket(f"b:{prev} {word}")] += 2.0
+        if word in STOP_WORDS:
+            continue
+        vec[_bucket("w:" + word)] += 2.0
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            vec[_bucket("c:" + padded[i:i + 3])] += 0.5
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def ttl_for(tools_used: Iterable[str]) -> int:
+    ttls = [TOOL_TTLS.get(name, UNKNOWN_TOOL_TTL) for name in tools_used]
+    return min(ttls) if ttls else NO_TOOL_TTL
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour answer cache. Questions are embedded into one
+    preallocated matrix, so a lookup is a single matrix-vector product over
+    every live entry. Full: expired entries go first, then the least
+    recently used.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._vectors = np.zeros((max_entries, EMBEDDING_DIM), dtype=np.float32)
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "skipped": 0, "evictions": 0}
+
+    def lookup(self, question: str, scope: str = "") -> Optional[CacheHit]:
+        """Freshest good-enough answer to a question like `question`, or None."""
+        vec = embed(question)
+        if not vec.any():
+            return None
+        wanted = anchors(question)
+        now = time.time()
+        with self._lock:
+            fresh = self._live & (self._expires_at > now)
+            scores = np.where(fresh, self._vectors @ vec, -1.0)
+            # A handful of best candidates; usually the first one decides.
+            for slot in np.argsort(scores)[::-1][:5]:
+                score = float(scores[slot])
+                if score < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry["scope"] != scope or entry["anchors"] != wanted:
+                    continue
+                self._last_used[slot] = now
+                entry["hits"] += 1
+                self.counters["hits"] += 1
+                return CacheHit(entry["answer"], entry["question"], round(score, 3), now - entry["stored_at"])
+            self.counters["misses"] += 1
+            return None
+
+    def store(self, question: str, answer: str, tools_used: Iterable[str] = (), scope: str = "") -> bool:
+        """Remember `answer`; returns False if its tools make it uncacheable."""
+        tools_used = list(tools_used)
+        ttl = ttl_for(tools_used)
+        vec = embed(question)
+        if ttl <= 0 or not answer or not vec.any():
+            with self._lock:
+                self.counters["skipped"] += 1
+            return False
+        now = time.time()
+        with self._lock:
+            slot = self._free_slot(now)
+            self._vectors[slot] = vec
+            self._live[slot] = True
+            self._expires_at[slot] = now + ttl
+            self._last_used[slot] = now
+            self._entries[slot] = {
+                "question": question,
+                "answer": answer,
+                "tools": tools_used,
+                "scope": scope,
+                "anchors": anchors(question),
+                "stored_at": now,
+                "hits": 0,
+            }
+            self.counters["stores"] += 1
+        return True
+
+    def _free_slot(self, now: float) -> int:
+        # caller holds self._lock
+        dead = np.flatnonzero(~self._live | (self._expires_at <= now))
+        if dead.size:
+            return int(dead[0])
+        self.counters["evictions"] += 1
+        return int(np.argmin(self._last_used))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": int((self._live & (self._expires_at > time.time())).sum()),
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._live[:] = False
+            self._entries = [None] * self.max_entries
+
+
+# One per process, shared by every conversation. The wrappers are no-ops
+# unless SEMANTIC_CACHE=1.
+SEMANTIC_CACHE = SemanticCache()
+
+def lookup(question: str, scope: str = "") -> Optional[CacheHit]:
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    hit = SEMANTIC_CACHE.lookup(question, scope)
+    if hit:
+        print(f"[DEBUG] semantic cache hit ({hit.score}, {hit.age:.0f}s old): '{question}' ~ '{hit.question}'")
+    return hit
+
+def store(question: str, answer: str, tools_used: Iterable[str] = (), scope: str = "") -> bool:
+    if not SEMANTIC_CACHE_ENABLED:
+        return False
+    return SEMANTIC_CACHE.store(question, answer, tools_used, scope)
+
+def stats() -> Dict[str, Any]:
+    return SEMANTIC_CACHE.stats()
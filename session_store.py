@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, HumanMessage
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Per session: the prompt only ever sees this much history.
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "10"))
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "2000"))
+# Seconds without a message before a session is dropped.
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
+# Across all sessions: past this, least recently used sessions are dropped.
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+def estimate_tokens(message: BaseMessage) -> int:
+    # ~4 characters per token is close enough for a cap.
+    return len(_text(message)) // 4 + 4
+
+def message_bytes(message: BaseMessage) -> int:
+    return len(_text(message).encode("utf-8"))
+
+
+class BoundedChatHistory(BaseChatMessageHistory):
+    """
+    Chat history that drops its oldest turns (a human message and everything
+    up to the next one) once it holds more than `max_turns` turns or
+    `max_tokens` estimated tokens. The newest turn is always kept.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = SESSION_MAX_TURNS,
+        max_tokens: int = SESSION_MAX_TOKENS,
+        on_resize: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.messages: List[BaseMessage] = []
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.bytes = 0
+        self._on_resize = on_resize  # (byte delta, messages trimmed)
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        before = self.bytes
+        for message in messages:
+            self.messages.append(message)
+            self.tokens += estimate_tokens(message)
+            self.bytes += message_bytes(message)
+        trimmed = self._trim()
+        if self._on_resize:
+            self._on_resize(self.bytes - before, trimmed)
+
+    def _turn_starts(self) -> List[int]:
+        return [i for i, m in enumerate(self.messages) if isinstance(m, HumanMessage)]
+
+    def _trim(self) -> int:
+        trimmed = 0
+        starts = self._turn_starts()
+        while len(starts) > 1 and (len(starts) > self.max_turns or self.tokens > self.max_tokens):
+            for message in self.messages[:starts[1]]:
+                self.tokens -= estimate_tokens(message)
+                self.bytes -= message_bytes(message)
+            trimmed += starts[1]
+            del self.messages[:starts[1]]
+            starts = [i - starts[1] for i in starts[1:]]
+        return trimmed
+
+    def clear(self) -> None:
+        freed = self.bytes
+        self.messages = []
+        self.tokens = 0
+        self.bytes = 0
+        if self._on_resize:
+            self._on_resize(-freed, 0)
+
+
+class SessionStore:
+    """
+    One BoundedChatHistory per session id, for RunnableWithMessageHistory's
+    get_session_history. Idle sessions are swept on access; the total byte
+    ceiling is enforced by dropping least recently used sessions.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = SESSION_MAX_TURNS,
+        max_tokens: int = SESSION_MAX_TOKENS,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        max_bytes: int = SESSION_MAX_BYTES,
+    ):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, BoundedChatHistory]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.counters = {"created": 0, "evicted_idle": 0, "evicted_lru": 0, "trimmed_messages": 0}
+
+    def get(self, session_id: str) -> BoundedChatHistory:
+        now = time.monotonic()
+        with self._lock:
+            self._sweep_idle(now)
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = BoundedChatHistory(
+                    self.max_turns,
+                    self.max_tokens,
+                    on_resize=lambda delta, trimmed, sid=session_id: self._resized(sid, delta, trimmed),
+                )
+                self._sessions[session_id] = history
+                self.counters["created"] += 1
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = now
+            return history
+
+    def _sweep_idle(self, now: float) -> None:
+        # caller holds self._lock; oldest first, so stop at the first live one
+        while self._sessions:
+            session_id = next(iter(self._sessions))
+            if now - self._last_used[session_id] < self.idle_timeout:
+                break
+            self._drop(session_id)
+            self.counters["evicted_idle"] += 1
+
+    def _resized(self, session_id: str, delta: int, trimmed: int) -> None:
+        with self._lock:
+            if session_id not in self._sessions:
+                return  # evicted while a chain still held the history
+            self._bytes += delta
+            self.counters["trimmed_messages"] += trimmed
+            # Never evict the session that is being written to.
+            while self._bytes > self.max_bytes and len(self._sessions) > 1:
+                oldest = next(iter(self._sessions))
+                if oldest == session_id:
+                    self._sessions.move_to_end(session_id)
+                    continue
+                self._drop(oldest)
+                self.counters["evicted_lru"] += 1
+
+    def _drop(self, session_id: str) -> None:
+        # caller holds self._lock
+        history = self._sessions.pop(session_id)
+        self._last_used.pop(session_id, None)
+        self._bytes -= history.bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "live_sessions": len(self._sessions),
+                "bytes_held": self._bytes,
+                "messages_held": sum(len(h.messages) for h in self._sessions.values()),
+            }
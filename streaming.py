@@ -0,0 +1,92 @@
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Frame type for in-progress replies; the API server relays these without
+# saving them, and the final frame (same stream_id, no type) replaces them.
+PARTIAL_TYPE = "partial"
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+# Minimum seconds between partial frames, so a fast model does not send one frame per token.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+
+
+class ReplyStream:
+    """
+    Accumulates LLM output for one reply and turns it into WebSocket frames.
+
+    Partial frames carry the full visible text so far, so a dropped frame
+    costs nothing. Text from the first of `hold_markers` onwards is held back:
+    that is where a JSON tool call starts, and it must not reach the user.
+    """
+
+    def __init__(self, sender: str, recipient: str, hold_markers: Iterable[str] = ()):
+        self.stream_id = uuid.uuid4().hex
+        self.sender = sender
+        self.recipient = recipient
+        self.hold_markers = tuple(hold_markers)
+        self.text = ""
+        self.turn: Any = None
+        self.started_at = time.perf_counter()
+        self.first_frame_at: Optional[float] = None
+        self.frames_sent = 0
+        self._sent_text = ""
+        self._last_flush = 0.0
+        self._holding = False
+
+    def visible_text(self) -> str:
+        if self._holding:
+            return self._sent_text
+        cut = len(self.text)
+        for marker in self.hold_markers:
+            idx = self.text.find(marker)
+            if idx != -1:
+                cut = min(cut, idx)
+        return self.text[:cut]
+
+    def hold(self) -> None:
+        """Send nothing more for this turn (it turned out to be a tool call)."""
+        self._holding = True
+
+    def feed(self, delta: str) -> Optional[Dict[str, Any]]:
+        """Add a chunk; returns a partial frame to send, or None if throttled/unchanged."""
+        self.text += delta
+        if time.perf_counter() - self._last_flush < STREAM_FLUSH_INTERVAL:
+            return None
+        return self.flush()
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        visible = self.visible_text()
+        if not visible.strip() or visible == self._sent_text:
+            return None
+        self._sent_text = visible
+        self._last_flush = time.perf_counter()
+        self.frames_sent += 1
+        if self.first_frame_at is None:
+            self.first_frame_at = self._last_flush
+            print(f"[DEBUG] stream {self.stream_id}: first frame after {self.ttfb_ms()} ms")
+        return self.frame(visible, type=PARTIAL_TYPE)
+
+    def start_turn(self, turn: Any) -> None:
+        """Start a new LLM turn (e.g. after a tool call) in the same bubble."""
+        if turn != self.turn:
+            self.turn = turn
+            self.text = ""
+            self._holding = False
+
+    def frame(self, text: str, **extra: Any) -> Dict[str, Any]:
+        return {
+            "sender": self.sender,
+            "recipient": self.recipient,
+            "text": text,
+            "stream_id": self.stream_id,
+            **extra,
+        }
+
+    def ttfb_ms(self) -> Optional[float]:
+        if self.first_frame_at is None:
+            return None
+        return round((self.first_frame_at - self.started_at) * 1000, 1)
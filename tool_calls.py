@@ -0,0 +1,453 @@
+import inspect
+import json
+import os
+import re
+import threading
+import typing
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Constrain Ollama replies to REPLY_SCHEMA (ollama.chat format=...), so a
+# tool call is valid JSON with the right parameter names on the first pass.
+STRUCTURED_TOOL_CALLS = os.getenv("STRUCTURED_TOOL_CALLS", "1") == "1"
+REPLY_KEY = "reply"
+# Names small models use instead of ours; only applied to parameters the tool actually has.
+PARAM_ALIASES = {
+    "city_name": ["city", "name", "cityname", "location"],
+    "departure_airport": ["origin", "origin_airport", "origin_city", "from", "from_airport", "from_city",
+                          "departure", "departure_city", "source"],
+    "arrival_airport": ["destination", "destination_airport", "destination_city", "to", "to_airport",
+                        "to_city", "arrival", "arrival_city"],
+    "outbound_date": ["date", "departure_date", "travel_date", "depart_date"],
+    "return_date": ["inbound_date", "return"],
+    "start_date": ["outbound_date", "date", "from_date", "earliest_date", "departure_date"],
+    "end_date": ["to_date", "until", "latest_date", "last_date"],
+    "adults": ["passengers", "travellers", "travelers", "guests", "people"],
+    "q": ["city", "location", "query", "destination", "place"],
+    "check_in_date": ["checkin", "check_in", "checkin_date", "arrival_date"],
+    "check_out_date": ["checkout", "check_out", "checkout_date", "departure_date"],
+    "flightno": ["flight_number", "flight_no", "flight"],
+    "dateOfJourney": ["date", "journey_date", "travel_date"],
+    "totalPrice": ["price", "total_price", "amount"],
+    "numberOfTickets": ["tickets", "number_of_tickets", "passengers"],
+}
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+FORMAT_INSTRUCTIONS = f"""
+Always answer with exactly one JSON object:
+- to call a tool: {{"name": "<tool_name>", "parameters": {{...}}}}
+- otherwise: {{"{REPLY_KEY}": "<your answer to the user>"}}
+"""
+
+
+class ToolCallError(ValueError):
+    """A tool call that names an unknown tool or misses required parameters."""
+
+
+class ParsedReply(NamedTuple):
+    call: Optional[Dict[str, Any]]  # {"name", "parameters"}, ready to invoke
+    text: str                       # what to show the user when there is no call
+    error: Optional[str] = None
+
+
+def _key(name: str) -> str:
+    # departureAirport / departure-airport / Departure Airport -> departureairport
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+def _param_type(annotation: Any) -> Tuple[Any, bool]:
+    """(base type, nullable) for an annotation like Optional[int]."""
+    args = typing.get_args(annotation)
+    if type(None) in args:
+        rest = [a for a in args if a is not type(None)]
+        return (rest[0] if rest else str), True
+    return annotation, False
+
+def _params(fn: Callable) -> List[inspect.Parameter]:
+    return [p for p in inspect.signature(fn).parameters.values()
+            if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)]
+
+def _hints(fn: Callable) -> Dict[str, Any]:
+    try:
+        return typing.get_type_hints(fn)
+    except Exception:
+        return {}
+
+# -------------------------------
+# SCHEMA
+# -------------------------------
+
+def parameters_schema(fn: Callable) -> Dict[str, Any]:
+    """JSON schema for a tool's keyword arguments, from its signature and annotations."""
+    hints = _hints(fn)
+    properties, required = {}, []
+    for p in _params(fn):
+        base, nullable = _param_type(hints.get(p.name, str))
+        if p.default is None:
+            nullable = True
+        json_type = JSON_TYPES.get(base, "string")
+        properties[p.name] = {"type": [json_type, "null"] if nullable else json_type}
+        if p.default is inspect.Parameter.empty:
+            required.append(p.name)
+    return {"type": "object", "properties": properties, "required": required}
+
+def reply_schema(tools: Mapping[str, Callable]) -> Dict[str, Any]:
+    """One tool call with that tool's exact parameters, or a plain {"reply": ...}."""
+    options = [
+        {
+            "type": "object",
+            "properties": {"name": {"const": name}, "parameters": parameters_schema(fn)},
+            "required": ["name", "parameters"],
+        }
+        for name, fn in tools.items()
+    ]
+    options.append({"type": "object", "properties": {REPLY_KEY: {"type": "string"}}, "required": [REPLY_KEY]})
+    return {"anyOf": options}
+
+# -------------------------------
+# REPAIR / COERCION
+# -------------------------------
+
+def _coerce(value: Any, base: Any, nullable: bool) -> Any:
+    if value is None or (nullable and isinstance(value, str) and value.strip().lower() in {"", "null", "none"}):
+        return None
+    if base is int:
+        return int(float(re.sub(r"[^\d.\-]", "", value))) if isinstance(value, str) else int(value)
+    if base is float:
+        return float(re.sub(r"[^\d.\-]", "", value)) if isinstance(value, str) else float(value)
+    if base is str and not isinstance(value, str):
+        return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    return value
+
+def coerce_args(fn: Callable, args: Dict[str, Any],
+                defaults: Optional[Mapping[str, Any]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Map `args` onto fn's parameters: exact names, then the same name in
+    another casing, then PARAM_ALIASES, then `defaults` (e.g. the user id).
+    Values are converted to the annotated type and unknown arguments
+    dropped. Returns (kwargs, fixes); raises ToolCallError if a required
+    parameter is still missing.
+    """
+    hints = _hints(fn)
+    params = _params(fn)
+    remaining = dict(args)
+    kwargs: Dict[str, Any] = {}
+    fixes: List[str] = []
+
+    for p in params:
+        if p.name in remaining:
+            kwargs[p.name] = remaining.pop(p.name)
+    for p in params:
+        if p.name in kwargs:
+            continue
+        by_key = {_key(k): k for k in remaining}
+        for candidate in [p.name, *PARAM_ALIASES.get(p.name, [])]:
+            found = by_key.get(_key(candidate))
+            if found is not None:
+                kwargs[p.name] = remaining.pop(found)
+                fixes.append(f"{found}->{p.name}")
+                break
+    fixes.extend(f"dropped {k}" for k in remaining)
+    for p in params:
+        if kwargs.get(p.name) is None and p.name in (defaults or {}):
+            kwargs[p.name] = defaults[p.name]
+
+    for p in params:
+        if p.name not in kwargs:
+            continue
+        base, nullable = _param_type(hints.get(p.name, Any))
+        try:
+            value = _coerce(kwargs[p.name], base, nullable or p.default is None)
+        except (TypeError, ValueError):
+            raise ToolCallError(f"{p.name}={kwargs[p.name]!r} is not a valid {JSON_TYPES.get(base, base)}")
+        if value != kwargs[p.name] or type(value) is not type(kwargs[p.name]):
+            fixes.append(f"{p.name} as {type(value).__name__}")
+        kwargs[p.name] = value
+
+    missing = [p.name for p in params if p.default is inspect.Parameter.empty and kwargs.get(p.name) is None]
+    if missing:
+        raise ToolCallError(f"missing {', '.join(missing)}")
+    return kwargs, fixes
+
+def _envelope(obj: Dict[str, Any]) -> Tuple[Optional[str], Any]:
+    """(tool name, arguments) from the envelope shapes models produce."""
+    if isinstance(obj.get("function"), dict):  # OpenAI style
+        obj = obj["function"]
+    name = obj.get("name") or obj.get("tool") or obj.get("tool_name") or obj.get("action")
+    args = next((obj[k] for k in ("parameters", "arguments", "args", "action_input", "input") if k in obj), {})
+    if isinstance(args, str):
+        try:
+            args = json.loads(args)
+        except json.JSONDecodeError:
+            args = {}
+    return name, args if isinstance(args, dict) else {}
+
+# Keys only a tool-call envelope has; braces alone ("Hello {user}") are just prose.
+CALL_KEY_RE = re.compile(r'"(?:name|parameters|arguments|args|tool|tool_name|function|action|action_input)"\s*:')
+
+def looks_like_call(text: str) -> bool:
+    return bool(CALL_KEY_RE.search(text))
+
+def _extract_json(text: str) -> Optional[Any]:
+    """The outermost {...} of chatty or fenced output, if it parses."""
+    start, end = text.find("{"), text.rfind("}") + 1
+    if start == -1 or end == 0:
+        return None
+    try:
+        return json.loads(text[start:end])
+    except json.JSONDecodeError:
+        return None
+
+# -------------------------------
+# PARSING
+# -------------------------------
+
+_lock = threading.Lock()
+_counters = {"replies": 0, "strict_json": 0, "extracted_json": 0, "text": 0,
+             "tool_calls": 0, "repaired_calls": 0, "parse_failures": 0, "invalid_calls": 0}
+
+def _count(*names: str) -> None:
+    with _lock:
+        for name in names:
+            _counters[name] += 1
+
+def parse_reply(content: str, tools: Mapping[str, Callable],
+                defaults: Optional[Mapping[str, Any]] = None) -> ParsedReply:
+    """
+    Turn one model reply into a ready-to-run tool call or user-facing text.
+    Strict JSON is expected (structured output); anything else is repaired
+    where possible, and every failure is counted.
+    """
+    _count("replies")
+    try:
+        obj = json.loads(content)
+        _count("strict_json")
+    except (json.JSONDecodeError, TypeError):
+        obj = _extract_json(content)
+        if obj is None:
+            if looks_like_call(content):
+                _count("parse_failures")
+                print(f"[DEBUG] Unparseable tool call JSON in reply: {content[:200]}")
+                return ParsedReply(None, content, "the tool call was not valid JSON")
+            _count("text")
+            return ParsedReply(None, content)
+        _count("extracted_json")
+
+    return parse_object(obj, tools, defaults, content)
+
+def parse_object(obj: Any, tools: Mapping[str, Callable],
+                 defaults: Optional[Mapping[str, Any]] = None, content: str = "") -> ParsedReply:
+    """One decoded JSON value -> validated call, {"reply"} text, or error. `content` is the raw reply."""
+    content = content or json.dumps(obj, ensure_ascii=False)
+    if not isinstance(obj, dict):
+        _count("parse_failures")
+        return ParsedReply(None, content, "reply is not a JSON object")
+    name, args = _envelope(obj)
+    if not name:
+        _count("text")
+        return ParsedReply(None, str(obj.get(REPLY_KEY, content)))
+
+    fn = tools.get(name) or {_key(n): f for n, f in tools.items()}.get(_key(name))
+    if fn is None:
+        _count("invalid_calls")
+        return ParsedReply(None, content, f"unknown tool {name}")
+    canonical = next(n for n, f in tools.items() if f is fn)
+    try:
+        kwargs, fixes = coerce_args(fn, args, defaults)
+    except ToolCallError as e:
+        _count("invalid_calls")
+        print(f"[DEBUG] Invalid {canonical} call {args}: {e}")
+        return ParsedReply(None, content, f"{canonical}: {e}")
+    _count("tool_calls")
+    if fixes or canonical != name:
+        _count("repaired_calls")
+        print(f"[DEBUG] Repaired {canonical} call: {', '.join(fixes) or f'name {name}'}")
+    return ParsedReply({"name": canonical, "parameters": kwargs}, "")
+
+# -------------------------------
+# STREAMING
+# -------------------------------
+
+FENCE_RE = re.compile(r"```(?:json)?")
+# Start of a schema-constrained text reply, whose value can be shown while it streams.
+REPLY_START_RE = re.compile(r'\{\s*"' + REPLY_KEY + r'"\s*:\s*"')
+
+class ToolCallStream:
+    """
+    Incremental tool-call scanner for a streamed reply. Every top-level
+    JSON object is validated the moment its closing brace arrives, so a
+    caller can start the tool while the model is still generating; any
+    number of call objects may be interleaved with prose. Braces that turn
+    out not to be JSON ("{x}", ":-{") stay in the prose.
+    """
+
+    def __init__(self, tools: Mapping[str, Callable], defaults: Optional[Mapping[str, Any]] = None):
+        self.tools = tools
+        self.defaults = defaults
+        self.calls: List[Dict[str, Any]] = []
+        self.replies: List[str] = []     # {"reply": ...} objects
+        self.errors: List[str] = []
+        self._prose: List[str] = []
+        self._reply_shown = ""           # partial reply text already handed out by reply_delta
+        self._obj: List[str] = []        # characters of the object being read
+        self._reset()
+        _count("replies")
+
+    def _reset(self) -> None:
+        self._obj = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._expect_key = False  # just after "{": only '"' or "}" can follow in JSON
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        """Consume a chunk; returns the calls completed by it, in order."""
+        done = []
+        text, i = delta, 0
+        while i < len(text):
+            ch = text[i]
+            i += 1
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._obj = [ch]
+                    self._expect_key = True
+                else:
+                    self._prose.append(ch)
+                continue
+            self._obj.append(ch)
+            if self._in_string:
+                if ch == "\n":
+                    # JSON strings cannot hold a raw newline: this brace opened prose.
+                    text, i = self._abandon() + text[i:], 0
+                elif self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._expect_key and not ch.isspace():
+                self._expect_key = False
+                if ch == '"':
+                    self._in_string = True
+                elif ch == "}":
+                    self._close_brace(done)
+                else:
+                    text, i = self._abandon() + text[i:], 0
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+                self._expect_key = True
+            elif ch == "}":
+                self._close_brace(done)
+        return done
+
+    def _close_brace(self, done: List[Dict[str, Any]]) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            text = "".join(self._obj)
+            self._reset()
+            call = self._complete(text)
+            if call:
+                done.append(call)
+
+    def _abandon(self) -> str:
+        """
+        The open object is not JSON: its opening brace becomes prose, and the
+        text after it is returned to be scanned again, so later calls still count.
+        """
+        text = "".join(self._obj)
+        self._reset()
+        self._prose.append("{")
+        return text[1:]
+
+    def _complete(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            if looks_like_call(text):
+                _count("parse_failures")
+                self.errors.append("a tool call was not valid JSON")
+                print(f"[DEBUG] Unparseable tool call JSON in stream: {text[:200]}")
+            self._prose.append(text)
+            return None
+        if not isinstance(obj, dict) or not (_envelope(obj)[0] or REPLY_KEY in obj):
+            # Some other JSON the model quoted: part of the prose, where it stood.
+            self._prose.append(text)
+            return None
+        parsed = parse_object(obj, self.tools, self.defaults, text)
+        if parsed.call:
+            self.calls.append(parsed.call)
+        elif parsed.error:
+            self.errors.append(parsed.error)
+        else:
+            self.replies.append(parsed.text)
+        return parsed.call
+
+    def partial_reply(self) -> str:
+        """
+        The {"reply": "..."} text received so far, decoded, for structured
+        output where the whole answer is one JSON object. Empty for calls.
+        """
+        if self.replies:
+            return "\n\n".join(self.replies)
+        match = REPLY_START_RE.match("".join(self._obj)) if self._depth else None
+        if not match:
+            return ""
+        body, escaped = "".join(self._obj)[match.end():], False
+        for i, ch in enumerate(body):
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                body = body[:i]
+                break
+        # A chunk can end inside an escape ("\\", "\\u00"): drop it until it completes.
+        for cut in range(6):
+            try:
+                return json.loads('"' + body[:len(body) - cut] + '"')
+            except json.JSONDecodeError:
+                continue
+        return self._reply_shown
+
+    def reply_delta(self) -> str:
+        """partial_reply() text not returned by an earlier call."""
+        text = self.partial_reply()
+        if not text.startswith(self._reply_shown):
+            return ""
+        delta, self._reply_shown = text[len(self._reply_shown):], text
+        return delta
+
+    @property
+    def prose(self) -> str:
+        """Text outside the JSON objects, code fences removed."""
+        return re.sub(r"\n\s*\n+", "\n\n", FENCE_RE.sub("", "".join(self._prose))).strip()
+
+    def close(self) -> ParsedReply:
+        """
+        End of stream: the first call (all of them are in .calls, including
+        any found only now) or the reply text. An object still open at this
+        point was cut off if it looks like a call, and prose otherwise.
+        """
+        if self._depth:
+            text, prose_len, calls = "".join(self._obj), len(self._prose), len(self.calls)
+            while self._depth:
+                self.feed(self._abandon())
+            if len(self.calls) == calls and looks_like_call(text):
+                del self._prose[prose_len:]
+                _count("parse_failures")
+                self.errors.append("the tool call was cut off")
+        if not (self.calls or self.replies or self.errors):
+            _count("text")
+        text = "\n\n".join(filter(None, [self.prose, *self.replies]))
+        error = None if self.calls or text else (self.errors[0] if self.errors else None)
+        return ParsedReply(self.calls[0] if self.calls else None, text, error)
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        replies = _counters["replies"]
+        failed = _counters["parse_failures"] + _counters["invalid_calls"]
+        return {**_counters, "failure_rate": round(failed / replies, 3) if replies else 0.0}
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple
+
+from context_window import collapse, count_tokens
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Prompt tokens one tool result may take when it is fed back to the LLM.
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "400"))
+TOOL_TOKEN_BUDGETS = {
+    "flights_finder": int(os.getenv("FLIGHTS_TOKEN_BUDGET", "500")),
+    "hotels_finder": int(os.getenv("HOTELS_TOKEN_BUDGET", "500")),
+    "flexible_flights_finder": int(os.getenv("FLEXIBLE_FLIGHTS_TOKEN_BUDGET", "600")),
+}
+MAX_AMENITIES = 8
+
+
+class Projection(NamedTuple):
+    content: str           # what the LLM sees
+    payload: Any           # the untouched tool result, for the UI
+    tokens_before: int
+    tokens_after: int
+
+
+def _compact(value: Any) -> Any:
+    """Drop empty fields, so missing data costs no tokens."""
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [_compact(v) for v in value]
+    return value
+
+def project_flight(flight: Dict[str, Any]) -> Dict[str, Any]:
+    """What it costs, how long it takes, and what a booking needs (airline, flight number, times)."""
+    legs = flight.get("flights", [])
+    return {
+        "price": flight.get("price"),
+        "total_duration": flight.get("total_duration"),
+        "stops": max(len(legs) - 1, 0),
+        "legs": [
+            {
+                "airline": leg.get("airline"),
+                "flight_number": leg.get("flight_number"),
+                "from": leg.get("departure_airport", {}).get("id"),
+                "departs": leg.get("departure_airport", {}).get("time"),
+                "to": leg.get("arrival_airport", {}).get("id"),
+                "arrives": leg.get("arrival_airport", {}).get("time"),
+                "duration": leg.get("duration"),
+            }
+            for leg in legs
+        ],
+        "layovers": [
+            {"id": stop.get("id"), "duration": stop.get("duration"), "overnight": stop.get("overnight")}
+            for stop in flight.get("layovers", [])
+        ],
+    }
+
+def project_hotel(hotel: Dict[str, Any]) -> Dict[str, Any]:
+    """Price, rating and the main amenities; images, links and nearby-place transit are UI-only."""
+    return {
+        "name": hotel.get("name"),
+        "type": hotel.get("type"),
+        "hotel_class": hotel.get("extracted_hotel_class") or hotel.get("hotel_class"),
+        "rate_per_night": (hotel.get("rate_per_night") or {}).get("lowest"),
+        "total_rate": (hotel.get("total_rate") or {}).get("lowest"),
+        "overall_rating": hotel.get("overall_rating"),
+        "reviews": hotel.get("reviews"),
+        "location_rating": hotel.get("location_rating"),
+        "check_in_time": hotel.get("check_in_time"),
+        "check_out_time": hotel.get("check_out_time"),
+        "amenities": (hotel.get("amenities") or [])[:MAX_AMENITIES],
+        "essential_info": hotel.get("essential_info"),
+    }
+
+def project_flexible(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Cheapest date, then the price per date, then the top picks (dropped first when over budget)."""
+    return [
+        {"cheapest_date": result.get("cheapest_date")},
+        *result.get("price_by_date", []),
+        *({"date": pick.get("date"), **project_flight(pick)} for pick in result.get("top_picks", [])),
+    ]
+
+# tool name -> per-item projector, for tools that return a list of results
+PROJECTORS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "flights_finder": project_flight,
+    "hotels_finder": project_hotel,
+}
+# tool name -> projector of a whole dict result into rendered rows
+PAYLOAD_PROJECTORS: Dict[str, Callable[[Dict[str, Any]], List[Dict[str, Any]]]] = {
+    "flexible_flights_finder": project_flexible,
+}
+# Fields given up, in this order, before whole results are dropped.
+TRIM_ORDER: Dict[str, List[str]] = {
+    "flights_finder": ["layovers"],
+    "flexible_flights_finder": ["layovers", "fastest_duration"],
+    "hotels_finder": ["essential_info", "amenities", "check_in_time", "check_out_time", "location_rating"],
+}
+
+
+def _render(items: List[Any]) -> str:
+    # One result per line, so collapse() drops whole results from the end.
+    return "\n".join(json.dumps(item, ensure_ascii=False, separators=(",", ":")) for item in items)
+
+def budget_for(tool: str) -> int:
+    return TOOL_TOKEN_BUDGETS.get(tool, TOOL_RESULT_TOKEN_BUDGET)
+
+def project(tool: str, result: Any, budget: int = 0) -> Projection:
+    """
+    Render `result` for the LLM within `budget` tokens (the tool's default
+    when 0): known tools keep only decision-relevant fields, then shed
+    optional fields, then trailing results. Anything else is JSON, collapsed.
+    """
+    budget = budget or budget_for(tool)
+    raw = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+    before = count_tokens(raw)
+
+    projector = PROJECTORS.get(tool)
+    payload_projector = PAYLOAD_PROJECTORS.get(tool)
+    items = None
+    if projector and isinstance(result, list):
+        items = [_compact(projector(item) if isinstance(item, dict) and "error" not in item else item) for item in result]
+    elif payload_projector and isinstance(result, dict) and "error" not in result:
+        items = [_compact(row) for row in payload_projector(result)]
+    if items is not None:
+        text = _render(items)
+        for field in TRIM_ORDER.get(tool, []):
+            if count_tokens(text) <= budget:
+                break
+            items = [{k: v for k, v in item.items() if k != field} if isinstance(item, dict) else item for item in items]
+            text = _render(items)
+    else:
+        text = raw
+    text = collapse(text, budget)
+
+    projection = Projection(text, result, before, count_tokens(text))
+    _record(tool, projection)
+    print(f"[DEBUG] {tool} result for LLM: {projection.tokens_before} -> {projection.tokens_after} tokens")
+    return projection
+
+# -------------------------------
+# STATS
+# -------------------------------
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+def _record(tool: str, projection: Projection) -> None:
+    with _lock:
+        s = _stats.setdefault(tool, {"calls": 0, "tokens_before": 0, "tokens_after": 0})
+        s["calls"] += 1
+        s["tokens_before"] += projection.tokens_before
+        s["tokens_after"] += projection.tokens_after
+
+def stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        return {tool: dict(s) for tool, s in _stats.items()}
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, List, Mapping
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
+# Seconds one tool call may take before the graph moves on without it.
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+
+def _invoke(tools: Mapping[str, Any], call: Dict[str, Any]) -> Any:
+    fn = tools.get(call["name"])
+    return fn.invoke(call["args"]) if fn else {"error": f"unknown tool {call['name']}"}
+
+def run_tool_calls(
+    calls: List[Dict[str, Any]],
+    tools: Mapping[str, Any],
+    timeout: float = TOOL_CALL_TIMEOUT,
+) -> List[Any]:
+    """
+    Invoke every tool call of one AIMessage concurrently and return the
+    results in the same order as `calls`.
+
+    A call that raises or runs past `timeout` yields an {"error": ...} result
+    instead of failing the turn. A timed-out call keeps its worker thread
+    until it returns; it just no longer holds up the graph.
+    """
+    start = time.monotonic()
+    futures = [_executor.submit(_invoke, tools, call) for call in calls]
+    return [
+        wait_for(call["name"], future, timeout, start)
+        for call, future in zip(calls, futures)
+    ]
+
+def submit(fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+    """Start a plain function call on the tool pool, e.g. as soon as a streamed tool call is parsed."""
+    return _executor.submit(fn, *args, **kwargs)
+
+def wait_for(name: str, future: Future, timeout: float = TOOL_CALL_TIMEOUT, start: float = 0.0) -> Any:
+    """
+    The result of a submitted call, or an {"error": ...} result if it
+    raised or did not finish within `timeout` of `start` (default: now).
+    """
+    remaining = max(0.0, timeout - (time.monotonic() - start)) if start else timeout
+    try:
+        return future.result(timeout=remaining)
+    except FuturesTimeout:
+        future.cancel()
+        print(f"Tool {name} timed out after {timeout}s")
+        return {"error": f"{name} timed out after {timeout}s"}
+    except Exception as e:
+        print(f"Tool {name} failed: {e}")
+        return {"error": str(e)}
+
+async def arun_tool_calls(
+    calls: List[Dict[str, Any]],
+    tools: Mapping[str, Any],
+    timeout: float = TOOL_CALL_TIMEOUT,
+) -> List[Any]:
+    """asyncio counterpart of run_tool_calls, using each tool's ainvoke."""
+
+    async def _run(call):
+        fn = tools.get(call["name"])
+        if not fn:
+            return {"error": f"unknown tool {call['name']}"}
+        try:
+            return await asyncio.wait_for(fn.ainvoke(call["args"]), timeout)
+        except asyncio.TimeoutError:
+            print(f"Tool {call['name']} timed out after {timeout}s")
+            return {"error": f"{call['name']} timed out after {timeout}s"}
+        except Exception as e:
+            print(f"Tool {call['name']} failed: {e}")
+            return {"error": str(e)}
+
+    return await asyncio.gather(*(_run(call) for call in calls))
@@ -1,31 +1,47 @@
 from __future__ import annotations
+import asyncio
+import sys
 import jwt
 import websocket
+import websockets
 import threading
 import json
+import uuid
 import time
-import os, json, re, requests
+import os, json, re
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional, TypedDict
 from langchain_core.tools import tool
-from functools import lru_cache
 
 from pydantic import BaseModel, Field
 from langchain_core.messages import (
     HumanMessage,
     AIMessage,
+    AIMessageChunk,
     ToolMessage,
 )
 from langgraph.graph import StateGraph, END, START
-from langgraph.prebuilt import ToolNode, tools_condition 
+from langchain_core.runnables import RunnableLambda
 
 from langchain_ibm import ChatWatsonx
 from ibm_watson_machine_learning.metanames import GenTextParamsMetaNames as GenParams
 from dotenv import load_dotenv
-import pymongo
+import mongo_pool
+import search_cache
+import city_index
+import http_client
+import cassette
+import tool_runner
+import flex_search
+import metro_airports
+import tool_projection
+import semantic_cache
+from streaming import ReplyStream, STREAM_REPLIES
+from intent_router import IntentRouter
 from bson import ObjectId
 from datetime import datetime,UTC
 load_dotenv()
+cassette.install()  # no-op unless CASSETTE_MODE is set
 
 
 credentials = {
@@ -47,8 +63,8 @@ SERPER_API_KEY = os.getenv("APIKEY")
 SERPER_ENDPOINT = os.getenv("APIENDPOINT")
 
 class FlightsInput(BaseModel):
-    departure_airport: str = Field(description="IATA code (e.g. BLR)")
-    arrival_airport:   str = Field(description="IATA code (e.g. BOM)")
+    departure_airport: str = Field(description="IATA airport or metro code (e.g. BLR, LON)")
+    arrival_airport:   str = Field(description="IATA airport or metro code (e.g. BOM, NYC)")
     outbound_date:     str = Field(description="'YYYY-MM-DD', 'today', or 'tomorrow'")
     return_date: Optional[str] = None
     adults:      Optional[int] = 1
@@ -61,19 +77,24 @@ class HotelsInput(BaseModel):
     adults: Optional[int] = 1
     rooms:  Optional[int] = 1
 
+def _fetch_serpapi(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return http_client.get_json(SERPER_ENDPOINT, endpoint="serpapi", params=payload)
+
 def _call_serpapi(payload: Dict[str, Any]) -> Dict[str, Any]:
-    r = requests.get(SERPER_ENDPOINT, params=payload, timeout=20)
-    r.raise_for_status()
-    return r.json()
+    return search_cache.get_or_fetch(payload, _fetch_serpapi)
+
+async def _afetch_serpapi(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return await http_client.aget_json(SERPER_ENDPOINT, endpoint="serpapi", params=payload)
+
+async def _acall_serpapi(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return await search_cache.aget_or_fetch(payload, _afetch_serpapi)
 
 CITIES_JSON = "cities.json"        
 
-@lru_cache(maxsize=1)
-def _load_cities() -> dict[str, str]:
-    """Load once and memoise."""
+def _city_index() -> city_index.CityIndex:
+    """Built once and memoised by city_index.get_index."""
     try:
-        with open(CITIES_JSON, "r", encoding="utf-8") as f:
-            return {k.title(): v for k, v in json.load(f).items()}
+        return city_index.get_index(CITIES_JSON)
     except FileNotFoundError:
         raise RuntimeError(f"{CITIES_JSON} not found")
     except json.JSONDecodeError as e:
@@ -81,19 +102,25 @@ def _load_cities() -> dict[str, str]:
 
 def get_city_acronym(city_name: str) -> str:
     """
-    Return IATA code for a given city name (case-insensitive).
-    Example: 'Bengaluru' -> 'BLR'
+    Return IATA code for a given city name, alias or near-miss spelling.
+    Example: 'Bengaluru', 'Bangalore', 'bengalure' -> 'BLR'
+    Cities with several airports give the metro code: 'London' -> 'LON'.
     """
-    return _load_cities().get(city_name.title(), "UNK")
+    return metro_airports.resolve(_city_index(), city_name)
 
 @tool
 def city_code(city_name: str) -> str:
     """
     Look up the 3-letter airport code (IATA) for a city name.
-    If the city is unknown, returns 'UNK'.
+    Cities with several airports return a metro code (London -> 'LON')
+    that flight searches expand to every airport. If the city is unknown,
+    returns 'UNK'.
     """
     return get_city_acronym(city_name)
 
+async def acity_code(city_name: str) -> str:
+    return get_city_acronym(city_name)
+
 @tool
 def get_user_flight_bookings(user_id: str) -> list[dict]:
     """
@@ -101,9 +128,7 @@ def get_user_flight_bookings(user_id: str) -> list[dict]:
     """
     print(user_id)
     try:
-        import pymongo
-        client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-        db = client["test"]
+        db = mongo_pool.get_db()
         user_obj_id = ObjectId(user_id)
         bookings = list(db.flightbookings.find({"user": user_obj_id}))
         print("Bookings found:", bookings)
@@ -113,26 +138,30 @@ def get_user_flight_bookings(user_id: str) -> list[dict]:
         print(f"Error in get_user_flight_bookings: {e}")
         return [{"error": str(e)}]
 
-@tool
-def flights_finder(
+async def aget_user_flight_bookings(user_id: str) -> list[dict]:
+    try:
+        db = mongo_pool.get_async_db()
+        bookings = await db.flightbookings.find({"user": ObjectId(user_id)}).to_list(None)
+        serialized_bookings = [serialize_booking(b) for b in bookings]
+        return serialized_bookings if serialized_bookings else [{"message": "No bookings found"}]
+    except Exception as e:
+        print(f"Error in aget_user_flight_bookings: {e}")
+        return [{"error": str(e)}]
+
+def _flights_payload(
     departure_airport: str,
     arrival_airport: str,
     outbound_date: str,
-    return_date: Optional[str] = None,
-    adults: int = 1,
-) -> List[Dict[str, Any]]:
-    """
-    Look up flights (Google Flights via SerpAPI).
-
-    outbound_date may be 'YYYY-MM-DD', 'today', or 'tomorrow'.
-    """
+    return_date: Optional[str],
+    adults: int,
+) -> Dict[str, Any]:
     if outbound_date in {"today", "tomorrow"}:
         delta = 0 if outbound_date == "today" else 1
         outbound_date = (
             datetime.now() + timedelta(days=delta)
         ).strftime("%Y-%m-%d")
 
-    payload = {
+    return {
         "api_key": SERPER_API_KEY,
         "engine": "google_flights",
         "departure_id": departure_airport,
@@ -143,13 +172,109 @@ def flights_finder(
         "currency":      "USD",
         "type": "2" if return_date is None else "3",
     }
+
+def _search_flights(
+    departure_airport: str,
+    arrival_airport: str,
+    outbound_date: str,
+    return_date: Optional[str],
+    adults: int,
+    max_searches: int = metro_airports.METRO_MAX_SEARCHES,
+) -> List[Dict[str, Any]]:
+    """best_flights (top 5) over every airport pair of the two codes; raises on errors."""
+    def search(dep: str, arr: str) -> List[Dict[str, Any]]:
+        payload = _flights_payload(dep, arr, outbound_date, return_date, adults)
+        return _call_serpapi(payload).get("best_flights", [])[:5]
+
+    return metro_airports.search_pairs(search, departure_airport, arrival_airport, max_searches)
+
+async def _asearch_flights(
+    departure_airport: str,
+    arrival_airport: str,
+    outbound_date: str,
+    return_date: Optional[str],
+    adults: int,
+    max_searches: int = metro_airports.METRO_MAX_SEARCHES,
+) -> List[Dict[str, Any]]:
+    async def search(dep: str, arr: str) -> List[Dict[str, Any]]:
+        payload = _flights_payload(dep, arr, outbound_date, return_date, adults)
+        return (await _acall_serpapi(payload)).get("best_flights", [])[:5]
+
+    return await metro_airports.asearch_pairs(search, departure_airport, arrival_airport, max_searches)
+
+@tool
+def flights_finder(
+    departure_airport: str,
+    arrival_airport: str,
+    outbound_date: str,
+    return_date: Optional[str] = None,
+    adults: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Look up flights (Google Flights via SerpAPI).
+
+    outbound_date may be 'YYYY-MM-DD', 'today', or 'tomorrow'. Metro codes
+    (LON, NYC, TYO) search every airport pair at once.
+    """
     try:
-        r = requests.get(SERPER_ENDPOINT, params=payload, timeout=20)
-        r.raise_for_status()
-        return r.json().get("best_flights", [])[:5]
+        return _search_flights(departure_airport, arrival_airport, outbound_date, return_date, adults)
     except Exception as e:
         return [{"error": str(e)}]
 
+async def aflights_finder(
+    departure_airport: str,
+    arrival_airport: str,
+    outbound_date: str,
+    return_date: Optional[str] = None,
+    adults: int = 1,
+) -> List[Dict[str, Any]]:
+    try:
+        return await _asearch_flights(departure_airport, arrival_airport, outbound_date, return_date, adults)
+    except Exception as e:
+        return [{"error": str(e)}]
+
+@tool
+def flexible_flights_finder(
+    departure_airport: str,
+    arrival_airport: str,
+    start_date: str,
+    end_date: Optional[str] = None,
+    adults: int = 1,
+) -> Dict[str, Any]:
+    """
+    Cheapest one-way flights over a range of dates ("next week"): a price
+    for every date plus the best options overall.
+
+    start_date/end_date may be 'YYYY-MM-DD', 'today', or 'tomorrow';
+    without end_date the week from start_date is searched.
+    """
+    def search(date: str) -> List[Dict[str, Any]]:
+        return _search_flights(departure_airport, arrival_airport, date, None, adults, per_date)
+
+    try:
+        dates = flex_search.date_window(start_date, end_date)
+        per_date = flex_search.searches_per_date(dates)
+        return flex_search.search_dates(search, dates)
+    except Exception as e:
+        return {"error": str(e)}
+
+async def aflexible_flights_finder(
+    departure_airport: str,
+    arrival_airport: str,
+    start_date: str,
+    end_date: Optional[str] = None,
+    adults: int = 1,
+) -> Dict[str, Any]:
+    async def search(date: str) -> List[Dict[str, Any]]:
+        return await _asearch_flights(departure_airport, arrival_airport, date, None, adults, per_date)
+
+    try:
+        dates = flex_search.date_window(start_date, end_date)
+        per_date = flex_search.searches_per_date(dates)
+        return await flex_search.asearch_dates(search, dates)
+    except Exception as e:
+        return {"error": str(e)}
+
 def serialize_booking(booking):
     serialized = {}
     for key, value in booking.items():
@@ -177,13 +302,10 @@ def create_flight_booking(
     Save a new flight booking into the MongoDB database.
     """
     try:
-        import pymongo
-        from bson import ObjectId
         journey_date = datetime.strptime(dateOfJourney, "%Y-%m-%d")
         if journey_date.date() < datetime.now(UTC).date():
             raise ValueError("Date of journey cannot be in the past.")
-        client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-        db = client["test"]
+        db = mongo_pool.get_db()
 
         booking_doc = {
             "user": ObjectId(user_id),
@@ -205,6 +327,42 @@ def create_flight_booking(
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
 
+async def acreate_flight_booking(
+    user_id: str,
+    name: str,
+    from_city: str,
+    to_city: str,
+    airline: str,
+    flightno: str,
+    dateOfJourney: str,
+    totalPrice: float,
+    numberOfTickets: Optional[int] = None,
+) -> Dict[str, Any]:
+    try:
+        journey_date = datetime.strptime(dateOfJourney, "%Y-%m-%d")
+        if journey_date.date() < datetime.now(UTC).date():
+            raise ValueError("Date of journey cannot be in the past.")
+        db = mongo_pool.get_async_db()
+        booking_doc = {
+            "user": ObjectId(user_id),
+            "name": name,
+            "from": from_city,
+            "to": to_city,
+            "airline": airline,
+            "flightno": flightno,
+            "dateOfJourney": journey_date,
+            "totalPrice": totalPrice,
+            "bookedAt": datetime.utcnow(),
+        }
+        result = await db.flightbookings.insert_one(booking_doc)
+        return {"message": "Booking confirmed", "bookingId": str(result.inserted_id)}
+    except ValueError as ve:
+        return {"error": f"Validation error: {str(ve)}"}
+    except EnvironmentError as ee:
+        return {"error": f"Configuration error: {str(ee)}"}
+    except Exception as e:
+        return {"error": f"Unexpected error: {str(e)}"}
+
 @tool
 def hotels_finder(
     q: str,
@@ -216,7 +374,27 @@ def hotels_finder(
     """
     Look up hotels (Google Hotels via SerpAPI).
     """
-    payload = {
+    payload = _hotels_payload(q, check_in_date, check_out_date, adults, rooms)
+    try:
+        return _call_serpapi(payload).get("properties", [])[:5]
+    except Exception as e:
+        return [{"error": str(e)}]
+
+async def ahotels_finder(
+    q: str,
+    check_in_date: str,
+    check_out_date: str,
+    adults: int = 1,
+    rooms: int = 1,
+) -> List[Dict[str, Any]]:
+    payload = _hotels_payload(q, check_in_date, check_out_date, adults, rooms)
+    try:
+        return (await _acall_serpapi(payload)).get("properties", [])[:5]
+    except Exception as e:
+        return [{"error": str(e)}]
+
+def _hotels_payload(q: str, check_in_date: str, check_out_date: str, adults: int, rooms: int) -> Dict[str, Any]:
+    return {
         "api_key": SERPER_API_KEY,
         "engine": "google_hotels",
         "q": q,
@@ -226,15 +404,18 @@ def hotels_finder(
         "rooms":  rooms,
         "currency": "INR",
     }
-    try:
-        r = requests.get(SERPER_ENDPOINT, params=payload, timeout=20)
-        r.raise_for_status()
-        return r.json().get("properties", [])[:5]
-    except Exception as e:
-        return [{"error": str(e)}]
 
 
-TOOLS = {t.name: t for t in (flights_finder, hotels_finder , city_code, get_user_flight_bookings, create_flight_booking)}
+TOOLS = {t.name: t for t in (flights_finder, flexible_flights_finder, hotels_finder , city_code, get_user_flight_bookings, create_flight_booking)}
+
+# Native coroutines for assistant.ainvoke, so the async runtime never parks a
+# thread on SerpAPI or Mongo.
+flights_finder.coroutine = aflights_finder
+flexible_flights_finder.coroutine = aflexible_flights_finder
+hotels_finder.coroutine = ahotels_finder
+city_code.coroutine = acity_code
+get_user_flight_bookings.coroutine = aget_user_flight_bookings
+create_flight_booking.coroutine = acreate_flight_booking
 llm_with_tools = llm.bind_tools(list(TOOLS.values())) 
 
 from langchain_core.messages import SystemMessage
@@ -243,8 +424,10 @@ SYSTEM_MSG = SystemMessage(
     content=(
         "You are a travel assistant. "
         "• If the user gives city names, first call the city_code tool to get the IATA codes, "
-        "  then pass those codes to flights_finder.\n"
+        "  then pass those codes to flights_finder. Metro codes such as LON or NYC cover every airport in the city.\n"
         "• If the user already provides 3‑letter codes, skip city_code.\n"
+        "• If the user gives a range of dates or asks for the cheapest day (e.g. 'next week'), "
+        "  call flexible_flights_finder once with start_date/end_date instead of flights_finder per day.\n"
         "• For hotel queries use hotels_finder.\n"
         "• If the user wants to book a flight, call the `create_flight_booking` tool with all booking details.\n"
         "• Each user message includes the user ID in this format: [user_id:<user_id>] at the start of the message.\n"
@@ -266,40 +449,60 @@ def chat(state: GState) -> GState:
     Call Granite WITH tools already bound, so the model can decide to
     emit `tool_calls` in its AIMessage.
     """
+    start = time.perf_counter()
     ai = llm_with_tools.invoke(state["messages"])       # <-- CHANGED
+    router.record_llm_latency(time.perf_counter() - start)
     return {"messages": state["messages"] + [ai]}
 
+async def achat(state: GState) -> GState:
+    start = time.perf_counter()
+    ai = await llm_with_tools.ainvoke(state["messages"])
+    router.record_llm_latency(time.perf_counter() - start)
+    return {"messages": state["messages"] + [ai]}
 
-def run_tools(state: GState) -> GState:
-    msgs   = state["messages"]
-    ai_msg = msgs[-1]
-    new    = msgs.copy()
-
-    for call in ai_msg.tool_calls or []:
-        name = call["name"]
-        args = call["args"]
-        call_id = call["id"]
-
-        if name == "get_user_flight_bookings" and "user_id" not in args:
-            args["user_id"] = current_user_id
 
-        fn = TOOLS.get(name)
-        result = fn.invoke(args) if fn else {"error": f"unknown tool {name}"}
+def _pending_calls(ai_msg: AIMessage) -> List[Dict[str, Any]]:
+    calls = ai_msg.tool_calls or []
+    for call in calls:
+        if call["name"] == "get_user_flight_bookings" and "user_id" not in call["args"]:
+            call["args"]["user_id"] = current_user_id
+    return calls
 
+def _with_tool_messages(msgs, calls, results) -> GState:
+    new = msgs.copy()
+    # results line up with calls, so ToolMessages keep the model's tool_call order
+    for call, result in zip(calls, results):
+        # The LLM gets a token-budgeted projection; the full result rides along as the artifact.
+        projection = tool_projection.project(call["name"], result)
         new.append(
             ToolMessage(
-                name=name,
-                tool_call_id=call_id,   # ← REQUIRED FIELD
-                content=json.dumps(result, ensure_ascii=False)
+                name=call["name"],
+                tool_call_id=call["id"],   # ← REQUIRED FIELD
+                content=projection.content,
+                artifact=result,
             )
         )
-
     return {"messages": new}
 
+def run_tools(state: GState) -> GState:
+    msgs  = state["messages"]
+    calls = _pending_calls(msgs[-1])
+    # Independent calls ("flights BLR→BOM and hotels in Mumbai") run side by side.
+    results = tool_runner.run_tool_calls(calls, TOOLS)
+    return _with_tool_messages(msgs, calls, results)
+
+async def arun_tools(state: GState) -> GState:
+    msgs  = state["messages"]
+    calls = _pending_calls(msgs[-1])
+    results = await tool_runner.arun_tool_calls(calls, TOOLS)
+    return _with_tool_messages(msgs, calls, results)
+
 graph = StateGraph(GState)
 
-graph.add_node("chat",  chat)
-graph.add_node("tools", run_tools)
+# Each node carries a sync and an async body: assistant.invoke runs the first,
+# assistant.ainvoke the second.
+graph.add_node("chat",  RunnableLambda(chat, afunc=achat))
+graph.add_node("tools", RunnableLambda(run_tools, afunc=arun_tools))
 
 # branching: does last AI message contain tool_calls?
 def needs_tool(state: GState) -> str:
@@ -313,7 +516,14 @@ graph.add_conditional_edges(
 )
 
 graph.add_edge("tools", "chat")    
-graph.set_entry_point("chat")        
+
+# A pre-routed state already ends in an AIMessage with tool_calls, so it
+# starts at the tools node and the first LLM round trip never happens.
+graph.add_conditional_edges(
+    START,
+    needs_tool,
+    {"need_tool": "tools", "done": "chat"},
+)
 
 assistant = graph.compile()
 
@@ -333,32 +543,95 @@ token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 print("Generated token:", token)
 
+# Upper bound on conversations the async runtime keeps in flight at once.
+MAX_ASYNC_CONVERSATIONS = int(os.getenv("TRAVELBOT_MAX_CONVERSATIONS", "200"))
+
+router = IntentRouter(resolve_city=get_city_acronym)
+
+def initial_state_for(data: Dict[str, Any]) -> GState:
+    messages = [
+        SYSTEM_MSG,
+        HumanMessage(content=f"[user_id:{data['sender']}] {data['text']}")
+    ]
+    route = router.route(data["text"], user_id=data["sender"])
+    if route:
+        print(f"Router hit ({route.rule}): {route.tool} {route.args} | {router.stats()}")
+        messages.append(AIMessage(
+            content="",
+            tool_calls=[{"name": route.tool, "args": route.args, "id": f"router-{uuid.uuid4().hex[:12]}"}],
+        ))
+    return {"messages": messages}
+
+def reply_frame(data: Dict[str, Any], text: str, stream: Optional[ReplyStream] = None) -> Dict[str, Any]:
+    response = {
+        "sender": USER_ID,
+        "recipient": data["sender"],
+        "text": text,
+        "_id": "temp-id-" + str(time.time())
+    }
+    # Echo 'type' back when the incoming message had one
+    if "type" in data:
+        response["type"] = data["type"]
+    if stream is not None:
+        # Same stream_id as the partials, so the client swaps them for this
+        response["stream_id"] = stream.stream_id
+    return response
+
+def remember_reply(data: Dict[str, Any], out: GState) -> None:
+    """
+    Offer a finished answer to the semantic cache, tagged with the tools it
+    used. Scoped to the sender: the prompt carries their user ID, so even a
+    tool-less answer ("what is my user ID") can be theirs alone.
+    """
+    tools_used = [m.name for m in out["messages"] if isinstance(m, ToolMessage)]
+    semantic_cache.store(data["text"], out["messages"][-1].content, tools_used, scope=data["sender"])
+
+STREAM_MODES = ["messages", "values"]
+
+def stream_event(stream: ReplyStream, chunk, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Turn one LangGraph "messages" event into a partial frame (or None).
+    Only tokens from the chat node count; a turn that starts emitting
+    tool_call_chunks is a tool call and stays hidden.
+    """
+    if metadata.get("langgraph_node") != "chat" or not isinstance(chunk, AIMessageChunk):
+        return None
+    stream.start_turn(metadata.get("langgraph_step"))
+    if chunk.tool_call_chunks:
+        stream.hold()
+    if not isinstance(chunk.content, str) or not chunk.content:
+        return None
+    return stream.feed(chunk.content)
+
 def on_message(ws, message):
     print("Received:", message)
 
     try:
         data = json.loads(message)  # parse the JSON string
 
-        # Check if this message has a 'type' field
-        has_type = "type" in data
-
         if 'sender' in data and 'recipient' in data and 'text' in data:
-            initial_state = {
-                "messages": [
-                    SYSTEM_MSG,
-                    HumanMessage(content=f"[user_id:{data['sender']}] {data['text']}")
-                ],
-            }
-            out = assistant.invoke(initial_state)
-
-            response = {
-                "sender": USER_ID,
-                "recipient": data["sender"],
-                "text": out["messages"][-1].content,
-                "_id": "temp-id-" + str(time.time())
-            }
-            if has_type:
-                response["type"] = data["type"]
+            hit = semantic_cache.lookup(data["text"], scope=data["sender"])
+            if hit:
+                response = reply_frame(data, hit.answer)
+                ws.send(json.dumps(response))
+                print("Replied from cache", response)
+                return
+
+            if STREAM_REPLIES:
+                stream = ReplyStream(USER_ID, data["sender"])
+                for mode, payload in assistant.stream(initial_state_for(data), stream_mode=STREAM_MODES):
+                    if mode == "values":
+                        out = payload
+                        continue
+                    frame = stream_event(stream, *payload)
+                    if frame:
+                        ws.send(json.dumps(frame))
+            else:
+                stream = None
+                out = assistant.invoke(initial_state_for(data))
+
+            remember_reply(data, out)
+            response = reply_frame(data, out["messages"][-1].content, stream)
 
             ws.send(json.dumps(response))
             print("Replied with message",response)
@@ -398,6 +671,75 @@ def connect_ws():
         print("Disconnected. Reconnecting in 1 second...")
         time.sleep(1)  # Wait before reconnecting
 
+async def ahandle_message(ws, message, slots: asyncio.Semaphore):
+    print("Received:", message)
+
+    try:
+        data = json.loads(message)
+
+        if 'sender' in data and 'recipient' in data and 'text' in data:
+            hit = semantic_cache.lookup(data["text"], scope=data["sender"])
+            if hit:
+                response = reply_frame(data, hit.answer)
+                await ws.send(json.dumps(response))
+                print("Replied from cache", response)
+                return
+
+            async with slots:
+                if STREAM_REPLIES:
+                    stream = ReplyStream(USER_ID, data["sender"])
+                    async for mode, payload in assistant.astream(initial_state_for(data), stream_mode=STREAM_MODES):
+                        if mode == "values":
+                            out = payload
+                            continue
+                        frame = stream_event(stream, *payload)
+                        if frame:
+                            await ws.send(json.dumps(frame))
+                else:
+                    stream = None
+                    out = await assistant.ainvoke(initial_state_for(data))
+
+            remember_reply(data, out)
+            response = reply_frame(data, out["messages"][-1].content, stream)
+
+            await ws.send(json.dumps(response))
+            print("Replied with message",response)
+        else:
+            print("Message does not contain sender/recipient/text fields, ignoring or handling separately.")
+
+    except Exception as e:
+        print("Error parsing or handling message:", e)
+
+async def connect_ws_async():
+    """
+    asyncio alternative to connect_ws: every conversation is a task on one
+    event loop instead of blocking the websocket-client thread.
+    """
+    slots = asyncio.Semaphore(MAX_ASYNC_CONVERSATIONS)
+    pending: set[asyncio.Task] = set()
+    await mongo_pool.awarm_up()
+    while True:
+        try:
+            async with websockets.connect(
+                "ws://localhost:3000",
+                additional_headers={ "Cookie": f"token={token}" },
+            ) as ws:
+                print("WebSocket connected (async)")
+                async for message in ws:
+                    task = asyncio.create_task(ahandle_message(ws, message, slots))
+                    pending.add(task)  # keep a reference until it finishes
+                    task.add_done_callback(pending.discard)
+
+        except Exception as e:
+            print("WebSocket connection error:", e)
+
+        print("Disconnected. Reconnecting in 1 second...")
+        await asyncio.sleep(1)
+
 if __name__ == "__main__":
-    threading.Thread(target=connect_ws, daemon=True).start()
-    input("Press Enter to quit...\n")
\ No newline at end of file
+    if "--async" in sys.argv:
+        asyncio.run(connect_ws_async())
+    else:
+        mongo_pool.warm_up()
+        threading.Thread(target=connect_ws, daemon=True).start()
+        input("Press Enter to quit...\n")
\ No newline at end of file
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import geocode_cache
+import http_client
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+# Open-Meteo refreshes current conditions every 15 minutes; asking again
+# inside the same window returns the same numbers.
+WEATHER_UPDATE_INTERVAL = int(os.getenv("WEATHER_UPDATE_INTERVAL", "900"))
+# Coordinates per request; Open-Meteo takes comma-separated lists.
+WEATHER_BATCH_SIZE = int(os.getenv("WEATHER_BATCH_SIZE", "100"))
+# Cities the refresher keeps warm: the most asked-about, up to this many,
+# plus every city in cities.json.
+WEATHER_HOT_CITIES = int(os.getenv("WEATHER_HOT_CITIES", "50"))
+# Seconds after a new window starts before refreshing, so the provider has published it.
+WEATHER_REFRESH_DELAY = int(os.getenv("WEATHER_REFRESH_DELAY", "60"))
+CITIES_JSON = "cities.json"
+
+Coordinates = Tuple[float, float]
+
+
+def bucket(ts: Optional[float] = None) -> int:
+    """Index of the provider update window `ts` falls in."""
+    return int((time.time() if ts is None else ts) // WEATHER_UPDATE_INTERVAL)
+
+def coord_key(lat: float, lon: float) -> Coordinates:
+    # ~1 km: closer than that is the same forecast grid cell anyway.
+    return round(float(lat), 2), round(float(lon), 2)
+
+def fetch_current(coords: Sequence[Coordinates]) -> List[Dict[str, Any]]:
+    """current_weather for every coordinate, WEATHER_BATCH_SIZE per HTTP call, in input order."""
+    results: List[Dict[str, Any]] = []
+    for i in range(0, len(coords), WEATHER_BATCH_SIZE):
+        chunk = coords[i:i + WEATHER_BATCH_SIZE]
+        data = http_client.get_json(
+            OPEN_METEO_URL,
+            endpoint="open_meteo",
+            params={
+                "latitude": ",".join(str(lat) for lat, _ in chunk),
+                "longitude": ",".join(str(lon) for _, lon in chunk),
+                "current_weather": "true",
+            },
+        )
+        # One location comes back as an object, several as a list.
+        locations = data if isinstance(data, list) else [data]
+        if len(locations) != len(chunk):
+            raise Exception(f"Open-Meteo returned {len(locations)} locations for {len(chunk)} coordinates")
+        results.extend(loc.get("current_weather") or {} for loc in locations)
+    return results
+
+
+class WeatherCache:
+    """
+    Current conditions per coordinate, valid until the provider's next
+    update window. Misses for several coordinates are fetched together.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Coordinates, Tuple[int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.popularity: Counter = Counter()
+        self.counters = {"hits": 0, "misses": 0, "requests": 0, "refreshed": 0}
+
+    def current_many(self, coords: Sequence[Coordinates]) -> List[Dict[str, Any]]:
+        keys = [coord_key(lat, lon) for lat, lon in coords]
+        now_bucket = bucket()
+        with self._lock:
+            fresh = {k: e[1] for k in keys if (e := self._entries.get(k)) and e[0] == now_bucket}
+            missing = list(dict.fromkeys(k for k in keys if k not in fresh))
+            self.counters["hits"] += len(keys) - len(missing)
+            self.counters["misses"] += len(missing)
+        if missing:
+            fetched = fetch_current(missing)
+            with self._lock:
+                self.counters["requests"] += -(-len(missing) // WEATHER_BATCH_SIZE)
+                for key, current in zip(missing, fetched):
+                    if current:
+                        self._entries[key] = (now_bucket, current)
+                    fresh[key] = current
+        return [fresh[k] for k in keys]
+
+    def current(self, lat: float, lon: float) -> Dict[str, Any]:
+        return self.current_many([(lat, lon)])[0]
+
+    def record_query(self, city: str) -> None:
+        with self._lock:
+            self.popularity[geocode_cache.cache_key(city)] += 1
+
+    def hot_cities(self, limit: int = WEATHER_HOT_CITIES) -> List[str]:
+        with open(CITIES_JSON, "r", encoding="utf-8") as f:
+            listed = list(json.load(f))
+        with self._lock:
+            asked = [name for name, _ in self.popularity.most_common(limit)]
+        return list(dict.fromkeys(asked + listed))
+
+    def refresh(self) -> int:
+        """
+        Fetch the current window for every hot city whose coordinates are
+        already known, in as few requests as possible. Returns how many.
+        """
+        coords = [c for c in (geocode_cache.peek(city) for city in self.hot_cities()) if c]
+        with self._lock:
+            now_bucket = bucket()
+            stale = [c for c in dict.fromkeys(coord_key(*c) for c in coords)
+                     if self._entries.get(c, (None,))[0] != now_bucket]
+            # Forget windows nobody will read again.
+            for key in [k for k, (b, _) in self._entries.items() if b < now_bucket]:
+                del self._entries[key]
+        if stale:
+            self.current_many(stale)
+            with self._lock:
+                self.counters["refreshed"] += len(stale)
+        return len(stale)
+
+    def run_refresher(self, stop: Optional[threading.Event] = None) -> None:
+        """Refresh shortly after each provider update, forever (or until `stop` is set)."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                count = self.refresh()
+                print(f"[DEBUG] weather cache refreshed {count} locations: {self.stats()}")
+            except Exception as e:
+                print(f"[ERROR] weather refresh failed: {e}")
+            next_window = (bucket() + 1) * WEATHER_UPDATE_INTERVAL + WEATHER_REFRESH_DELAY
+            stop.wait(max(1.0, next_window - time.time()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+WEATHER_CACHE = WeatherCache()
+
+def current(lat: float, lon: float) -> Dict[str, Any]:
+    return WEATHER_CACHE.current(lat, lon)
+
+def current_many(coords: Sequence[Coordinates]) -> List[Dict[str, Any]]:
+    return WEATHER_CACHE.current_many(coords)
+
+def record_query(city: str) -> None:
+    WEATHER_CACHE.record_query(city)
+
+def start_refresher() -> threading.Thread:
+    thread = threading.Thread(target=WEATHER_CACHE.run_refresher, daemon=True, name="weather-refresher")
+    thread.start()
+    return thread
+
+def stats() -> Dict[str, Any]:
+    return WEATHER_CACHE.stats()
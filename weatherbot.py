@@ -7,24 +7,28 @@ from langchain.tools.render import render_text_description_and_args
 from langchain.agents.output_parsers import JSONAgentOutputParser
 from langchain.agents.format_scratchpad import format_log_to_str
 from langchain.agents import AgentExecutor
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.runnables import RunnablePassthrough
 from ibm_watson_machine_learning.metanames import GenTextParamsMetaNames as GenParams
 from langchain_community.tools import WikipediaQueryRun
 from langchain_community.utilities import WikipediaAPIWrapper
 from pydantic import BaseModel, Field
-import requests
-from urllib.parse import quote  # For URL encoding city names
 from langchain.tools import Tool
 import time
 import json
 import threading
 import jwt
 import websocket
+import cassette
+import attractions_index
+import geocode_cache
+import weather_cache
+import semantic_cache
+from session_store import SessionStore
 from langchain_ibm import ChatWatsonx
 from dotenv import load_dotenv
 load_dotenv()
+cassette.install()  # no-op unless CASSETTE_MODE is set
 
 credentials = {
     "url": os.getenv("URL"),
@@ -48,9 +52,32 @@ agent = prompt | llm
 class WikipediaQuerySchema(BaseModel):
     query: str = Field(..., description="The search query for Wikipedia.")
 
+class RecordedWikipediaAPIWrapper(WikipediaAPIWrapper):
+    """The wikipedia package bypasses http_client, so lookups are recorded/replayed here."""
+
+    def run(self, query: str) -> str:
+        request = {"query": query, "top_k": self.top_k_results, "chars": self.doc_content_chars_max}
+        return cassette.CASSETTE.call("wikipedia", request, lambda: WikipediaAPIWrapper.run(self, query))
+
+class IndexedWikipediaAPIWrapper(RecordedWikipediaAPIWrapper):
+    """Answers from the local attractions index; the live Wikipedia API only on a miss."""
+
+    def run(self, query: str) -> str:
+        start = time.perf_counter()
+        try:
+            pages = attractions_index.search(query, limit=self.top_k_results)
+        except Exception as e:  # e.g. index not built yet
+            print(f"[ERROR] Attractions index lookup failed: {e}")
+            pages = []
+        if pages:
+            print(f"[DEBUG] Attractions index hit for '{query}' in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return attractions_index.render(pages, self.doc_content_chars_max)
+        print(f"[DEBUG] Attractions index miss for '{query}', asking Wikipedia")
+        return super().run(query)
+
 class WikipediaTool:
     def get_tool(self):
-        api_wrapper = WikipediaAPIWrapper(top_k_results=4, doc_content_chars_max=100)
+        api_wrapper = IndexedWikipediaAPIWrapper(top_k_results=4, doc_content_chars_max=100)
         tool = WikipediaQueryRun(
             api_wrapper=api_wrapper,
             args_schema=WikipediaQuerySchema,  # Ensure this is a subclass of BaseModel
@@ -60,54 +87,26 @@ class WikipediaTool:
 
 class OpenMeteoTool:
     def get_coordinates(self, city_name):
-        # URL encode the city name to handle spaces and special characters
-        encoded_city_name = quote(city_name)
-
-        geocode_url = f"https://nominatim.openstreetmap.org/search?q={encoded_city_name}&format=json"
-
-        headers = {
-            'User-Agent': 'MyWeatherApp/1.0 (Geocoding and Weather Service)'  # Generic app description
-        }
-
-        response = requests.get(geocode_url, headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-
-            if data:
-                latitude = data[0].get('lat')
-                longitude = data[0].get('lon')
-
-                # Ensure latitude and longitude were found
-                if latitude and longitude:
-                    return latitude, longitude
-                else:
-                    raise ValueError(f"Coordinates not found for '{city_name}'.")
-            else:
-                raise ValueError(f"No data returned for city '{city_name}'.")
-        else:
-            raise Exception(f"Nominatim API returned an error: {response.status_code}")
+        # Persistent cache in front of Nominatim (1 req/s); misses are throttled there.
+        coords = geocode_cache.lookup(city_name)
+        if coords is None:
+            raise ValueError(f"No data returned for city '{city_name}'.")
+        return coords
 
     def get_weather(self, city_name):
         try:
+            weather_cache.record_query(city_name)
             # Fetch coordinates using the get_coordinates method
             lat, lon = self.get_coordinates(city_name)
 
-            # Fetch weather information from Open-Meteo API using the coordinates
-            weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current_weather=true"
-            weather_response = requests.get(weather_url)
+            # Current conditions, shared by every query in the same Open-Meteo update window
+            current_weather = weather_cache.current(lat, lon)
 
-            if weather_response.status_code == 200:
-                weather_data = weather_response.json()
-                current_weather = weather_data.get('current_weather')
-
-                if current_weather:
-                    response = f"Current temperature in {city_name} is {current_weather['temperature']}°C, with wind speed of {current_weather['windspeed']} m/s and it is { 'day' if current_weather['is_day'] == 1 else 'night'} time."
-                    return response
-                else:
-                    raise Exception("Weather data not available.")
+            if current_weather:
+                response = f"Current temperature in {city_name} is {current_weather['temperature']}°C, with wind speed of {current_weather['windspeed']} m/s and it is { 'day' if current_weather['is_day'] == 1 else 'night'} time."
+                return response
             else:
-                raise Exception(f"Open-Meteo API returned an error: {weather_response.status_code}")
+                raise Exception("Weather data not available.")
         except Exception as e:
             return str(e)
 
@@ -171,7 +170,8 @@ prompt = prompt.partial(
     tool_names=", ".join([t.name for t in tools]),
 )
 
-message_history = ChatMessageHistory()
+# One bounded history per sender instead of one shared, ever-growing one.
+sessions = SessionStore()
 
 chain = (
     RunnablePassthrough.assign(
@@ -183,16 +183,42 @@ chain = (
 )
 
 agent_executor_chat = AgentExecutor(
-    agent=chain, tools=tools, handle_parsing_errors=True, verbose=True
+    agent=chain, tools=tools, handle_parsing_errors=True, verbose=True,
+    return_intermediate_steps=True,  # tells the semantic cache which tools an answer used
 )
 
 agent_with_chat_history = RunnableWithMessageHistory(
     agent_executor_chat,
-    get_session_history=lambda session_id: message_history,
+    get_session_history=sessions.get,
     input_messages_key="input",
     history_messages_key="chat_history",
 )
 
+def ask(text: str, session_id: str = "watsonx") -> str:
+    """
+    Answer `text`, from the semantic cache when a close enough question was
+    answered recently, otherwise through the agent. Only the opening question
+    of a session is cached: later ones can lean on the conversation ("and
+    tomorrow?"), which the cache key does not see.
+    """
+    history = sessions.get(session_id)
+    cacheable = not history.messages
+    hit = semantic_cache.lookup(text) if cacheable else None
+    if hit:
+        # Keep the history consistent with what the user saw.
+        history.add_user_message(text)
+        history.add_ai_message(hit.answer)
+        return hit.answer
+
+    out = agent_with_chat_history.invoke(
+        {"input": text},
+        config={"configurable": {"session_id": session_id}}
+    )
+    tools_used = [action.tool for action, _ in out.get("intermediate_steps", [])]
+    if cacheable:
+        semantic_cache.store(text, out["output"], tools_used)
+    return out["output"]
+
 answer1 = agent_with_chat_history.invoke(
         {"input": "How is the weather in New York?"},
         config={"configurable": {"session_id": "watsonx"}}
@@ -234,16 +260,15 @@ def on_message(ws, message):
 
         # If it has sender, recipient, and text (a "chat" message)
         if 'sender' in data and 'recipient' in data and 'text' in data:
-            out = agent_with_chat_history.invoke(
-                {"input": data["text"]},
-                config={"configurable": {"session_id": "watsonx"}}
-            )
+            answer = ask(data["text"], session_id=data["sender"])
+            print("[DEBUG] sessions:", sessions.stats())
+            print("[DEBUG] attractions index:", attractions_index.stats())
 
             # Build the response, optionally include 'type' if present
             response = {
                 "sender": USER_ID,
                 "recipient": data["sender"],
-                "text": out["output"],
+                "text": answer,
                 "_id": "temp-id-" + str(time.time())
             }
             if has_type:
@@ -289,5 +314,9 @@ def connect_ws():
         time.sleep(1)  # Wait before reconnecting
 
 if __name__ == "__main__":
+    # Fills in coordinates for cities.json once; later starts skip cached cities.
+    threading.Thread(target=geocode_cache.seed, daemon=True).start()
+    # Keeps cities.json and the most asked-about cities fresh each update window.
+    weather_cache.start_refresher()
     threading.Thread(target=connect_ws, daemon=True).start()
     input("Press Enter to quit...\n")
\ No newline at end of file